@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# analysiscache.py
+# Cache of sound analyses kept between runs, for logformantsbylabel.py.
+
+# The numpy engine's signal-level work (resampling a sound to 16 kHz and
+# finding its Burg formant candidates) depends only on the contents of the
+# sound file, the part of it analysed and the analysis settings, not on the
+# tracking settings. Its results are kept in a cache directory, so that a
+# later run, a retry, or a rerun with new tracking settings only needs to
+# track the formants again. Each result is stored as a NumPy .npy file named
+# by a SHA-1 hash of the kind of result, a SHA-1 hash of the sound file's
+# contents and the settings, so a file that's renamed or copied is still
+# found, and one whose contents change is never mistaken for the old one.
+# Files are read memory-mapped, so only the frames used are read from disk.
+# When the files come to more than a size limit, the least recently used are
+# removed. Several processes (e.g. the workers of a batch run) can share one
+# cache directory: files are written under a temporary name and then renamed,
+# so a half-written file is never read.
+
+# Requires NumPy (www.numpy.org).
+
+import hashlib
+import os
+import sys
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import corpusmanifest
+
+cache_extension = '.npy'
+
+class AnalysisCache(object):
+
+    # size_limit is in bytes.
+    def __init__(self, directory, size_limit):
+        self.directory = directory
+        self.size_limit = size_limit
+        # Bytes in the cache as far as this process knows: counted when
+        # something is first stored, then kept up to date as it stores more.
+        self.size = None
+        # Contents hashes of sound files, by path, with the size and
+        # modification time they were found for.
+        self.hashes = {}
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        except EnvironmentError:
+            sys.exit('Error: could not create analysis cache directory {0}.'.
+                format(directory))
+
+    # Record the contents hash of a file (e.g. from the corpus manifest), so
+    # that it needn't be read to hash it.
+    def remember_hash(self, file_path, size, modified_time, contents_hash):
+        self.hashes[file_path] = (size, modified_time, contents_hash)
+
+    # SHA-1 hash of a file's contents, only read again once its size or
+    # modification time changes.
+    def contents_hash(self, file_path):
+        stat = os.stat(file_path)
+        known = self.hashes.get(file_path)
+        if known is not None and known[:2] == (stat.st_size, stat.st_mtime):
+            return known[2]
+        contents_hash = corpusmanifest.file_hash(file_path)
+        self.remember_hash(file_path, stat.st_size, stat.st_mtime,
+            contents_hash)
+        return contents_hash
+
+    # Path of the cache file for a kind of result (e.g. 'formants') from a
+    # sound file with the given settings (a tuple).
+    def entry_path(self, kind, file_path, settings):
+        key = '{0}\t{1}\t{2}'.format(kind, self.contents_hash(file_path),
+            '\t'.join(repr(setting) for setting in settings))
+        return os.path.join(self.directory,
+            hashlib.sha1(key.encode('utf-8')).hexdigest() + cache_extension)
+
+    # The cached array for a result, memory-mapped read-only, or None if it
+    # isn't in the cache (or can't be read).
+    def get(self, kind, file_path, settings):
+        try:
+            entry_path = self.entry_path(kind, file_path, settings)
+            if not os.path.isfile(entry_path):
+                return None
+            found = np.load(entry_path, mmap_mode='r')
+            # Mark it as recently used.
+            os.utime(entry_path, None)
+        except (EnvironmentError, ValueError):
+            return None
+        return found
+
+    # Store the array for a result, then make room if the cache has grown
+    # over its size limit. Failing to store it only means it has to be worked
+    # out again next time.
+    def put(self, kind, file_path, settings, array):
+        temporary_path = None
+        try:
+            entry_path = self.entry_path(kind, file_path, settings)
+            handle, temporary_path = tempfile.mkstemp(dir=self.directory,
+                suffix='.tmp')
+            with os.fdopen(handle, 'wb') as fout:
+                np.save(fout, np.ascontiguousarray(array))
+                # Taken before the file is renamed, as another process may
+                # remove it (making room) as soon as it is.
+                entry_size = fout.tell()
+            os.replace(temporary_path, entry_path)
+        except EnvironmentError:
+            if temporary_path is not None and os.path.exists(temporary_path):
+                try:
+                    os.remove(temporary_path)
+                except EnvironmentError:
+                    pass
+            return
+        if self.size is None:
+            self.size = sum(size for path, size, used in self.entries())
+        else:
+            self.size += entry_size
+        if self.size > self.size_limit:
+            self.evict()
+
+    # (path, size, time last used) for each file in the cache.
+    def entries(self):
+        found = []
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(cache_extension):
+                    try:
+                        stat = entry.stat()
+                    except EnvironmentError:
+                        continue
+                    found.append((entry.path, stat.st_size, stat.st_mtime))
+        except EnvironmentError:
+            pass
+        return found
+
+    # Remove the least recently used files until the cache is within its size
+    # limit. Other processes may be adding files too, so the directory is
+    # looked at afresh. Files that can't be removed (e.g. because they're
+    # still memory-mapped, on Windows) are left.
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.size = sum(entry[1] for entry in entries)
+        for path, size, used in entries:
+            if self.size <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+            except EnvironmentError:
+                continue
+            self.size -= size
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# benchmark.py
+# Speed and accuracy benchmark for logformantsbylabel.py.
+
+# Makes a corpus of synthetic vowels with known formant trajectories, with a
+# textgrid for each sound file marking the vowels, laid out as
+# logformantsbylabel.py expects (matching names in one directory). Then
+# measures every vowel the way batch mode does, and reports throughput
+# (intervals per second), latency per interval (measuring each interval on its
+# own, as in interactive mode, with and without an analysis of its sound file
+# to reuse), peak memory of the measuring (in a process of its own), and the
+# error of the measured F1, F2 and F3 against the true values at each tenth
+# point.
+
+# Vowels are made by adding up damped sinusoids at the formant frequencies,
+# one set per glottal pulse, with the formants moving in a straight line from
+# a random start to a random end across each vowel. Between vowels there's
+# only faint noise.
+
+# Requires NumPy (www.numpy.org). Run with -h for options.
+
+import argparse
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import formanttracker
+import logformantsbylabel
+import textgridparser
+
+# Measuring settings, as in settings.cfg for a male speaker.
+benchmark_params = {
+    'f1_reference': '500',
+    'f2_reference': '1485',
+    'f3_reference': '2475',
+    'f4_reference': '3465',
+    'f5_reference': '4455',
+    'frequency_cost': '1',
+    'bandwidth_cost': '1',
+    'transition_cost': '1'
+    }
+
+# Ranges for the start and end of each synthetic formant trajectory (Hz), and
+# the fixed higher formants.
+formant_ranges = [(300, 800), (900, 2200), (2300, 2900)]
+higher_formants = [3500, 4500]
+# Bandwidths (Hz) and relative amplitudes of the five formants.
+formant_bandwidths = [80, 100, 140, 180, 220]
+formant_amplitudes = [1.0, 0.6, 0.35, 0.15, 0.1]
+# Vowel lengths (s), fundamental frequency (Hz) and how long each pulse rings.
+vowel_lengths = (0.08, 0.25)
+fundamental_frequency = (120, 100)
+pulse_length = 0.04
+noise_level = 0.001
+
+interval_label = 'V'
+sound_extension = '.wav'
+textgrid_extension = '.TextGrid'
+
+# Stop with a helpful message if NumPy isn't installed.
+def check_numpy():
+    if np is None:
+        sys.exit('Error: benchmark.py requires NumPy (www.numpy.org), which ' +
+            'could not be imported.')
+
+# Random formant trajectory for one vowel: start and end F1-F3, with each
+# formant kept clear of the one below.
+def random_trajectory(generator):
+    start = []
+    end = []
+    for formant_no, (low, high) in enumerate(formant_ranges):
+        if formant_no > 0:
+            low = max(low, start[-1] + 300, end[-1] + 300)
+        start.append(generator.uniform(low, max(low, high)))
+        end.append(generator.uniform(low, max(low, high)))
+    return start, end
+
+# Formant frequencies at times through a vowel (0 at the start, 1 at the end)
+# for a trajectory, as a times x 3 array.
+def trajectory_at(trajectory, fractions):
+    start, end = (np.array(part) for part in trajectory)
+    return start + np.outer(fractions, end - start)
+
+# Samples of one vowel lasting duration seconds.
+def synthesise_vowel(trajectory, duration, sampling_frequency):
+    samples = np.zeros(int(round(duration * sampling_frequency)))
+    response_times = np.arange(int(pulse_length * sampling_frequency)) / \
+        float(sampling_frequency)
+    bandwidths = np.array(formant_bandwidths)[:, None]
+    amplitudes = np.array(formant_amplitudes)[:, None]
+
+    pulse_time = 0.0
+    while pulse_time < duration:
+        fraction = pulse_time / duration
+        formants = list(trajectory_at(trajectory, [fraction])[0]) + \
+            higher_formants
+        response = (amplitudes *
+            np.exp(-math.pi * bandwidths * response_times) *
+            np.sin(2 * math.pi * np.array(formants)[:, None] *
+            response_times)).sum(axis=0)
+        first = int(round(pulse_time * sampling_frequency))
+        last = min(first + len(response), len(samples))
+        samples[first:last] += response[:last - first]
+        f0 = fundamental_frequency[0] + fraction * \
+            (fundamental_frequency[1] - fundamental_frequency[0])
+        pulse_time += 1.0 / f0
+
+    # Fade in and out over 20 ms.
+    fade = min(int(0.02 * sampling_frequency), len(samples) // 2)
+    ramp = 0.5 - 0.5 * np.cos(np.linspace(0, math.pi, fade))
+    samples[:fade] *= ramp
+    samples[len(samples) - fade:] *= ramp[::-1]
+    return samples
+
+# Write mono samples (-1..1) as a 16-bit WAV file.
+def write_wav(file_path, samples, sampling_frequency):
+    pcm = np.clip(np.round(samples * 32767), -32768, 32767).astype('<i2')
+    with wave.open(file_path, 'wb') as fout:
+        fout.setnchannels(1)
+        fout.setsampwidth(2)
+        fout.setframerate(sampling_frequency)
+        fout.writeframes(pcm.tobytes())
+
+# Write a one-tier textgrid in Praat's long text format, from a list of
+# (start, end, label) covering the whole file.
+def write_textgrid(file_path, duration, intervals):
+    lines = [
+        'File type = "ooTextFile"',
+        'Object class = "TextGrid"',
+        '',
+        'xmin = 0',
+        'xmax = {0!r}'.format(duration),
+        'tiers? <exists>',
+        'size = 1',
+        'item []:',
+        '    item [1]:',
+        '        class = "IntervalTier"',
+        '        name = "vowels"',
+        '        xmin = 0',
+        '        xmax = {0!r}'.format(duration),
+        '        intervals: size = {0}'.format(len(intervals))
+        ]
+    for interval_no, (start_time, end_time, label) in enumerate(intervals):
+        lines += [
+            '        intervals [{0}]:'.format(interval_no + 1),
+            '            xmin = {0!r}'.format(start_time),
+            '            xmax = {0!r}'.format(end_time),
+            '            text = "{0}"'.format(label)
+            ]
+    with open(file_path, 'w') as fout:
+        fout.write('\n'.join(lines) + '\n')
+
+# Make a corpus of file_count sound files, each duration seconds long with
+# intervals_per_file vowels, in directory. Returns the true trajectories, as a
+# dictionary of {(sound name, interval position): trajectory}.
+def make_corpus(directory, file_count, duration, intervals_per_file,
+    sampling_frequency, seed):
+    generator = np.random.RandomState(seed)
+    slot = duration / intervals_per_file
+    if slot < vowel_lengths[1] + 0.1:
+        sys.exit('Error: {0} intervals will not fit in {1} s.'.format(
+            intervals_per_file, duration))
+
+    truth = {}
+    for file_no in range(file_count):
+        name = 'synthetic{0:04d}'.format(file_no + 1)
+        samples = generator.normal(0, noise_level,
+            int(round(duration * sampling_frequency)))
+        intervals = []
+        previous_end = 0.0
+        for slot_no in range(intervals_per_file):
+            length = generator.uniform(*vowel_lengths)
+            start_time = round(slot_no * slot + (slot - length) / 2, 4)
+            end_time = round(start_time + length, 4)
+            trajectory = random_trajectory(generator)
+            vowel = synthesise_vowel(trajectory, end_time - start_time,
+                sampling_frequency)
+            first = int(round(start_time * sampling_frequency))
+            samples[first:first + len(vowel)] += vowel
+
+            intervals.append((previous_end, start_time, ''))
+            intervals.append((start_time, end_time, interval_label))
+            # Interval positions count from 1, as in Praat.
+            truth[(name, len(intervals))] = trajectory
+            previous_end = end_time
+        intervals.append((previous_end, duration, ''))
+
+        samples *= 0.5 / max(np.max(np.abs(samples)), 1e-9)
+        write_wav(os.path.join(directory, name + sound_extension), samples,
+            sampling_frequency)
+        write_textgrid(os.path.join(directory, name + textgrid_extension),
+            duration, intervals)
+    return truth
+
+# Find the vowels to measure as logformantsbylabel.py does, returning a list of
+# sounds with their interval positions and times.
+def find_intervals(directory):
+    sounds = logformantsbylabel.get_files_by_ext(directory, sound_extension)
+    for sound in sounds:
+        textgrid = textgridparser.read_textgrid(
+            os.path.join(directory, sound['name'] + textgrid_extension))
+        found = list(textgrid.find(label=interval_label, tier=1))
+        sound['interval_positions'] = [interval[1] for interval in found]
+        sound['interval_times'] = [(interval[2], interval[3])
+            for interval in found]
+    return sounds
+
+# Clear the numpy engine's analysis caches, so that every run starts cold.
+def clear_caches():
+    formanttracker._analyse_sound_file.cache_clear()
+    formanttracker._analyse_sound_window.cache_clear()
+
+# How many analyses of sound files (or windows of them) the numpy engine has
+# made, rather than found in its caches.
+def analyses_made():
+    return formanttracker._analyse_sound_file.cache_info().misses + \
+        formanttracker._analyse_sound_window.cache_info().misses
+
+# Batch jobs measuring the intervals of sounds in directory, with the engine
+# and settings given on the command line.
+def make_jobs(sounds, directory, results):
+    script_path = os.path.dirname(os.path.abspath(__file__))
+    batch_script_path = os.path.join(script_path,
+        logformantsbylabel.default_params['praat_batch_script_path'])
+    return logformantsbylabel.make_batch_jobs(sounds, directory,
+        sound_extension, textgrid_extension, '1', results.engine,
+        [benchmark_params], results.praat_path, batch_script_path,
+        results.window_margin)
+
+# Measure every interval, in jobs as in batch mode, starting cold. Returns the
+# lines of measurements.
+def measure_corpus(sounds, directory, results):
+    clear_caches()
+    measurement_lines = []
+    for job, job_lines, qualities in logformantsbylabel.run_batch_jobs(
+        make_jobs(sounds, directory, results), results.jobs):
+        measurement_lines += [line for params, line in job_lines]
+    return measurement_lines
+
+# Peak memory (MB) of this process and its finished child processes, or None
+# where it can't be found.
+def peak_memory():
+    if resource is None:
+        return None, None
+    # ru_maxrss is in kB, except on macOS, where it's in bytes.
+    scale = 1024.0 * 1024 if sys.platform == 'darwin' else 1024.0
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+        )
+
+# Peak memory (MB) of measuring the corpus in directory as in batch mode, and
+# of the worker processes doing it. The measuring is done by a new Python
+# process that does nothing else, so that making the corpus, and whatever
+# else this process holds, isn't counted.
+def measuring_memory(directory, results):
+    if resource is None:
+        return None, None
+    arguments = [sys.executable, os.path.abspath(__file__), '--memory_only',
+        '--directory', directory, '--engine', results.engine,
+        '--praat_path', results.praat_path, '--jobs', str(results.jobs)]
+    if results.window_margin is not None:
+        arguments += ['--window_margin', repr(results.window_margin)]
+    try:
+        output = subprocess.check_output(arguments, universal_newlines=True)
+    except subprocess.CalledProcessError:
+        sys.exit('Error: measuring memory failed.')
+    process_memory, child_memory = output.split()
+    return float(process_memory), float(child_memory)
+
+# Measured values from a line of measurements, as an 11 x 3 array (NaN where
+# undefined).
+def line_values(measurement_line):
+    fields = measurement_line.split('\t')[2:]
+    return np.array([
+        float(value) if value != '--undefined--' else np.nan
+        for value in fields
+        ]).reshape(-1, 3)
+
+def format_memory(megabytes):
+    if megabytes is None:
+        return 'n/a'
+    return '{0:.1f} MB'.format(megabytes)
+
+def format_latencies(latencies):
+    if len(latencies) == 0:
+        return 'none measured'
+    return ('{0} intervals, p50 {1:.1f}, p90 {2:.1f}, p99 {3:.1f}, ' +
+        'max {4:.1f}').format(len(latencies),
+        *(1000 * np.percentile(latencies, [50, 90, 99, 100])))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the measuring ' +
+        'of logformantsbylabel.py on a corpus of synthetic vowels.')
+    parser.add_argument('--files', action='store', type=int, default=10,
+        help='number of sound files (default 10)')
+    parser.add_argument('--duration', action='store', type=float,
+        default=30.0, help='length of each sound file in seconds ' +
+        '(default 30)')
+    parser.add_argument('--intervals', action='store', type=int, default=20,
+        help='number of vowels in each sound file (default 20)')
+    parser.add_argument('--sampling_frequency', action='store', type=int,
+        default=16000, help='sampling frequency of the sound files ' +
+        '(default 16000)')
+    parser.add_argument('--seed', action='store', type=int, default=1,
+        help='random seed for the corpus (default 1)')
+    parser.add_argument('--engine', action='store',
+        choices=['numpy', 'praat'], default='numpy',
+        help='measuring engine (default numpy)')
+    parser.add_argument('--praat_path', action='store', default='praat',
+        help='location of Praat, for the praat engine (default praat)')
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=1,
+        help='number of worker processes for the throughput run (default 1)')
+    parser.add_argument('--window_margin', action='store', type=float,
+        default=None, help='use windowed loading with this margin (s)')
+    parser.add_argument('--directory', action='store', default=None,
+        help='make the corpus in this directory and keep it (default: a ' +
+        'temporary directory, removed afterwards)')
+    # Used by measuring_memory: measure the corpus already in --directory and
+    # print the peak memory.
+    parser.add_argument('--memory_only', action='store_true', default=False,
+        help=argparse.SUPPRESS)
+    results = parser.parse_args()
+    if results.files < 1 or results.intervals < 1 or results.jobs < 1:
+        parser.error('--files, --intervals and --jobs must be at least 1')
+    check_numpy()
+
+    if results.memory_only:
+        measure_corpus(find_intervals(results.directory), results.directory,
+            results)
+        print('{0!r} {1!r}'.format(*peak_memory()))
+        return
+
+    if results.directory:
+        directory = results.directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    else:
+        directory = tempfile.mkdtemp(prefix='formant_benchmark_')
+
+    try:
+        print('Making {0} files of {1} s with {2} vowels each in {3}'.format(
+            results.files, results.duration, results.intervals, directory))
+        truth = make_corpus(directory, results.files, results.duration,
+            results.intervals, results.sampling_frequency, results.seed)
+        sounds = find_intervals(directory)
+        interval_count = sum(len(sound['interval_positions'])
+            for sound in sounds)
+
+        # Throughput: every interval, in jobs as in batch mode.
+        started = time.time()
+        measurement_lines = measure_corpus(sounds, directory, results)
+        elapsed = time.time() - started
+
+        # Latency: each interval measured on its own, as in interactive mode.
+        # An interval is cold if its sound file (or, with windowed loading,
+        # its window) had to be analysed first, and warm if an analysis made
+        # for an earlier interval was reused. The praat engine starts Praat
+        # afresh for each job, so is always cold.
+        clear_caches()
+        cold_latencies = []
+        warm_latencies = []
+        for sound in sounds:
+            for interval_no, interval_position in enumerate(
+                sound['interval_positions']):
+                job = make_jobs([{
+                    'name': sound['name'],
+                    'interval_positions': [interval_position],
+                    'interval_times': [sound['interval_times'][interval_no]]
+                    }], directory, results)[0]
+                analysis_count = analyses_made()
+                started = time.time()
+                job_lines, qualities, error = \
+                    logformantsbylabel.measure_job(job)
+                latency = time.time() - started
+                if error is not None:
+                    sys.exit(error)
+                if results.engine == 'praat' or \
+                    analyses_made() > analysis_count:
+                    cold_latencies.append(latency)
+                else:
+                    warm_latencies.append(latency)
+
+        # Memory: the same measuring as for throughput, in another process.
+        process_memory, child_memory = measuring_memory(directory, results)
+
+        # Accuracy against the true trajectories at each tenth point.
+        errors = []
+        for measurement_line in measurement_lines:
+            fields = measurement_line.split('\t')
+            trajectory = truth[(fields[0], int(fields[1]))]
+            expected = trajectory_at(trajectory, np.arange(11) / 10.0)
+            errors.append(np.abs(line_values(measurement_line) - expected))
+        errors = np.array(errors)
+        undefined_count = int(np.isnan(errors).sum())
+    finally:
+        if not results.directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print('Engine: {0}, {1} worker process(es){2}'.format(results.engine,
+        results.jobs, '' if results.window_margin is None else
+        ', windowed loading ({0} s margin)'.format(results.window_margin)))
+    print('Throughput: {0} intervals in {1:.2f} s ({2:.1f} intervals/s)'.
+        format(len(measurement_lines), elapsed,
+        len(measurement_lines) / max(elapsed, 1e-9)))
+    print('Latency per interval (ms), cold (analysing the sound): ' +
+        format_latencies(cold_latencies))
+    print('Latency per interval (ms), warm (reusing an analysis): ' +
+        format_latencies(warm_latencies))
+    print('Peak memory of measuring: {0} (measuring process), {1} '.format(
+        format_memory(process_memory), format_memory(child_memory)) +
+        '(its worker processes)')
+    if len(measurement_lines) < interval_count:
+        print('Warning: only {0} of {1} intervals were measured.'.format(
+            len(measurement_lines), interval_count))
+
+    print(('\nMean absolute error (Hz) of {0} intervals ({1} undefined ' +
+        'values left out):').format(len(errors), undefined_count))
+    print('\t' + '\t'.join('{0}%'.format(tenth * 10) for tenth in range(11)))
+    with np.errstate(invalid='ignore'):
+        mean_errors = np.nanmean(errors, axis=0)
+    for formant_no in range(3):
+        print('F{0}\t'.format(formant_no + 1) + '\t'.join(
+            '{0:.0f}'.format(value) for value in mean_errors[:, formant_no]
+            ))
+
+if __name__ == '__main__':
+    main()
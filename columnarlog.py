@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# columnarlog.py
+# Columnar binary copy of the output file for logformantsbylabel.py.
+
+# Logged lines are collected and written out in bulk as NumPy .npz shards, one
+# array per column: each f{n}_{pct}% column as float32 (NaN where Praat gave
+# --undefined--), interval positions as int32 and time stamps as int64 seconds
+# since 1970 (-1 for a time stamp that can't be read). Sound file names,
+# interval labels and parameter sets (the other settings logged with each
+# line) are stored once per shard in a table, with an int32 code per row
+# pointing into it. read_columns() loads and joins the shards.
+
+# Requires NumPy (www.numpy.org).
+
+import glob
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Columns of the output file, after the sound file and interval position.
+formant_columns = [
+    'f{0}_{1}%'.format(formant_no, percentage * 10)
+    for percentage in range(0, 11)
+    for formant_no in range(1, 4)
+    ]
+parameter_columns = [
+    'spectrogram_window_length', 'textgrid_tier', 'f1_reference',
+    'f2_reference', 'f3_reference', 'f4_reference', 'f5_reference',
+    'frequency_cost', 'bandwidth_cost', 'transition_cost'
+    ]
+
+# Number of rows written to each shard.
+shard_rows = 100000
+
+# Stop with a helpful message if NumPy isn't installed.
+def check_numpy():
+    if np is None:
+        sys.exit(
+            'Error: columnar output requires NumPy (www.numpy.org), which ' +
+            'could not be imported.'
+            )
+
+# Codes for values, and the table of distinct values they point into.
+def dictionary_encode(values):
+    table = {}
+    codes = np.fromiter(
+        (table.setdefault(value, len(table)) for value in values),
+        dtype=np.int32, count=len(values)
+        )
+    return codes, list(table)
+
+# Seconds since 1970 of a time stamp in the output file, or -1 if it can't be
+# read. Time stamps are written in local time, so they're read as local time,
+# with daylight saving time as it was then.
+def parse_time_stamp(time_stamp):
+    try:
+        return int(time.mktime(time.strptime(time_stamp,
+            '%Y/%m/%d %H:%M:%S')))
+    except (ValueError, OverflowError):
+        return -1
+
+class ColumnarWriter(object):
+
+    # Shards are written to directory, named with prefix, the time the writer
+    # was made and a shard number, so separate runs don't overwrite each other.
+    def __init__(self, directory, prefix):
+        check_numpy()
+        self.directory = directory
+        self.prefix = '{0}_{1}'.format(prefix, time.strftime('%Y%m%d%H%M%S'))
+        self.shard_no = 0
+        self.rows = []
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except EnvironmentError:
+                sys.exit('Error: could not make directory {0}.'.
+                    format(directory))
+
+    # Add logged lines (as written to the output file).
+    def add_lines(self, lines):
+        for line in lines:
+            self.rows.append(line.rstrip('\r\n').split('\t'))
+        if len(self.rows) >= shard_rows:
+            self.flush()
+
+    # Write collected rows to a new shard.
+    def flush(self):
+        if len(self.rows) == 0:
+            return
+        rows = self.rows
+        self.rows = []
+        self.shard_no += 1
+
+        columns = {}
+        columns['sound_file_codes'], sound_files = dictionary_encode(
+            [row[0] for row in rows]
+            )
+        columns['sound_files'] = np.array(sound_files, dtype=str)
+        columns['interval_position'] = np.array(
+            [int(row[1]) for row in rows], dtype=np.int32
+            )
+
+        # Lines logged before measuring started at 0% have 30 values rather
+        # than 33; their 0% columns are left undefined.
+        values = np.full((len(rows), len(formant_columns)), np.nan,
+            dtype=np.float32)
+        for row_no, row in enumerate(rows):
+            row_values = row[2:-12]
+            values[row_no, len(formant_columns) - len(row_values):] = [
+                float(value) if value != '--undefined--' else np.nan
+                for value in row_values
+                ]
+        for column_no, column in enumerate(formant_columns):
+            columns[column] = values[:, column_no].copy()
+
+        columns['interval_label_codes'], labels = dictionary_encode(
+            [row[-12] for row in rows]
+            )
+        columns['interval_labels'] = np.array(labels, dtype=str)
+        columns['parameter_set_codes'], parameter_sets = dictionary_encode(
+            [tuple(row[-11:-1]) for row in rows]
+            )
+        columns['parameter_sets'] = np.array(parameter_sets, dtype=str)
+        columns['parameter_columns'] = np.array(parameter_columns, dtype=str)
+        columns['time_stamp'] = np.array(
+            [parse_time_stamp(row[-1]) for row in rows], dtype=np.int64
+            )
+
+        file_path = os.path.join(self.directory, '{0}_{1:04d}.npz'.format(
+            self.prefix, self.shard_no))
+        try:
+            np.savez(file_path, **columns)
+        except EnvironmentError:
+            sys.exit('Error: could not write columnar output {0}.'.
+                format(file_path))
+
+    def close(self):
+        self.flush()
+
+# Load all shards in a directory, returning a dictionary of columns covering
+# every row. Dictionary-encoded columns are merged, so codes index the combined
+# sound_files, interval_labels and parameter_sets tables.
+def read_columns(directory):
+    check_numpy()
+    shard_paths = sorted(glob.glob(os.path.join(directory, '*.npz')))
+    plain_columns = ['interval_position', 'time_stamp'] + formant_columns
+    encoded_columns = [
+        ('sound_file_codes', 'sound_files'),
+        ('interval_label_codes', 'interval_labels'),
+        ('parameter_set_codes', 'parameter_sets')
+        ]
+
+    parts = dict((column, []) for column in plain_columns)
+    tables = dict((table, {}) for codes, table in encoded_columns)
+    for codes, table in encoded_columns:
+        parts[codes] = []
+
+    for shard_path in shard_paths:
+        with np.load(shard_path) as shard:
+            for column in plain_columns:
+                parts[column].append(shard[column])
+            for codes, table in encoded_columns:
+                # Map this shard's codes onto the combined table.
+                shard_table = [
+                    tuple(str(field) for field in value) if value.ndim > 0
+                    else str(value)
+                    for value in shard[table]
+                    ]
+                mapping = np.array([
+                    tables[table].setdefault(value, len(tables[table]))
+                    for value in shard_table
+                    ], dtype=np.int32)
+                parts[codes].append(mapping[shard[codes]])
+
+    columns = {}
+    for column, arrays in parts.items():
+        if len(arrays) > 0:
+            columns[column] = np.concatenate(arrays)
+        else:
+            columns[column] = np.zeros(0)
+    for codes, table in encoded_columns:
+        columns[table] = list(tables[table])
+    columns['parameter_columns'] = list(parameter_columns)
+    return columns
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# corpusmanifest.py
+# Cached list of the sound files and textgrids in a corpus for
+# logformantsbylabel.py.
+
+# The data directory is searched recursively, and every sound file and textgrid
+# found is recorded in an SQLite database with its size and modification time.
+# Files are named by their path relative to the data directory, with / between
+# directories. A SHA-1 hash of a file's contents is only worked out when it's
+# needed (e.g. by the analysis cache) and then kept with it. On later scans, a
+# file whose size or modification time has changed counts as changed, unless
+# it has a hash, in which case it's read again to see whether its contents
+# really have; files that have gone are dropped. The intervals found in each
+# textgrid (for a given tier and label) are kept as well, and only looked for
+# again once the textgrid changes, so a rerun over a large corpus doesn't need
+# to read every textgrid. A manifest can be limited to some of the files (e.g.
+# one shard of a corpus shared between machines).
+
+import hashlib
+import os
+import sqlite3
+import sys
+
+import textgridparser
+
+# How much of a file to hash at a time.
+hash_block_size = 1024 * 1024
+
+# SHA-1 hash of a file's contents, as a hex string.
+def file_hash(file_path):
+    contents_hash = hashlib.sha1()
+    with open(file_path, 'rb') as fin:
+        for block in iter(lambda: fin.read(hash_block_size), b''):
+            contents_hash.update(block)
+    return contents_hash.hexdigest()
+
+# The (device, inode) pair identifying a directory, however it's reached.
+def directory_id(directory):
+    stat = os.stat(directory)
+    return stat.st_dev, stat.st_ino
+
+# Yield (relative path, size, modification time) for every file below
+# directory, with / between directories in the relative path. Symbolic links
+# to directories are followed, but no directory is entered twice, so a link
+# back up the tree doesn't loop; visited holds the directory_id of those
+# entered already (and of any to be left out). Entries are taken in order of
+# name, links last, so a directory is found by its own path where it can be.
+def walk_files(directory, relative_directory='', visited=None):
+    if visited is None:
+        visited = set()
+    try:
+        identity = directory_id(directory)
+        entries = sorted(os.scandir(directory),
+            key=lambda entry: (entry.is_symlink(), entry.name))
+    except EnvironmentError:
+        return
+    if identity in visited:
+        return
+    visited.add(identity)
+    for entry in entries:
+        relative_path = relative_directory + entry.name
+        if entry.is_dir():
+            for found in walk_files(entry.path, relative_path + '/',
+                visited):
+                yield found
+        elif entry.is_file():
+            try:
+                stat = entry.stat()
+            except EnvironmentError:
+                continue
+            yield relative_path, stat.st_size, stat.st_mtime
+
+class CorpusManifest(object):
+
+    # If include is given, only files for which include(relative path) is
+    # True are recorded. Directories in skip_directories (e.g. ones the
+    # script writes its own output to) aren't searched.
+    def __init__(self, file_path, include=None, skip_directories=()):
+        self.file_path = file_path
+        self.include = include
+        self.skip_directories = list(skip_directories)
+        try:
+            self.connection = sqlite3.connect(file_path)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS files (' +
+                'path TEXT PRIMARY KEY, ' +
+                'size INTEGER NOT NULL, ' +
+                'mtime REAL NOT NULL, ' +
+                'hash TEXT)'
+                )
+            # Which tiers and labels each textgrid has been searched for, and
+            # the intervals found.
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS indexed (' +
+                'path TEXT NOT NULL, ' +
+                'tier TEXT NOT NULL, ' +
+                'label TEXT NOT NULL, ' +
+                'PRIMARY KEY (path, tier, label))'
+                )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS intervals (' +
+                'path TEXT NOT NULL, ' +
+                'tier TEXT NOT NULL, ' +
+                'label TEXT NOT NULL, ' +
+                'interval_position INTEGER NOT NULL, ' +
+                'start_time REAL NOT NULL, ' +
+                'end_time REAL NOT NULL)'
+                )
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS intervals_by_path ' +
+                'ON intervals (path, tier, label)'
+                )
+            self.connection.commit()
+        except sqlite3.Error:
+            sys.exit('Error: could not open corpus manifest {0}.'.
+                format(file_path))
+
+    def close(self):
+        self.connection.close()
+
+    # Bring the manifest up to date with the files below directory ending in
+    # one of extensions. Returns the relative paths of files that are new or
+    # whose contents have changed.
+    def scan(self, directory, extensions):
+        if not os.path.isdir(directory):
+            sys.exit("Error: directory {0} not found.".format(directory))
+
+        known = dict(
+            (row[0], row[1:]) for row in self.connection.execute(
+                'SELECT path, size, mtime, hash FROM files')
+            )
+        seen = set()
+        changed = set()
+        updates = []
+        skipped = set(
+            directory_id(skip_directory)
+            for skip_directory in self.skip_directories
+            if os.path.isdir(skip_directory)
+            )
+        for path, size, mtime in walk_files(directory, visited=skipped):
+            if not path.endswith(tuple(extensions)):
+                continue
+            if self.include is not None and not self.include(path):
+                continue
+            seen.add(path)
+            old = known.get(path)
+            if old is not None and old[:2] == (size, mtime):
+                continue
+            # Size or time has changed. If the file was hashed, only the
+            # contents say whether it really has; otherwise it's taken to
+            # have changed, and isn't hashed until it's needed.
+            contents_hash = None
+            if old is not None and old[2] is not None:
+                try:
+                    contents_hash = file_hash(os.path.join(directory, path))
+                except EnvironmentError:
+                    seen.discard(path)
+                    continue
+            updates.append((path, size, mtime, contents_hash))
+            if contents_hash is None or old[2] != contents_hash:
+                changed.add(path)
+
+        removed = set(known) - seen
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', updates
+                    )
+                for path in changed | removed:
+                    self.connection.execute(
+                        'DELETE FROM indexed WHERE path = ?', (path,)
+                        )
+                    self.connection.execute(
+                        'DELETE FROM intervals WHERE path = ?', (path,)
+                        )
+                self.connection.executemany(
+                    'DELETE FROM files WHERE path = ?',
+                    [(path,) for path in removed]
+                    )
+        except sqlite3.Error:
+            sys.exit('Error: could not write to corpus manifest {0}.'.
+                format(self.file_path))
+        return changed
+
+    # Relative paths of the files with extension, without the extension, in
+    # order.
+    def names(self, extension):
+        return [
+            row[0][:-len(extension)] for row in self.connection.execute(
+                'SELECT path FROM files ORDER BY path'
+                )
+            if row[0].endswith(extension)
+            ]
+
+    # Size, modification time and hash of a file (the hash None if it hasn't
+    # been worked out), or None if it isn't in the manifest.
+    def file_info(self, path):
+        return self.connection.execute(
+            'SELECT size, mtime, hash FROM files WHERE path = ?', (path,)
+            ).fetchone()
+
+    # Keep hashes of files below directory worked out elsewhere (e.g. by the
+    # analysis cache), given as {file path: (size, modification time, hash)},
+    # for the files that haven't changed since the last scan.
+    def remember_hashes(self, directory, hashes):
+        updates = [
+            (contents_hash, os.path.relpath(file_path, directory).replace(
+                os.sep, '/'), size, mtime)
+            for file_path, (size, mtime, contents_hash) in hashes.items()
+            ]
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    'UPDATE files SET hash = ? ' +
+                    'WHERE path = ? AND size = ? AND mtime = ?', updates
+                    )
+        except sqlite3.Error:
+            sys.exit('Error: could not write to corpus manifest {0}.'.
+                format(self.file_path))
+
+    # (interval position, start time, end time) for each interval labelled
+    # label on tier (a number or name) of the textgrid at path (relative to
+    # directory), from the manifest if the textgrid has been searched for them
+    # since it last changed.
+    def intervals(self, directory, path, tier, label):
+        tier = str(tier)
+        if self.connection.execute(
+            'SELECT 1 FROM indexed WHERE path = ? AND tier = ? AND label = ?',
+            (path, tier, label)).fetchone() is not None:
+            return list(self.connection.execute(
+                'SELECT interval_position, start_time, end_time ' +
+                'FROM intervals WHERE path = ? AND tier = ? AND label = ? ' +
+                'ORDER BY interval_position',
+                (path, tier, label)
+                ))
+
+        textgrid = textgridparser.read_textgrid(os.path.join(directory, path))
+        found = [
+            (interval_position, start_time, end_time)
+            for tier_number, interval_position, start_time, end_time,
+                interval_label in textgrid.find(label=label, tier=tier)
+            ]
+        try:
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO indexed VALUES (?, ?, ?)',
+                    (path, tier, label)
+                    )
+                self.connection.executemany(
+                    'INSERT INTO intervals VALUES (?, ?, ?, ?, ?, ?)',
+                    [(path, tier, label) + interval for interval in found]
+                    )
+        except sqlite3.Error:
+            sys.exit('Error: could not write to corpus manifest {0}.'.
+                format(self.file_path))
+        return found
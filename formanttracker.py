@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# formanttracker.py
+# In-process formant measuring engine for logformantsbylabel.py.
+
+# Does the same work as logformantsbylabel.praat without needing Praat: the
+# sound is resampled to 16 kHz, formant candidates are found by Burg LPC
+# analysis (as with Praat's "To Formant (burg)... 0.01 5 5000 0.025 50"), and
+# three formant tracks are picked out of the candidates by a Viterbi search
+# using the same reference frequencies and frequency/bandwidth/transition costs
+# as Praat's "Track...". Formant values are then read off the tracks at tenths
+# of the interval, as in the Praat script.
+
+# The resampled sound and the formant candidates can also be kept between runs
+# in an analysis cache (see analysiscache.py), so that measuring a file again
+# with other tracking settings only repeats the tracking.
+
+# Requires NumPy (www.numpy.org). Only uncompressed PCM WAV files are read.
+
+import functools
+import itertools
+import math
+import os
+import sys
+import threading
+import wave
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import analysiscache
+
+# Analysis settings, matching those hard-coded in logformantsbylabel.praat.
+resample_frequency = 16000
+time_step = 0.01
+number_of_formants = 5
+maximum_formant = 5000
+window_length = 0.025
+pre_emphasis_from = 50
+number_of_tracks = 3
+
+# Formant candidates closer than this to 0 Hz or the Nyquist frequency are
+# discarded, as Praat does.
+safety_margin = 50
+
+# Cost added for each track that has to be left empty in a frame with fewer
+# candidates than tracks.
+missing_candidate_cost = 1000
+
+# Settings the formant candidates depend on, which are part of their key in
+# the analysis cache.
+analysis_settings = (resample_frequency, time_step, number_of_formants,
+    maximum_formant, window_length, pre_emphasis_from, safety_margin)
+
+# The analysis cache in use, if any (see use_analysis_cache).
+analysis_cache = None
+
+# Held while a sound is analysed, so that intervals measured in the background
+# (see prefetcher.py) and in the foreground don't use the analyses kept in
+# memory and the analysis cache at the same time.
+analysis_lock = threading.Lock()
+
+# Stop with a helpful message if NumPy isn't installed.
+def check_numpy():
+    if np is None:
+        sys.exit(
+            'Error: the numpy measuring engine requires NumPy ' +
+            '(www.numpy.org), which could not be imported.'
+            )
+
+# Read a PCM WAV file, returning mono samples scaled to -1..1 and the sampling
+# frequency.
+def read_wav(file_path):
+    try:
+        with wave.open(file_path, 'rb') as fin:
+            channels = fin.getnchannels()
+            sample_width = fin.getsampwidth()
+            sampling_frequency = fin.getframerate()
+            frames = fin.readframes(fin.getnframes())
+    except (EnvironmentError, wave.Error, EOFError):
+        sys.exit('Error: could not read sound file {0}.'.format(file_path))
+
+    return (
+        pcm_to_float(frames, channels, sample_width),
+        float(sampling_frequency)
+        )
+
+# Read part of a PCM WAV file, from from_time to to_time (in seconds, limited
+# to the length of the file), without reading the rest of it. Returns mono
+# samples scaled to -1..1, the sampling frequency and the time of the first
+# sample.
+def read_wav_window(file_path, from_time, to_time):
+    try:
+        with wave.open(file_path, 'rb') as fin:
+            channels = fin.getnchannels()
+            sample_width = fin.getsampwidth()
+            sampling_frequency = fin.getframerate()
+            first_frame = min(max(int(math.floor(
+                from_time * sampling_frequency)), 0), fin.getnframes())
+            last_frame = min(max(int(math.ceil(
+                to_time * sampling_frequency)), first_frame), fin.getnframes())
+            fin.setpos(first_frame)
+            frames = fin.readframes(last_frame - first_frame)
+    except (EnvironmentError, wave.Error, EOFError):
+        sys.exit('Error: could not read sound file {0}.'.format(file_path))
+
+    return (
+        pcm_to_float(frames, channels, sample_width),
+        float(sampling_frequency),
+        first_frame / float(sampling_frequency)
+        )
+
+# Time of the first sample that read_wav_window reads from from_time, found
+# from the header of the file alone.
+def wav_window_start(file_path, from_time):
+    try:
+        with wave.open(file_path, 'rb') as fin:
+            sampling_frequency = fin.getframerate()
+            first_frame = min(max(int(math.floor(
+                from_time * sampling_frequency)), 0), fin.getnframes())
+    except (EnvironmentError, wave.Error, EOFError):
+        sys.exit('Error: could not read sound file {0}.'.format(file_path))
+    return first_frame / float(sampling_frequency)
+
+# Convert raw little-endian PCM bytes to mono floats scaled to -1..1.
+def pcm_to_float(frames, channels, sample_width):
+    if sample_width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float64)
+            - 128) / 128
+    elif sample_width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        samples = (
+            raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) |
+            (raw[:, 2].astype(np.int8).astype(np.int32) << 16)
+            ) / float(2 ** 23)
+    else:
+        dtype = {2: '<i2', 4: '<i4'}[sample_width]
+        samples = np.frombuffer(frames, dtype=dtype).astype(np.float64) / \
+            float(2 ** (8 * sample_width - 1))
+
+    # Praat averages the channels before formant analysis.
+    return samples.reshape(-1, channels).mean(axis=1)
+
+# Resample by zero-padding or truncating the spectrum, which band-limits the
+# signal in the same way as Praat's "Resample...".
+def resample(samples, old_frequency, new_frequency):
+    if old_frequency == new_frequency or len(samples) == 0:
+        return samples
+    new_length = int(round(len(samples) * new_frequency / old_frequency))
+    spectrum = np.fft.rfft(samples)
+    new_bins = new_length // 2 + 1
+    if new_bins < len(spectrum):
+        spectrum = spectrum[:new_bins]
+    else:
+        spectrum = np.concatenate(
+            (spectrum, np.zeros(new_bins - len(spectrum), dtype=complex))
+            )
+    return np.fft.irfft(spectrum, new_length) * (new_length / len(samples))
+
+# Times of the centres of analysis frames, laid out symmetrically over the
+# sound as Praat does.
+def frame_times(duration, window_duration, step):
+    frame_count = int(math.floor((duration - window_duration) / step)) + 1
+    if frame_count < 1:
+        return np.zeros(0)
+    first_time = 0.5 * (duration - (frame_count - 1) * step)
+    return first_time + step * np.arange(frame_count)
+
+# Cut the sound into Gaussian-windowed frames centred on the given times.
+def windowed_frames(samples, sampling_frequency, times, window_duration):
+    window_samples = int(window_duration * sampling_frequency)
+    half_window = window_samples // 2
+    edge = math.exp(-12.0)
+    i = np.arange(window_samples)
+    mid = 0.5 * (window_samples - 1)
+    window = (np.exp(-48.0 * (i - mid) ** 2 / (window_samples + 1) ** 2) -
+        edge) / (1 - edge)
+
+    padded = np.concatenate(
+        (np.zeros(window_samples), samples, np.zeros(window_samples))
+        )
+    starts = np.round(times * sampling_frequency).astype(int) - half_window + \
+        window_samples
+    index = starts[:, None] + i[None, :]
+    return padded[index] * window[None, :]
+
+# Burg's method for LPC coefficients, vectorised across frames. Returns
+# coefficients a[k] such that x[n] is predicted by sum(a[k] * x[n - k - 1]).
+def burg_coefficients(frames, order):
+    frame_count = frames.shape[0]
+    coefficients = np.zeros((frame_count, order))
+    previous = np.zeros((frame_count, order))
+    forward = frames[:, :-1].copy()
+    backward = frames[:, 1:].copy()
+
+    for k in range(order):
+        numerator = np.sum(forward * backward, axis=1)
+        denominator = np.sum(forward ** 2 + backward ** 2, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            reflection = np.where(denominator > 0,
+                2 * numerator / denominator, 0.0)
+        coefficients[:, k] = reflection
+        for i in range(k):
+            coefficients[:, i] = previous[:, i] - \
+                reflection * previous[:, k - 1 - i]
+        if k == order - 1:
+            break
+        previous[:, :k + 1] = coefficients[:, :k + 1]
+        new_forward = forward[:, :-1] - reflection[:, None] * backward[:, :-1]
+        backward = backward[:, 1:] - reflection[:, None] * forward[:, 1:]
+        forward = new_forward
+
+    return coefficients
+
+# Turn LPC coefficients into formant candidates (frequencies and bandwidths,
+# sorted by frequency and padded with NaN) from the roots of the predictor
+# polynomial.
+def coefficients_to_formants(coefficients, sampling_frequency):
+    frame_count, order = coefficients.shape
+    nyquist = sampling_frequency / 2
+
+    # Roots are the eigenvalues of the companion matrix of the polynomial
+    # z^p - a1 z^(p-1) - ... - ap, found for all frames at once.
+    companion = np.zeros((frame_count, order, order))
+    companion[:, 0, :] = coefficients
+    companion[:, np.arange(1, order), np.arange(order - 1)] = 1
+    valid = np.all(np.isfinite(coefficients), axis=1) & \
+        np.any(coefficients != 0, axis=1)
+    roots = np.zeros((frame_count, order), dtype=complex)
+    if np.any(valid):
+        roots[valid] = np.linalg.eigvals(companion[valid])
+
+    # Reflect any roots outside the unit circle back inside it.
+    magnitude = np.abs(roots)
+    outside = magnitude > 1
+    roots[outside] = 1 / np.conj(roots[outside])
+    magnitude = np.abs(roots)
+
+    with np.errstate(divide='ignore'):
+        frequencies = np.angle(roots) * sampling_frequency / (2 * np.pi)
+        bandwidths = -np.log(magnitude) * sampling_frequency / np.pi
+    keep = (roots.imag > 0) & (frequencies >= safety_margin) & \
+        (frequencies <= nyquist - safety_margin) & valid[:, None]
+    frequencies = np.where(keep, frequencies, np.nan)
+    bandwidths = np.where(keep, bandwidths, np.nan)
+
+    order_by_frequency = np.argsort(frequencies, axis=1)
+    frequencies = np.take_along_axis(frequencies, order_by_frequency, axis=1)
+    bandwidths = np.take_along_axis(bandwidths, order_by_frequency, axis=1)
+    return (frequencies[:, :number_of_formants],
+        bandwidths[:, :number_of_formants])
+
+# Equivalent of "To Formant (burg)... 0.01 5 5000 0.025 50" on a sound:
+# returns frame times plus candidate frequencies and bandwidths per frame.
+def burg_formants(samples, sampling_frequency):
+    analysis_frequency = 2 * maximum_formant
+    samples = resample(samples, sampling_frequency, analysis_frequency)
+
+    # Pre-emphasis.
+    emphasis = math.exp(-2 * math.pi * pre_emphasis_from / analysis_frequency)
+    emphasised = samples.copy()
+    emphasised[1:] -= emphasis * samples[:-1]
+
+    # Praat's Gaussian window lasts twice the nominal window length.
+    window_duration = 2 * window_length
+    times = frame_times(len(samples) / analysis_frequency, window_duration,
+        time_step)
+    if len(times) == 0:
+        empty = np.zeros((0, number_of_formants))
+        return times, empty, empty
+
+    frames = windowed_frames(emphasised, analysis_frequency, times,
+        window_duration)
+    coefficients = burg_coefficients(frames, 2 * number_of_formants)
+    frequencies, bandwidths = coefficients_to_formants(coefficients,
+        analysis_frequency)
+    return times, frequencies, bandwidths
+
+# Keep analyses between runs in the analysis cache in directory, up to
+# size_limit bytes, or stop keeping them if directory is None. The same cache
+# is kept on if it's already in use, e.g. in a worker process given several
+# batch jobs.
+def use_analysis_cache(directory, size_limit):
+    global analysis_cache
+    if directory is None:
+        analysis_cache = None
+    elif analysis_cache is None or \
+        (analysis_cache.directory, analysis_cache.size_limit) != \
+        (directory, size_limit):
+        check_numpy()
+        analysis_cache = analysiscache.AnalysisCache(directory, size_limit)
+    return analysis_cache
+
+# Frame times and formant candidates of a sound file (or, if window is given
+# as a (from time, to time) pair, just that part of it), from the analysis
+# cache if they're there. Otherwise the sound is read and resampled (or its
+# resampled samples taken from the cache) and analysed, and the results are
+# cached. Frame times are given from the start of the file.
+def analyse_with_cache(file_path, window=None):
+    if window is None:
+        part_settings = ()
+    else:
+        part_settings = window
+    if analysis_cache is not None:
+        found = analysis_cache.get('formants', file_path,
+            analysis_settings + part_settings)
+        if found is not None:
+            return (found[:, 0], found[:, 1:1 + number_of_formants],
+                found[:, 1 + number_of_formants:])
+
+    samples = None
+    if analysis_cache is not None:
+        samples = analysis_cache.get('resampled', file_path,
+            (resample_frequency,) + part_settings)
+    if samples is not None:
+        start_time = 0
+        if window is not None:
+            start_time = wav_window_start(file_path, window[0])
+    else:
+        if window is None:
+            samples, sampling_frequency = read_wav(file_path)
+            start_time = 0
+        else:
+            samples, sampling_frequency, start_time = read_wav_window(
+                file_path, window[0], window[1])
+        samples = resample(samples, sampling_frequency, resample_frequency)
+        if analysis_cache is not None:
+            analysis_cache.put('resampled', file_path,
+                (resample_frequency,) + part_settings, samples)
+    times, frequencies, bandwidths = burg_formants(samples,
+        resample_frequency)
+    times = times + start_time
+    if analysis_cache is not None:
+        analysis_cache.put('formants', file_path,
+            analysis_settings + part_settings,
+            np.column_stack((times, frequencies, bandwidths)))
+    return times, frequencies, bandwidths
+
+# Read and analyse a sound file. The most recent few analyses are kept, so that
+# measuring further intervals in the same file (or measuring the same interval
+# again with different tracking settings) skips the signal processing.
+@functools.lru_cache(maxsize=2)
+def _analyse_sound_file(file_path, modified_time):
+    return analyse_with_cache(file_path)
+
+def analyse_sound_file(file_path):
+    check_numpy()
+    with analysis_lock:
+        return _analyse_sound_file(file_path, os.path.getmtime(file_path))
+
+# Read and analyse just part of a sound file, so that time and memory depend
+# on the length of the part rather than of the file. Frame times are given
+# from the start of the file.
+@functools.lru_cache(maxsize=2)
+def _analyse_sound_window(file_path, modified_time, from_time, to_time):
+    return analyse_with_cache(file_path, (from_time, to_time))
+
+def analyse_sound_window(file_path, from_time, to_time):
+    check_numpy()
+    with analysis_lock:
+        return _analyse_sound_window(file_path, os.path.getmtime(file_path),
+            from_time, to_time)
+
+# Pick number_of_tracks formant tracks out of the candidates, as Praat's
+# "Track..." does: each frame's state is a choice of candidates (in order of
+# frequency) for the tracks, scored by distance from the reference frequencies,
+# relative bandwidth and log-frequency jumps between frames. Returns tracked
+# frequencies and bandwidths (frames x tracks), NaN where no candidate was left.
+def track_formants(frequencies, bandwidths, references, frequency_cost,
+    bandwidth_cost, transition_cost):
+
+    frame_count = frequencies.shape[0]
+    empty = np.full((frame_count, number_of_tracks), np.nan)
+    if frame_count == 0:
+        return empty, empty.copy()
+
+    combinations = np.array(list(itertools.combinations(
+        range(frequencies.shape[1]), number_of_tracks
+        )))
+    # Candidates for each combination: frames x combinations x tracks.
+    f = frequencies[:, combinations]
+    b = bandwidths[:, combinations]
+    missing = np.isnan(f)
+    references = np.asarray(references[:number_of_tracks], dtype=float)
+
+    # Praat's frequency cost is given per kHz.
+    with np.errstate(invalid='ignore'):
+        local = (frequency_cost / 1000) * np.abs(f - references) + \
+            bandwidth_cost * b / f
+    local = np.where(missing, missing_candidate_cost, local).sum(axis=2)
+
+    log_f = np.log2(np.where(missing, np.nan, f))
+    path_cost = local[0].copy()
+    back_pointers = np.zeros((frame_count, len(combinations)), dtype=int)
+    for frame in range(1, frame_count):
+        jumps = np.abs(log_f[frame - 1][:, None, :] - log_f[frame][None, :, :])
+        transition = transition_cost * np.nansum(jumps, axis=2)
+        total = path_cost[:, None] + transition
+        back_pointers[frame] = np.argmin(total, axis=0)
+        path_cost = total[back_pointers[frame], np.arange(len(combinations))] \
+            + local[frame]
+
+    # Trace back the cheapest path.
+    path = np.zeros(frame_count, dtype=int)
+    path[-1] = np.argmin(path_cost)
+    for frame in range(frame_count - 1, 0, -1):
+        path[frame - 1] = back_pointers[frame, path[frame]]
+
+    frames = np.arange(frame_count)
+    return f[frames, path], b[frames, path]
+
+# Equivalent of Praat's "Get value at time... Hertz Linear" on each track for
+# a set of times.
+def values_at_times(track_times, tracks, times):
+    times = np.asarray(times, dtype=float)
+    values = np.full((len(times), tracks.shape[1]), np.nan)
+    if len(track_times) == 0:
+        return values
+    step = track_times[1] - track_times[0] if len(track_times) > 1 \
+        else time_step
+    position = (times - track_times[0]) / step
+    left = np.floor(position).astype(int)
+    phase = position - left
+    near = np.where(phase < 0.5, left, left + 1)
+    far = np.where(phase < 0.5, left + 1, left)
+    inside = (near >= 0) & (near < len(track_times))
+    near_values = np.full_like(values, np.nan)
+    near_values[inside] = tracks[near[inside]]
+
+    far_inside = (far >= 0) & (far < len(track_times))
+    far_values = np.full_like(values, np.nan)
+    far_values[far_inside] = tracks[far[far_inside]]
+    # Fall back on the nearer frame where the further one is undefined.
+    far_values = np.where(np.isnan(far_values), near_values, far_values)
+
+    weight = np.abs(position - near)[:, None]
+    return near_values + weight * (far_values - near_values)
+
+# Times at 0%, 10% ... 100% of an interval.
+def tenth_points(start_time, end_time):
+    return start_time + (end_time - start_time) * np.arange(11) / 10
+
+# Measure F1-F3 at tenths of an interval in a sound file, using the reference
+# and cost values in measuring_params (as produced by set_params_by_sex).
+# If window_margin is given, only the interval and window_margin seconds either
+# side of it are read and analysed, rather than the whole file. Returns an
+# 11 x 3 array of frequencies in Hz.
+def measure_interval(sound_path, start_time, end_time, measuring_params,
+    window_margin=None):
+    return measure_interval_sweep(sound_path, start_time, end_time,
+        [measuring_params], window_margin)[0]
+
+# Measure an interval as measure_interval does, once for each of a list of
+# measuring_params. The sound is only analysed once; just the tracking is
+# done again for each set of settings. Returns a list of 11 x 3 arrays.
+def measure_interval_sweep(sound_path, start_time, end_time, parameter_sets,
+    window_margin=None):
+    return measure_intervals_sweep(sound_path, [(start_time, end_time)],
+        parameter_sets, window_margin)[0]
+
+# Measure several intervals (a list of start and end times) of a sound file,
+# once for each of a list of measuring_params. Without window_margin, the
+# whole file is tracked once for each set of settings, and every interval is
+# read off the same tracks; with it, each interval's part of the file is
+# analysed once and tracked for each set. Returns, for each interval, a list of
+# 11 x 3 arrays, one for each set of settings.
+def measure_intervals_sweep(sound_path, interval_times, parameter_sets,
+    window_margin=None):
+    if window_margin is not None:
+        results = []
+        for start_time, end_time in interval_times:
+            times, frequencies, bandwidths = analyse_sound_window(sound_path,
+                start_time - window_margin, end_time + window_margin)
+            points = tenth_points(start_time, end_time)
+            results.append([
+                values_at_times(times, track_with_settings(
+                    frequencies, bandwidths, measuring_params)[0], points)
+                for measuring_params in parameter_sets
+                ])
+        return results
+
+    times, frequencies, bandwidths = analyse_sound_file(sound_path)
+    results = [[] for interval in interval_times]
+    for measuring_params in parameter_sets:
+        tracks, _ = track_with_settings(frequencies, bandwidths,
+            measuring_params)
+        for interval_no, (start_time, end_time) in enumerate(interval_times):
+            results[interval_no].append(values_at_times(times, tracks,
+                tenth_points(start_time, end_time)))
+    return results
+
+# Analyse a sound file (or, if from_time and to_time are given, just that part
+# of it) and track its formants with each of a list of measuring_params, for
+# full trajectories. Returns frame times, the candidate frequencies and
+# bandwidths, and a (tracked frequencies, tracked bandwidths) pair for each set
+# of settings.
+def track_sound_sweep(sound_path, parameter_sets, from_time=None,
+    to_time=None):
+    if from_time is None:
+        times, frequencies, bandwidths = analyse_sound_file(sound_path)
+    else:
+        times, frequencies, bandwidths = analyse_sound_window(sound_path,
+            from_time, to_time)
+    return times, frequencies, bandwidths, [
+        track_with_settings(frequencies, bandwidths, measuring_params)
+        for measuring_params in parameter_sets
+        ]
+
+# Track formant candidates with the reference and cost values in
+# measuring_params, returning the tracked frequencies and bandwidths.
+def track_with_settings(frequencies, bandwidths, measuring_params):
+    references = [
+        float(measuring_params['f{0}_reference'.format(formant)])
+        for formant in range(1, 6)
+        ]
+    return track_formants(
+        frequencies, bandwidths, references,
+        float(measuring_params['frequency_cost']),
+        float(measuring_params['bandwidth_cost']),
+        float(measuring_params['transition_cost'])
+        )
+
+# Format a number the way Praat's 'output:0' does.
+def format_value(value):
+    if np.isnan(value):
+        return '--undefined--'
+    return '{0:.0f}'.format(value)
+
+# Tab-separated line in the same layout as the temporary file written by
+# logformantsbylabel.praat: sound name, interval position, then F1, F2, F3 at
+# each tenth point.
+def format_measurements(sound_name, interval_position, values):
+    line = [sound_name, str(interval_position)]
+    line += [format_value(value) for value in values.ravel()]
+    return '\t'.join(line)
+
+# Table of measurements like the one logformantsbylabel.praat prints in the
+# Praat info window.
+def format_table(values):
+    lines = ['\t' + '\t'.join(
+        '{0}%'.format(percent * 10) for percent in range(len(values))
+        )]
+    for formant in range(values.shape[1]):
+        lines.append('F{0}\t'.format(formant + 1) + '\t'.join(
+            format_value(value) for value in values[:, formant]
+            ))
+    return '\n'.join(lines)
@@ -1,531 +1,2445 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-
-# logformantsbylabel.py version 1.2
-# By Chris Norton, 2014–9.
-
-# Looks for sound files and associated textgrids (with matching names) in a
-# given directory, then uses the textgrids to locates intervals by a given label
-# in each sound file. On an interval-by-interval, file-by-file basis, passes the
-# locations to a Praat script (logformantsbylabel.praat) which displays formant
-# information. This Python script then picks up this information from Praat and
-# asks user if this should be logged, or if the formant measuring parameters
-# need to be changed and the analysis performed again. Values are logged in a
-# tab-separated text file.
-
-# Obviously these scripts requires Praat (www.fon.hum.uva.nl/praat/) to be
-# installed. They also require the interface program sendpraat
-# (www.fon.hum.uva.nl/praat/sendpraat.html), which is used to send commands from
-# Python to Praat.
-
-# For information about settings and options, see the documentation in
-# logformantsbylabel_man.txt.
-
-import argparse
-import os
-import sys
-import re
-import subprocess
-import time
-
-if sys.version_info.major < 3:
-    sys.exit('This program requires Python 3 or newer.')
-
-settings_file = 'settings.cfg'
-
-# These parameters will be used if the script is run with the -i or
-# --ignore_settings_file flag is set. Otherwise, parameters will be pulled from
-# the above settings file (or a user-specified settings file when the script is
-# run with -s or --settings_file).
-default_params = {}
-default_params['bandwidth_cost'] = {'male': '1', 'female': '1'}
-default_params['data_directory'] = 'Data'
-default_params['f1_reference'] = {'male': '5000', 'female': '5500'}
-default_params['f2_reference'] = {'male': '1485', 'female': '1650'}
-default_params['f3_reference'] = {'male': '2475', 'female': '2750'}
-default_params['f4_reference'] = {'male': '3465', 'female': '3850'}
-default_params['f5_reference'] = {'male': '4455', 'female': '4950'}
-default_params['frequency_cost'] = {'male': '1', 'female': '1'}
-default_params['interval_label'] = 'V'
-default_params['output_file_name'] = 'formant_tenths.txt'
-default_params['play_sound'] = 'True'
-default_params['praat_script_path'] = 'getformantsbylabel.praat'
-default_params['sendpraat_path'] = 'sendpraat'
-default_params['sound_extension'] = '.wav'
-default_params['spectrogram_window_length'] = '0.005'
-default_params['temporary_file_name'] = 'praat_output.tmp'
-default_params['textgrid_extension'] = '.TextGrid'
-default_params['textgrid_tier'] = '1'
-default_params['transition_cost'] = {'male': '1', 'female': '1'}
-
-# Summarise what has been logged and/or skipped.
-def final_report(intervals_logged_count, files_logged_count,
-    intervals_skipped_count, files_skipped_count):
-
-    report_text = []
-
-    if intervals_logged_count > 0:
-        report_text.append(
-            '{0} intervals in {1} files logged.'.
-            format(intervals_logged_count, files_logged_count)
-            )
-    else:
-        report_text.append('No intervals logged.')
-
-    if intervals_skipped_count > 0:
-        report_text.append(
-            '{0} intervals in {1} files skipped.\n'.
-            format(intervals_skipped_count, files_skipped_count)
-        )
-
-    return '\n'.join(report_text)
-
-# Dictionary of files in a given directory for a given extension.
-def get_files_by_ext(directory, extension):
-    files = []
-    if not os.path.isdir(directory):
-        sys.exit("Error: directory {0} not found.".format(directory))
-
-    for f in os.listdir(directory):
-        if f.endswith(extension):
-            files.append({'name': os.path.splitext(f)[0]})
-    return files
-
-# Return user input, validated by regexp.
-def get_user_input(prompt, validation_rule='', validation_error=''):
-
-    user_input = ''
-    input_valid = False
-
-    while input_valid == False:
-        try:
-            user_input = input(prompt)
-        except KeyboardInterrupt:
-            sys.exit('\nScript terminated by keystroke.')
-
-        # If there’s a validation regexp, check it.
-        if len(validation_rule) > 0:
-            if re.match(validation_rule, user_input):
-                input_valid = True
-            else:
-                input_valid = False
-                print('Invalid input. ' + validation_error)
-        else:
-            input_valid = True
-
-    return user_input
-
-# Some of the parameters have different defaults for either male or female sex.
-# Set current parameters to sex provided.
-def set_params_by_sex(sex, use_settings_file, params):
-
-    new_params = {}
-
-    # The defaults taken from the settings file should have values for the
-    # different sexes in format "male_f1_reference: 5000" &
-    # "female_f1_reference: 5500".
-    if use_settings_file:
-        for formant in range(1,6):
-            param_name = 'f{0}_reference'.format(formant)
-            new_params[param_name] = params[sex + '_' + param_name]
-        new_params['frequency_cost'] = params[sex + '_frequency_cost']
-        new_params['bandwidth_cost'] = params[sex + '_bandwidth_cost']
-        new_params['transition_cost'] = params[sex + '_transition_cost']
-
-    # Default hard-coded settings store values for the sexes in dictionaries:
-    # "default_params['f1_reference'] = {'male': '5000', 'female': '5500'}"
-    else:
-        for formant in range(1,6):
-            param_name = 'f{0}_reference'.format(formant)
-            new_params[param_name] = params[param_name][sex]
-        new_params['frequency_cost'] = params['frequency_cost'][sex]
-        new_params['bandwidth_cost'] = params['bandwidth_cost'][sex]
-        new_params['transition_cost'] = params['transition_cost'][sex]
-
-    return new_params
-
-def main():
-
-    global settings_file
-
-    # Handle arguments passed from command line.
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-s', '--settings_file', action='store',
-        default=False, help='path to settings file')
-    parser.add_argument('-i', '--ignore_settings_file', action='store_true',
-        default=False, help='ignore settings file; use hard-coded settings')
-    parser.add_argument('-v', '--version', action='version',
-        version='logformantsbylabel.py 1.1')
-    results = parser.parse_args()
-    use_settings_file = not results.ignore_settings_file
-    # If user has specified a different settings file, use that.
-    if results.settings_file:
-        settings_file = results.settings_file
-
-    print('logformantsbylabel.py\n(Chris Norton, 2014)\n')
-
-    # Grab parameters either from settings file, or from defaults set above.
-    if use_settings_file:
-        print('Using settings from {0}\n'.format(settings_file))
-        try:
-            lines = [line.strip() for line in open(settings_file)]
-        except EnvironmentError:
-            sys.exit('Error: Settings file {0} not found.'.format(settings_file))
-        params = {}
-        for line in lines:
-            if len(line) == 0 or line[0] == '#':
-                continue
-            parts = line.split(':', 1)
-            key = parts[0].strip()
-            value = parts[1].strip()
-            params[key] = value
-    else:
-        print('Using default settings from python script.\n')
-        params = default_params
-
-    # Set variables which user can't change during script.
-    data_directory = params['data_directory']
-    interval_label = params['interval_label']
-    output_file_name = params['output_file_name']
-    praat_script_path = params['praat_script_path']
-    sendpraat_path = params['sendpraat_path']
-    sound_extension = params['sound_extension']
-    spectrogram_window_length = params['spectrogram_window_length']
-    temporary_file_name = params['temporary_file_name']
-    textgrid_extension = params['textgrid_extension']
-    textgrid_tier = params['textgrid_tier']
-    # Praat uses 1 or 0 for True/False
-    if params['play_sound'].lower() == 'true':
-        play_sound = '1'
-    else:
-        play_sound = '0'
-
-    # Get sound and textgrid files.
-    sounds = get_files_by_ext(data_directory, sound_extension)
-    textgrids = get_files_by_ext(data_directory, textgrid_extension)
-
-    files_previously_logged = ''
-
-    # Check if there's already an output file from this script in the current
-    # directory.
-    output_path = os.path.join(data_directory, output_file_name)
-    try:
-        lines = [
-            line.strip() for line
-            in open(output_path)
-        ]
-    # No output file, create one.
-    except EnvironmentError:
-        files_in_list_logged = False
-
-        header_line = ['Sound file', 'Interval position']
-        # Make formant tenth headers in format f1_10%, f2_10%, f3_10% etc.
-        for percentage in range (0, 11):
-            for formant_no in range(1, 4):
-                header_line.append(
-                    'f{0}_{1}%'.format(formant_no, percentage * 10)
-                    )
-        header_line += [
-            'interval_label', 'spectrogram_window_length', 'textgrid_tier',
-            'f1_reference', 'f2_reference', 'f3_reference', 'f4_reference',
-            'f5_reference', 'frequency_cost', 'bandwidth_cost',
-            'transition_cost', 'time_stamp'
-            ]
-
-        with open(output_path, 'a') as fout:
-            fout.write('\t'.join(header_line) + '\n')
-
-    # Output file exists; check which files have already been processed
-    # (N.B. checks whole files, not individual intervals within the files).
-    else:
-        print(
-            'Existing log file {0} found in {1}\n'.format(output_file_name,
-            data_directory)
-            )
-        files = [line.split('\t')[0] for line in lines]
-        files_previously_logged = set(files)
-        sounds_set = set([sound['name'] for sound in sounds])
-        files_in_list_logged = files_previously_logged.intersection(sounds_set)
-
-    # List sound files found
-    if len(sounds) > 0:
-        print("{0} sound files found in {1}:".format(
-            len(sounds), data_directory
-            ))
-        for no, sound in enumerate(sounds):
-            log_text = ''
-            if sound['name'] in files_previously_logged:
-                log_text = ' (previously logged)'
-            print("{0}. {1}{2}\t{3}".format(no + 1, sound['name'],
-                sound_extension, log_text))
-        print()
-
-        # Ask user if they want to reprocess the logged files.
-        if files_in_list_logged:
-            print('Some of the sound files found have been logged previously.')
-            user_input = get_user_input(
-                'Process previously logged files again (y) or ignore them ' +
-                '(enter): ', '^[yn]$|^$'
-                )
-            if user_input == 'y':
-                print(
-                    'Including previously logged files. New measurements' +
-                    ' will be appended to the output file.\n'
-                    )
-            # Remove previously logged files from list.
-            else:
-                print('Ignoring previously logged files.\n')
-                sounds = [sound for sound in sounds if sound['name'] not in files_previously_logged]
-                if len(sounds) == 0:
-                    sys.exit('No unlogged files to process.')
-
-    else:
-        sys.exit('Error: No sound files found in {0}.'.format(data_directory))
-
-    # If there aren't enough textgrids for the sounds, check which ones are
-    # missing.
-    if len(textgrids) < len(sounds) :
-       without_textgrids = [
-           sound['name'] + sound_extension for sound in sounds
-           if sound not in textgrids
-           ]
-       sys.exit("Error: No textgrid for file(s) {0} ".
-           format(', '.join(without_textgrids))
-       )
-
-    # Read in textgrid files and store where the intervals to measure appear in
-    # each of them.
-    for sound_key, sound in enumerate(sounds):
-        filepath = os.path.join(
-            data_directory, (sound['name'] + textgrid_extension)
-            )
-        lines = [line.strip() for line in open(filepath)]
-        file_content = '\n'.join(lines)
-        interval_positions = []
-
-        # Split file by the string 'intervals [', which should result in junk in
-        # the first [0] slot, leaving the proper list to start at [1], which is
-        # handy because, unlike Python, Praat counts from 1.
-        intervals = file_content.split('intervals [')
-        for interval_key, interval_content in enumerate(intervals):
-            if 'text = "' + interval_label + '"' in interval_content:
-                interval_positions.append(interval_key)
-        sounds[sound_key]['interval_positions'] = interval_positions
-
-    # Make a current copy of the default parameters, selecting values according
-    # to sex.
-    sex = get_user_input('Enter speaker sex (m/f) [default m]: ', '^[mf]$|^$',
-        'Enter either m or f only.')
-    sex_names = {'m':'male', 'f':'female'}
-    if sex == '':
-        sex = 'm'
-    measuring_params = set_params_by_sex(sex_names[sex], use_settings_file,
-        params)
-
-    # The files_logged/skipped sets hold names of files which contain an
-    # interval that has been logged or skipped; the presence of a filename in
-    # either does not imply that *all* its intervals were either logged or
-    # skipped.
-    intervals_logged_count = 0
-    intervals_skipped_count = 0
-    files_logged = set()
-    files_skipped = set()
-
-    for sound_key, sound in enumerate(sounds):
-
-        for interval_no, interval_position in enumerate(sound['interval_positions']):
-
-            user_accepted = False
-
-            sound_file_name = sound['name'] +  sound_extension
-            textgrid_file_name = sound['name'] + textgrid_extension
-
-            # Keep processing this interval until the user accepts or skips it.
-            while not user_accepted:
-
-                print('\nFilename:     ' + sound_file_name)
-                print('Sound no.:    {0}/{1}'.format(sound_key + 1, len(sounds)))
-                print('Interval no.: {0}/{1}'.format(
-                    interval_no + 1,
-                    len(sound['interval_positions'])
-                    ))
-
-                # Prepare command-line arguments for sendpraat program to pass
-                # to Praat.
-                praat_arguments = [
-                    os.path.join(data_directory, sound_file_name),
-                    os.path.join(data_directory, textgrid_file_name),
-                    str(interval_position),
-                    textgrid_tier,
-                    spectrogram_window_length,
-                    play_sound,
-                    measuring_params['f1_reference'],
-                    measuring_params['f2_reference'],
-                    measuring_params['f3_reference'],
-                    measuring_params['f4_reference'],
-                    measuring_params['f5_reference'],
-                    measuring_params['frequency_cost'],
-                    measuring_params['bandwidth_cost'],
-                    measuring_params['transition_cost'],
-                    temporary_file_name
-                    ]
-                praat_arguments = ' '.join(praat_arguments)
-                # sendpraat needs to go through shell, and to give full path of
-                # script for execution.
-
-                if not os.path.exists(sendpraat_path):
-                    sys.exit(
-                        "Error: sendpraat cannot be found at {0}.".
-                        format(sendpraat_path)
-                    )
-
-                if not os.path.exists(praat_script_path):
-                    sys.exit(
-                        "Error: Praat script cannot be found at {0}.".
-                        format(praat_script_path)
-                    )
-
-                path_parts = os.path.abspath(__file__).split(os.sep)
-                script_path = os.sep.join(path_parts[:-1])
-                subprocess_return = subprocess.call(
-                    '{0} praat "execute {1} {2}"'.format(
-                        sendpraat_path,
-                        os.path.join(script_path, praat_script_path),
-                        praat_arguments
-                        ),
-                        shell=True
-                    )
-
-                if subprocess_return != 0:
-                    sys.exit('Error: could not run Praat script properly.')
-
-                user_input = get_user_input(
-                    'Log formants (enter), skip interval (s), ' +
-                    'change settings (c) or quit (q): ', '^[cqs]$|^$'
-                    )
-
-                # Don't log this interval; move onto the next.
-                if user_input == 's':
-                    intervals_skipped_count +=1
-                    files_skipped.update([sound_file_name])
-                    break
-
-                # Change a setting.
-                elif user_input == 'c':
-
-                    # Keep going until user types <enter> alone.
-                    while user_input != '':
-                        print('\nSex: ' + sex_names[sex])
-
-                        # Show enumerated list of settings.
-                        param_count = str(len(measuring_params))
-                        param_refs = ['']
-                        i = 0
-                        for key in sorted(measuring_params.keys()):
-                            i += 1
-                            param_refs.append(key)
-                            print('{0}. {1:<16} {2}'.format(i, key,
-                                measuring_params[key]))
-                        prompt = (
-                            'Change setting (1-{0}), '.format(param_count) +
-                            'reload defaults by sex (m/f) or accept settings '
-                            + '(enter): '
-                            )
-                        validation = '^[1-{0}]$|^[mf]$|$'.format(param_count)
-                        user_input = get_user_input(prompt, validation)
-
-                        # User has chosen to reload defaults according to sex.
-                        if re.match('^[m|f]$', user_input):
-                            measuring_params = set_params_by_sex(
-                                sex_names[user_input], use_settings_file, params
-                                )
-                            print("Defaults for {0} reloaded.\n".format(
-                                sex_names[user_input]
-                                ),)
-                            if use_settings_file:
-                                print('from {0}'.format(settings_file))
-                            sex = user_input
-
-                        # User has chosen a particular setting to change.
-                        elif re.match('^[1-{0}]$'.format(param_count), user_input):
-                            param_key = int(user_input)
-                            setting_name = param_refs[param_key]
-                            setting_value = measuring_params[param_refs[param_key]]
-                            prompt = (
-                                "Type new value for {0}, ".format(setting_name) +
-                                "or (enter) for previous value '{1}': ".
-                                format(setting_name, setting_value)
-                                )
-                            user_input = get_user_input(
-                                prompt, '^[0-{0}]+$|^$'.format(param_count),
-                                'Type a number or press <enter>.'
-                                )
-                            if user_input == '':
-                                user_input = setting_value
-                            measuring_params[param_refs[param_key]] = user_input
-
-                        # User has accepted changes to settings.
-                        else:
-                            print('Settings accepted.')
-
-                # Quit
-                elif user_input =='q':
-                    print(final_report(
-                        intervals_logged_count, len(files_logged),
-                        intervals_skipped_count,
-                        len(files_skipped)
-                        ))
-                    sys.exit('Script terminated by user.')
-
-                # Current measurements OK; log the formants.
-                else:
-                    # Get measurements from Praat temp file
-                    try:
-                        lines_from_praat = [
-                            line.strip() for line
-                            in open(temporary_file_name)
-                            ]
-                    except EnvironmentError:
-                        sys.exit('Error: Praat output file {0} not found.'.
-                            format(temporary_file_name))
-
-                    # Add a line with these measurements to the
-                    # output file.
-                    try:
-                        with open(output_path, 'a') as fout:
-                            write_line = (
-                                lines_from_praat[0],
-                                interval_label,
-                                spectrogram_window_length,
-                                textgrid_tier,
-                                measuring_params['f1_reference'],
-                                measuring_params['f2_reference'],
-                                measuring_params['f3_reference'],
-                                measuring_params['f4_reference'],
-                                measuring_params['f5_reference'],
-                                measuring_params['frequency_cost'],
-                                measuring_params['bandwidth_cost'],
-                                measuring_params['transition_cost'],
-                                time.strftime('%Y/%m/%d %H:%M:%S')
-                                )
-                            fout.write('\t'.join(write_line) + '\n')
-                    except EnvironmentError:
-                        sys.exit('Error: Could not write to output file {0}.'.
-                            format(output_path))
-                    else:
-                        files_logged.update([sound_file_name])
-                        user_accepted = True
-                        print('Formants logged.')
-                        intervals_logged_count +=1
-
-    # Output report.
-    report_text = final_report(intervals_logged_count, len(files_logged),
-        intervals_skipped_count, len(files_skipped))
-    print('\n' + report_text)
-
-    # Remove temporary file
-    if os.path.isfile(temporary_file_name):
-        os.remove(temporary_file_name)
-
-if __name__ == '__main__':
-    main()
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# logformantsbylabel.py version 1.2
+# By Chris Norton, 2014–9.
+
+# Looks for sound files and associated textgrids (with matching names) in a
+# given directory, then uses the textgrids to locates intervals by a given label
+# in each sound file. On an interval-by-interval, file-by-file basis, passes the
+# locations to a Praat script (logformantsbylabel.praat) which displays formant
+# information. This Python script then picks up this information from Praat and
+# asks user if this should be logged, or if the formant measuring parameters
+# need to be changed and the analysis performed again. Values are logged in a
+# tab-separated text file.
+
+# Obviously these scripts requires Praat (www.fon.hum.uva.nl/praat/) to be
+# installed. They also require the interface program sendpraat
+# (www.fon.hum.uva.nl/praat/sendpraat.html), which is used to send commands from
+# Python to Praat.
+
+# For information about settings and options, see the documentation in
+# logformantsbylabel_man.txt.
+
+import argparse
+import glob
+import hashlib
+import itertools
+import multiprocessing
+import os
+import sys
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+import columnarlog
+import corpusmanifest
+import formanttracker
+import logsummary
+import prefetcher
+import resultstore
+import speakerprofiles
+import stagetimer
+import trackquality
+import trajectorylog
+
+if sys.version_info.major < 3:
+    sys.exit('This program requires Python 3 or newer.')
+
+settings_file = 'settings.cfg'
+
+# These parameters will be used if the script is run with the -i or
+# --ignore_settings_file flag is set. Otherwise, parameters will be pulled from
+# the above settings file (or a user-specified settings file when the script is
+# run with -s or --settings_file).
+default_params = {}
+default_params['analysis_cache_name'] = 'formant_cache'
+default_params['analysis_cache_size'] = '1000'
+default_params['bandwidth_cost'] = {'male': '1', 'female': '1'}
+default_params['columnar_output'] = 'False'
+default_params['data_directory'] = 'Data'
+default_params['f1_reference'] = {'male': '5000', 'female': '5500'}
+default_params['f2_reference'] = {'male': '1485', 'female': '1650'}
+default_params['f3_reference'] = {'male': '2475', 'female': '2750'}
+default_params['f4_reference'] = {'male': '3465', 'female': '3850'}
+default_params['f5_reference'] = {'male': '4455', 'female': '4950'}
+default_params['frequency_cost'] = {'male': '1', 'female': '1'}
+default_params['interval_label'] = 'V'
+default_params['manifest_name'] = 'formant_manifest.db'
+default_params['measuring_engine'] = 'praat'
+default_params['metrics_file_name'] = 'formant_metrics.txt'
+default_params['output_file_name'] = 'formant_tenths.txt'
+default_params['play_sound'] = 'True'
+default_params['prefetch_intervals'] = '2'
+default_params['profiles_file_name'] = 'speaker_profiles.txt'
+default_params['quality_threshold'] = '0'
+default_params['praat_batch_script_path'] = 'logformantsbylabel_batch.praat'
+default_params['praat_path'] = 'praat'
+default_params['praat_script_path'] = 'getformantsbylabel.praat'
+default_params['result_store_name'] = 'formant_tenths.db'
+default_params['sendpraat_path'] = 'sendpraat'
+default_params['sound_extension'] = '.wav'
+default_params['speaker_pattern'] = ''
+default_params['spectrogram_window_length'] = '0.005'
+default_params['temporary_file_name'] = 'praat_output.tmp'
+default_params['textgrid_extension'] = '.TextGrid'
+default_params['textgrid_tier'] = '1'
+default_params['trajectory_output'] = 'False'
+default_params['transition_cost'] = {'male': '1', 'female': '1'}
+default_params['watch_interval'] = '10'
+default_params['window_margin'] = '0.5'
+default_params['windowed_loading'] = 'False'
+
+# Largest number of intervals from one sound file measured as a single job in
+# batch mode, so that files with many intervals can be shared between worker
+# processes.
+intervals_per_job = 50
+
+# Numbers for the runs of the Praat script, so that each run's message can be
+# told apart from an earlier one left in the temporary file.
+praat_job_numbers = itertools.count(1)
+
+# Files kept in the review directory by --precompute: the lines measured,
+# waiting to be reviewed, and the decisions made about them by --review.
+# Images are kept beside them.
+review_file_name = 'review.txt'
+decisions_file_name = 'decisions.txt'
+# File kept in the review directory by --precompute with quality scoring: the
+# quality measures and score of every interval measured, and whether it was
+# logged straight away or left for review.
+quality_file_name = 'quality.txt'
+
+# Names of the sexes that settings are given for.
+sex_names = {'m': 'male', 'f': 'female'}
+
+# Summarise what has been logged and/or skipped.
+def final_report(intervals_logged_count, files_logged_count,
+    intervals_skipped_count, files_skipped_count):
+
+    report_text = []
+
+    if intervals_logged_count > 0:
+        report_text.append(
+            '{0} intervals in {1} files logged.'.
+            format(intervals_logged_count, files_logged_count)
+            )
+    else:
+        report_text.append('No intervals logged.')
+
+    if intervals_skipped_count > 0:
+        report_text.append(
+            '{0} intervals in {1} files skipped.\n'.
+            format(intervals_skipped_count, files_skipped_count)
+        )
+
+    return '\n'.join(report_text)
+
+# Dictionary of files in a given directory for a given extension.
+def get_files_by_ext(directory, extension):
+    files = []
+    if not os.path.isdir(directory):
+        sys.exit("Error: directory {0} not found.".format(directory))
+
+    for f in os.listdir(directory):
+        if f.endswith(extension):
+            files.append({'name': os.path.splitext(f)[0]})
+    return files
+
+# Read a --shard argument, 'i/N', as (i, N).
+def parse_shard(text):
+    match = re.match(r'^(\d+)/(\d+)$', text)
+    if match is None or \
+        not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise argparse.ArgumentTypeError(
+            "shard must be given as i/N, with i from 1 to N")
+    return int(match.group(1)), int(match.group(2))
+
+# Number (counting from 1) of the shard a sound file belongs to, out of
+# shard_count. It's worked out from the file's name alone, so every machine
+# agrees on it, and files stay in the same shard as the corpus grows. Whole
+# files are shared out, rather than intervals, so each file is only analysed on
+# one machine.
+def sound_shard(sound_name, shard_count):
+    digest = hashlib.md5(sound_name.encode('utf-8')).hexdigest()
+    return int(digest, 16) % shard_count + 1
+
+# Name of a shard's own copy of a file: for shard 2 of 4, formant_tenths.txt
+# becomes formant_tenths.shard-2-of-4.txt.
+def shard_file_name(file_name, shard):
+    stem, extension = os.path.splitext(file_name)
+    return '{0}.shard-{1}-of-{2}{3}'.format(stem, shard[0], shard[1],
+        extension)
+
+# Return user input, validated by regexp.
+def get_user_input(prompt, validation_rule='', validation_error=''):
+
+    user_input = ''
+    input_valid = False
+
+    while input_valid == False:
+        try:
+            user_input = input(prompt)
+        except KeyboardInterrupt:
+            sys.exit('\nScript terminated by keystroke.')
+
+        # If there’s a validation regexp, check it.
+        if len(validation_rule) > 0:
+            if re.match(validation_rule, user_input):
+                input_valid = True
+            else:
+                input_valid = False
+                print('Invalid input. ' + validation_error)
+        else:
+            input_valid = True
+
+    return user_input
+
+# Some of the parameters have different defaults for either male or female sex.
+# Set current parameters to sex provided.
+def set_params_by_sex(sex, use_settings_file, params):
+
+    new_params = {}
+
+    # The defaults taken from the settings file should have values for the
+    # different sexes in format "male_f1_reference: 5000" &
+    # "female_f1_reference: 5500".
+    if use_settings_file:
+        for formant in range(1,6):
+            param_name = 'f{0}_reference'.format(formant)
+            new_params[param_name] = params[sex + '_' + param_name]
+        new_params['frequency_cost'] = params[sex + '_frequency_cost']
+        new_params['bandwidth_cost'] = params[sex + '_bandwidth_cost']
+        new_params['transition_cost'] = params[sex + '_transition_cost']
+
+    # Default hard-coded settings store values for the sexes in dictionaries:
+    # "default_params['f1_reference'] = {'male': '5000', 'female': '5500'}"
+    else:
+        for formant in range(1,6):
+            param_name = 'f{0}_reference'.format(formant)
+            new_params[param_name] = params[param_name][sex]
+        new_params['frequency_cost'] = params['frequency_cost'][sex]
+        new_params['bandwidth_cost'] = params['bandwidth_cost'][sex]
+        new_params['transition_cost'] = params['transition_cost'][sex]
+
+    return new_params
+
+# Let the user change the tracking settings one at a time, or reload the
+# defaults for either sex, until they accept them. Returns the settings, the
+# sex and whether the defaults were reloaded.
+def change_settings(measuring_params, sex, use_settings_file, params):
+    reloaded = False
+    user_input = None
+
+    # Keep going until user types <enter> alone.
+    while user_input != '':
+        print('\nSex: ' + sex_names[sex])
+
+        # Show enumerated list of settings.
+        param_count = str(len(measuring_params))
+        param_refs = ['']
+        i = 0
+        for key in sorted(measuring_params.keys()):
+            i += 1
+            param_refs.append(key)
+            print('{0}. {1:<16} {2}'.format(i, key, measuring_params[key]))
+        prompt = (
+            'Change setting (1-{0}), '.format(param_count) +
+            'reload defaults by sex (m/f) or accept settings (enter): '
+            )
+        validation = '^[1-{0}]$|^[mf]$|$'.format(param_count)
+        user_input = get_user_input(prompt, validation)
+
+        # User has chosen to reload defaults according to sex.
+        if re.match('^[m|f]$', user_input):
+            measuring_params = set_params_by_sex(sex_names[user_input],
+                use_settings_file, params)
+            reloaded = True
+            print("Defaults for {0} reloaded.\n".format(
+                sex_names[user_input]
+                ),)
+            if use_settings_file:
+                print('from {0}'.format(settings_file))
+            sex = user_input
+
+        # User has chosen a particular setting to change.
+        elif re.match('^[1-{0}]$'.format(param_count), user_input):
+            param_key = int(user_input)
+            setting_name = param_refs[param_key]
+            setting_value = measuring_params[param_refs[param_key]]
+            prompt = (
+                "Type new value for {0}, ".format(setting_name) +
+                "or (enter) for previous value '{1}': ".
+                format(setting_name, setting_value)
+                )
+            user_input = get_user_input(
+                prompt, '^[0-{0}]+$|^$'.format(param_count),
+                'Type a number or press <enter>.'
+                )
+            if user_input == '':
+                user_input = setting_value
+            measuring_params[param_refs[param_key]] = user_input
+
+        # User has accepted changes to settings.
+        else:
+            print('Settings accepted.')
+
+    return measuring_params, sex, reloaded
+
+# Read a sweep file, giving sets of measuring settings to try. It's written
+# like the settings file, but each line gives a comma-separated list of values
+# for one of the tracking settings, e.g. "f1_reference: 450, 500, 550". Every
+# combination of the values listed is tried. Blank lines separate grids of
+# combinations, so a list of particular sets can be given as several grids of
+# one value each. Returns a list of grids, each a list of (setting, values).
+def read_sweep_file(file_path):
+    try:
+        lines = [line.strip() for line in open(file_path)]
+    except EnvironmentError:
+        sys.exit('Error: Sweep file {0} not found.'.format(file_path))
+
+    grids = []
+    grid = []
+    for line in lines + ['']:
+        if len(line) == 0:
+            if len(grid) > 0:
+                grids.append(grid)
+                grid = []
+            continue
+        if line[0] == '#':
+            continue
+        parts = line.split(':', 1)
+        key = parts[0].strip()
+        if key not in trajectorylog.tracking_columns or len(parts) < 2:
+            sys.exit('Error: {0} in sweep file {1} is not a tracking setting.'.
+                format(key, file_path))
+        values = [value.strip() for value in parts[1].split(',')]
+        for value in values:
+            try:
+                float(value)
+            except ValueError:
+                sys.exit('Error: {0} in sweep file {1} is not a number.'.
+                    format(value, file_path))
+        grid.append((key, values))
+    if len(grids) == 0:
+        sys.exit('Error: no settings in sweep file {0}.'.format(file_path))
+    return grids
+
+# Every set of measuring settings given by the grids of a sweep file, with
+# settings not swept taken from measuring_params. Repeated sets are left out.
+def sweep_parameter_sets(grids, measuring_params):
+    parameter_sets = []
+    seen = set()
+    for grid in grids:
+        keys = [key for key, values in grid]
+        for combination in itertools.product(
+            *[values for key, values in grid]):
+            parameter_set = dict(measuring_params)
+            parameter_set.update(zip(keys, combination))
+            set_key = tuple(sorted(parameter_set.items()))
+            if set_key not in seen:
+                seen.add(set_key)
+                parameter_sets.append(parameter_set)
+    return parameter_sets
+
+# Table comparing an interval's measurements with each set of settings in a
+# sweep: the settings that differ between sets, then F1, F2 and F3 at the
+# middle of the interval.
+def format_sweep_table(sweep_results):
+    varying = [
+        key for key in trajectorylog.tracking_columns
+        if len(set(params[key] for params, line in sweep_results)) > 1
+        ]
+    lines = ['\t'.join(['No.'] + varying + ['F1_50%', 'F2_50%', 'F3_50%'])]
+    for set_no, (params, measurement_line) in enumerate(sweep_results):
+        # Values start after the sound name and interval position; 50% is the
+        # sixth tenth point.
+        values = measurement_line.split('\t')[2:]
+        lines.append('\t'.join(
+            [str(set_no + 1)] + [params[key] for key in varying] +
+            values[15:18]
+            ))
+    return '\n'.join(lines)
+
+# Table of a line of measurements like the one logformantsbylabel.praat prints
+# in the Praat info window.
+def format_measurement_table(measurement_line):
+    # Values start after the sound name and interval position, and run F1, F2,
+    # F3 for each tenth point in turn.
+    values = measurement_line.split('\t')[2:35]
+    lines = ['\t' + '\t'.join(
+        '{0}%'.format(percent * 10) for percent in range(len(values) // 3)
+        )]
+    for formant in range(3):
+        lines.append('F{0}\t'.format(formant + 1) +
+            '\t'.join(values[formant::3]))
+    return '\n'.join(lines)
+
+# Short key for naming objects kept in Praat between runs of the Praat script.
+def praat_object_key(*parts):
+    key = '|'.join(str(part) for part in parts)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()[:12]
+
+# Key for the objects Praat keeps for a sound file. It changes if the file is
+# modified.
+def praat_sound_key(sound_path):
+    return praat_object_key(os.path.abspath(sound_path),
+        os.path.getmtime(sound_path))
+
+# An argument of a command sent to Praat through sendpraat. Praat splits the
+# command at spaces, so an argument with spaces in it (such as a file path) is
+# put in double quotes, with any double quotes in it doubled.
+def praat_argument(argument):
+    argument = str(argument)
+    if argument == '' or ' ' in argument or '"' in argument:
+        return '"' + argument.replace('"', '""') + '"'
+    return argument
+
+# Run logformantsbylabel.praat in the open Praat session through sendpraat, and
+# return the line of measurements it sends back in the temporary file. With
+# prepare_only, Praat just loads and analyses the sound file, ready for a later
+# run, and nothing is returned. Praat's objects for keep_sound_path (if given)
+# are kept as well as this file's. If window is given, only that part of the
+# sound file (a pair of times) is loaded and analysed. If timer (a
+# stagetimer.StageTimer) is given, the run of sendpraat, the stages timed by
+# the Praat script and the reading of its message are added to it.
+def measure_with_praat(sound_path, textgrid_path, interval_position,
+    textgrid_tier, spectrogram_window_length, play_sound, measuring_params,
+    sendpraat_path, praat_script_path, temporary_file_name,
+    prepare_only=False, keep_sound_path=None, window=None, timer=None):
+
+    # Praat keeps the objects it has analysed from the sound file until it's
+    # asked about a different file, so only tracking needs to be redone when
+    # just the tracking settings change.
+    sound_key = praat_sound_key(sound_path)
+    if keep_sound_path is not None:
+        keep_key = praat_sound_key(keep_sound_path)
+    else:
+        keep_key = '-'
+    tracking_key = praat_object_key(*[
+        measuring_params[key] for key in sorted(measuring_params.keys())
+        ])
+    job_id = '{0}-{1}'.format(os.getpid(), next(praat_job_numbers))
+    if window is None:
+        window = (0, 0)
+
+    # Prepare command-line arguments for sendpraat program to pass to Praat.
+    praat_arguments = [
+        sound_path,
+        textgrid_path,
+        str(interval_position),
+        textgrid_tier,
+        spectrogram_window_length,
+        play_sound,
+        measuring_params['f1_reference'],
+        measuring_params['f2_reference'],
+        measuring_params['f3_reference'],
+        measuring_params['f4_reference'],
+        measuring_params['f5_reference'],
+        measuring_params['frequency_cost'],
+        measuring_params['bandwidth_cost'],
+        measuring_params['transition_cost'],
+        temporary_file_name,
+        sound_key,
+        tracking_key,
+        '1' if prepare_only else '0',
+        keep_key,
+        job_id,
+        '{0:.3f}'.format(window[0]),
+        '{0:.3f}'.format(window[1])
+        ]
+    praat_arguments = ' '.join(praat_argument(argument)
+        for argument in praat_arguments)
+    # sendpraat needs the full path of the script for execution.
+
+    if not os.path.exists(sendpraat_path):
+        sys.exit(
+            "Error: sendpraat cannot be found at {0}.".
+            format(sendpraat_path)
+        )
+
+    if not os.path.exists(praat_script_path):
+        sys.exit(
+            "Error: Praat script cannot be found at {0}.".
+            format(praat_script_path)
+        )
+
+    path_parts = os.path.abspath(__file__).split(os.sep)
+    script_path = os.sep.join(path_parts[:-1])
+    # No shell is needed; the Praat command goes to sendpraat as one argument.
+    started = time.perf_counter()
+    try:
+        subprocess_return = subprocess.call([
+            sendpraat_path,
+            'praat',
+            'execute {0} {1}'.format(
+                praat_argument(os.path.join(script_path, praat_script_path)),
+                praat_arguments
+                )
+            ])
+    except EnvironmentError:
+        sys.exit("Error: could not run sendpraat at {0}.".
+            format(sendpraat_path))
+    if timer is not None:
+        timer.add('sendpraat', time.perf_counter() - started)
+
+    if subprocess_return != 0:
+        sys.exit('Error: could not run Praat script properly.')
+
+    if prepare_only:
+        return None
+
+    return read_praat_message(temporary_file_name, job_id, timer)
+
+# Read the message a run of logformantsbylabel.praat has left in the temporary
+# file: a line of the job id, 'ok' or 'error', and then either the line of
+# measurements or a description of the error. Return the line of
+# measurements. After an 'ok' line comes a line of the job id, 'timings' and
+# pairs of stage and seconds, which are added to timer if given.
+def read_praat_message(temporary_file_name, job_id, timer=None):
+    started = time.perf_counter()
+    try:
+        with open(temporary_file_name) as fin:
+            message = fin.readline().rstrip('\r\n').rstrip('\t')
+            timings = fin.readline().rstrip('\r\n').split('\t')
+    except EnvironmentError:
+        message = ''
+        timings = []
+    fields = message.split('\t', 2)
+
+    # No message, or one left by an earlier run: the script stopped before
+    # the end, and Praat will have shown why.
+    if len(fields) < 3 or fields[0] != job_id:
+        sys.exit('Error: no result from Praat script; see the Praat window ' +
+            'for details.')
+    if fields[1] == 'error':
+        sys.exit('Error: Praat script: {0}.'.format(fields[2]))
+    if timer is not None:
+        timer.add('read_message', time.perf_counter() - started)
+        if timings[:2] == [job_id, 'timings']:
+            for stage, seconds in zip(timings[2::2], timings[3::2]):
+                timer.add(stage, float(seconds))
+    return fields[2]
+
+# Run logformantsbylabel_batch.praat headless (praat --run) to measure all the
+# given intervals of one sound file in one go, tracking formants with each of
+# parameter_sets (a list of measuring_params). Returns a (measuring_params,
+# line of measurements) pair for each interval and set of settings. If
+# window_margin is given, each interval is analysed from just the part of the
+# sound around it. If image_prefix is given, a picture of each interval,
+# drawn with spectrogram_window_length, is saved as image_prefix followed by
+# '_', the interval position and '.png'. If trajectory_prefix is given, nothing
+# is measured: tables of every formant frame are saved instead (see
+# praat_trajectories), and no lines are returned.
+def measure_with_praat_batch(sound_path, textgrid_path, interval_positions,
+    textgrid_tier, parameter_sets, praat_path, praat_batch_script_path,
+    temporary_file_name, window_margin=None, spectrogram_window_length=None,
+    image_prefix=None, trajectory_prefix=None):
+
+    if not os.path.exists(praat_batch_script_path):
+        sys.exit(
+            "Error: Praat script cannot be found at {0}.".
+            format(praat_batch_script_path)
+        )
+
+    # No shell is needed here, so arguments are passed to Praat as a list.
+    # Praat takes relative paths as relative to the script, so paths are made
+    # absolute.
+    praat_arguments = [
+        praat_path,
+        '--run',
+        praat_batch_script_path,
+        os.path.abspath(sound_path),
+        os.path.abspath(textgrid_path),
+        textgrid_tier,
+        ' '.join(
+            measuring_params[key] for measuring_params in parameter_sets
+            for key in trajectorylog.tracking_columns
+            ),
+        os.path.abspath(temporary_file_name),
+        ' '.join(str(position) for position in interval_positions),
+        'no' if window_margin is None else 'yes',
+        '0' if window_margin is None else str(window_margin),
+        spectrogram_window_length or '0',
+        os.path.abspath(image_prefix) if image_prefix else '-',
+        os.path.abspath(trajectory_prefix) if trajectory_prefix else '-'
+        ]
+    try:
+        subprocess_return = subprocess.call(praat_arguments)
+    except EnvironmentError:
+        sys.exit("Error: Praat cannot be found at {0}.".format(praat_path))
+
+    if subprocess_return != 0:
+        sys.exit('Error: could not run Praat script properly.')
+    if trajectory_prefix:
+        return []
+
+    # Each line starts with the number of its set of settings.
+    try:
+        lines_from_praat = [
+            line.strip().split('\t', 1) for line
+            in open(temporary_file_name)
+            if len(line.strip()) > 0
+            ]
+    except EnvironmentError:
+        sys.exit('Error: Praat output file {0} not found.'.
+            format(temporary_file_name))
+
+    return [
+        (parameter_sets[int(set_number) - 1], measurement_line)
+        for set_number, measurement_line in lines_from_praat
+        ]
+
+# Split the intervals to be measured in batch mode into jobs, each holding up
+# to intervals_per_job intervals from one sound file along with everything
+# needed to measure them, so that jobs can be run in worker processes.
+# image_directory (praat engine only) is where pictures of the intervals are
+# saved, if anywhere, and trajectory_directory where their full formant
+# trajectories are. If score_quality is True, each interval is given quality
+# measures and a score (see trackquality.py), with norm_params the settings
+# for the speakers' sex, whose reference frequencies the intervals are
+# compared with. analysis_cache (numpy engine
+# only) is the analysis cache to use, if any, which worker processes open for
+# themselves; each job takes the contents hash of its sound file from it
+# (worked out here if it isn't known yet, so it can be kept in the manifest),
+# so that workers don't read the whole file again to hash it.
+def make_batch_jobs(sounds, data_directory, sound_extension,
+    textgrid_extension, textgrid_tier, measuring_engine, parameter_sets,
+    praat_path, praat_batch_script_path, window_margin,
+    spectrogram_window_length=None, image_directory=None,
+    trajectory_directory=None, score_quality=False, analysis_cache=None,
+    norm_params=None):
+
+    cache_location = None
+    if analysis_cache is not None:
+        cache_location = (analysis_cache.directory, analysis_cache.size_limit)
+
+    jobs = []
+    for sound in sounds:
+        sound_path = os.path.join(data_directory,
+            sound['name'] + sound_extension)
+        sound_hash = None
+        if analysis_cache is not None:
+            analysis_cache.contents_hash(sound_path)
+            sound_hash = analysis_cache.hashes.get(sound_path)
+        for first in range(0, len(sound['interval_positions']),
+            intervals_per_job):
+            last = first + intervals_per_job
+            jobs.append({
+                'sound_name': sound['name'],
+                'sound_path': sound_path,
+                'textgrid_path': os.path.join(
+                    data_directory, sound['name'] + textgrid_extension
+                    ),
+                'interval_positions': sound['interval_positions'][first:last],
+                'interval_times': sound['interval_times'][first:last],
+                'textgrid_tier': textgrid_tier,
+                'measuring_engine': measuring_engine,
+                'parameter_sets': sound.get('parameter_sets',
+                    parameter_sets),
+                'praat_path': praat_path,
+                'praat_batch_script_path': praat_batch_script_path,
+                'window_margin': window_margin,
+                'spectrogram_window_length': spectrogram_window_length,
+                'image_directory': image_directory,
+                'trajectory_directory': trajectory_directory,
+                'score_quality': score_quality,
+                'norm_params': norm_params,
+                'analysis_cache': cache_location,
+                'sound_hash': sound_hash
+                })
+    return jobs
+
+# The sets of settings a batch job tracks formants with: its parameter_sets,
+# then, if its intervals are to be scored, each set with the reference
+# frequencies moved up and down (see trackquality.py).
+def job_parameter_sets(job):
+    parameter_sets = list(job['parameter_sets'])
+    if job['score_quality']:
+        for measuring_params in job['parameter_sets']:
+            parameter_sets += trackquality.perturbed_parameter_sets(
+                measuring_params)
+    return parameter_sets
+
+# Read the tables of formant frames saved by logformantsbylabel_batch.praat for
+# a batch job, named by table_prefix. Returns what
+# formanttracker.track_sound_sweep does for each analysis (the whole sound
+# file, or the part around each interval with a window margin), after the
+# numbers of the job's intervals it covers.
+def praat_trajectories(job, table_prefix):
+    if job['window_margin'] is not None:
+        parts = [
+            ([interval_no], str(interval_position))
+            for interval_no, interval_position in
+            enumerate(job['interval_positions'])
+            ]
+    else:
+        parts = [(range(len(job['interval_positions'])), 'all')]
+
+    analyses = []
+    for interval_nos, part in parts:
+        times, frequencies, bandwidths = \
+            trajectorylog.read_praat_formant_table('{0}_{1}_0.txt'.format(
+                table_prefix, part), trajectorylog.number_of_formants)
+        tracks = [
+            trajectorylog.read_praat_formant_table(
+                '{0}_{1}_{2}.txt'.format(table_prefix, part, set_no),
+                trajectorylog.number_of_tracks
+                )[1:]
+            for set_no in range(1, len(job_parameter_sets(job)) + 1)
+            ]
+        analyses.append((interval_nos, times, frequencies, bandwidths, tracks))
+    return analyses
+
+# The same for the numpy engine, analysing the sound file with
+# formanttracker.py.
+def numpy_trajectories(job):
+    parameter_sets = job_parameter_sets(job)
+    if job['window_margin'] is None:
+        return [(range(len(job['interval_positions'])),) +
+            formanttracker.track_sound_sweep(job['sound_path'],
+                parameter_sets)]
+    return [
+        ([interval_no],) + formanttracker.track_sound_sweep(job['sound_path'],
+            parameter_sets, start_time - job['window_margin'],
+            end_time + job['window_margin'])
+        for interval_no, (start_time, end_time) in
+        enumerate(job['interval_times'])
+        ]
+
+# Put together the trajectories of a batch job's intervals, in the order of
+# interval and then set of settings, from the analyses given by
+# praat_trajectories or numpy_trajectories. track_numbers says which of each
+# analysis's tracks to take for each of parameter_sets. Returns the
+# measuring_params of each interval and set, and the joined trajectories.
+def job_trajectories(job, analyses, parameter_sets, track_numbers):
+    intervals = [[] for interval_position in job['interval_positions']]
+    for interval_nos, times, frequencies, bandwidths, tracks in analyses:
+        for interval_no in interval_nos:
+            interval_position = job['interval_positions'][interval_no]
+            start_time, end_time = job['interval_times'][interval_no]
+            frames = trajectorylog.interval_frames(times, start_time, end_time)
+            for measuring_params, track_no in zip(parameter_sets,
+                track_numbers):
+                tracked_frequencies, tracked_bandwidths = tracks[track_no]
+                intervals[interval_no].append({
+                    'measuring_params': measuring_params,
+                    'sound_name': job['sound_name'],
+                    'tracking_settings': [
+                        measuring_params[key]
+                        for key in trajectorylog.tracking_columns
+                        ],
+                    'interval_position': interval_position,
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'time': times[frames],
+                    'frequencies': frequencies[frames],
+                    'bandwidths': bandwidths[frames],
+                    'tracked_frequencies': tracked_frequencies[frames],
+                    'tracked_bandwidths': tracked_bandwidths[frames]
+                    })
+    intervals = [interval for sets in intervals for interval in sets]
+    return ([interval['measuring_params'] for interval in intervals],
+        trajectorylog.join_trajectories(intervals))
+
+# Name of the file a batch job's trajectories are saved in: the sound file,
+# the first interval and a key of the job's settings, so that measuring the
+# same intervals with other settings (in another sweep, or with a profile)
+# doesn't overwrite the trajectories found with these.
+def trajectory_file_name(job):
+    settings_key = praat_object_key(*[
+        measuring_params[key]
+        for measuring_params in job['parameter_sets']
+        for key in trajectorylog.tracking_columns
+        ])
+    return '{0}_{1}_{2}.npz'.format(image_file_stem(job['sound_name']),
+        job['interval_positions'][0], settings_key)
+
+# Results of a batch job measured from full trajectories, given the analyses
+# from praat_trajectories or numpy_trajectories. If the job has a
+# trajectory_directory, the trajectories are saved there (see
+# trajectory_file_name). Returns a (measuring_params, line of measurements)
+# pair for each interval and set of settings, with the values at tenths worked
+# out from the trajectories, and, if the job's intervals are to be scored, a
+# dictionary of quality measures and score for each (otherwise None).
+def trajectory_results(job, analyses):
+    set_count = len(job['parameter_sets'])
+    line_params, trajectories = job_trajectories(job, analyses,
+        job['parameter_sets'], range(set_count))
+    if job['trajectory_directory']:
+        trajectorylog.write_trajectories(os.path.join(
+            job['trajectory_directory'], trajectory_file_name(job)),
+            trajectories)
+    values = trajectorylog.resample_trajectories(trajectories, 11)
+    measurement_lines = [
+        (measuring_params, formanttracker.format_measurements(
+            job['sound_name'], interval_position, interval_values
+            ))
+        for measuring_params, interval_position, interval_values in zip(
+            line_params, trajectories['interval_position'], values)
+        ]
+    if not job['score_quality']:
+        return measurement_lines, None
+
+    # The tracks with perturbed settings follow the job's own, in
+    # job_parameter_sets order.
+    perturbed_values = []
+    perturbed_sets = job_parameter_sets(job)[set_count:]
+    factor_count = len(trackquality.perturbation_factors)
+    for factor_no in range(factor_count):
+        perturbed_params, perturbed = job_trajectories(job, analyses,
+            perturbed_sets[factor_no::factor_count],
+            range(set_count + factor_no, set_count * (factor_count + 1),
+                factor_count))
+        perturbed_values.append(
+            trajectorylog.resample_trajectories(perturbed, 11))
+    norms = [
+        float(job['norm_params']['f{0}_reference'.format(formant)])
+        for formant in range(1, 4)
+        ]
+    scores = trackquality.score_intervals(trajectories, values,
+        perturbed_values, norms)
+    qualities = [
+        dict((measure, float(scores[measure][line_no]))
+            for measure in trackquality.measures + ['score'])
+        for line_no in range(len(measurement_lines))
+        ]
+    return measurement_lines, qualities
+
+# Measure a batch job, returning a (measuring_params, line of measurements)
+# pair for each interval and set of settings, a dictionary of quality measures
+# for each if the job's intervals are to be scored (otherwise None), and an
+# error message (None if all went well). Errors are passed back rather than
+# exiting, as this may be running in a worker process. With the praat engine,
+# each job has its own temporary file, so workers don't overwrite each other's
+# results.
+def measure_job(job):
+    # Full trajectories are needed to save them or to score the intervals.
+    full_trajectories = bool(job['trajectory_directory'] or
+        job['score_quality'])
+    qualities = None
+    if job['analysis_cache'] is not None:
+        analysis_cache = formanttracker.use_analysis_cache(
+            *job['analysis_cache'])
+        if job['sound_hash'] is not None:
+            analysis_cache.remember_hash(job['sound_path'],
+                *job['sound_hash'])
+    try:
+        if job['measuring_engine'] == 'numpy' and full_trajectories:
+            measurement_lines, qualities = trajectory_results(job,
+                numpy_trajectories(job))
+        elif job['measuring_engine'] == 'numpy':
+            measurement_lines = []
+            values = formanttracker.measure_intervals_sweep(
+                job['sound_path'], job['interval_times'],
+                job['parameter_sets'], job['window_margin']
+                )
+            for interval_position, interval_values in zip(
+                job['interval_positions'], values):
+                for measuring_params, set_values in zip(
+                    job['parameter_sets'], interval_values):
+                    measurement_lines.append((measuring_params,
+                        formanttracker.format_measurements(
+                            job['sound_name'], interval_position, set_values
+                            )))
+        else:
+            handle, temporary_path = tempfile.mkstemp(
+                prefix='praat_output_', suffix='.tmp'
+                )
+            os.close(handle)
+            if job['image_directory']:
+                image_prefix = os.path.join(job['image_directory'],
+                    image_file_stem(job['sound_name']))
+            else:
+                image_prefix = None
+            # Praat saves tables of formant frames in a directory of their
+            # own, if full trajectories are needed.
+            if full_trajectories:
+                table_directory = tempfile.mkdtemp(prefix='praat_tables_')
+                table_prefix = os.path.join(table_directory, 'formant')
+            else:
+                table_directory = None
+                table_prefix = None
+            try:
+                measurement_lines = [
+                    (measuring_params,
+                        with_sound_name(measurement_line, job['sound_name']))
+                    for measuring_params, measurement_line in
+                    measure_with_praat_batch(
+                        job['sound_path'], job['textgrid_path'],
+                        job['interval_positions'], job['textgrid_tier'],
+                        job_parameter_sets(job), job['praat_path'],
+                        job['praat_batch_script_path'], temporary_path,
+                        job['window_margin'],
+                        job['spectrogram_window_length'], image_prefix,
+                        table_prefix
+                        )
+                    ]
+                if table_directory:
+                    measurement_lines, qualities = trajectory_results(job,
+                        praat_trajectories(job, table_prefix))
+            finally:
+                os.remove(temporary_path)
+                if table_directory:
+                    shutil.rmtree(table_directory, ignore_errors=True)
+    except SystemExit as error:
+        return [], None, str(error)
+    return measurement_lines, qualities, None
+
+# Yield each batch job with its (measuring_params, line of measurements) pairs
+# and quality measures, in the order of the jobs, running them in a pool of
+# worker processes if processes is more than 1.
+def run_batch_jobs(jobs, processes):
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            for job, (measurement_lines, qualities, error) in zip(
+                jobs, pool.imap(measure_job, jobs)):
+                if error is not None:
+                    sys.exit(error)
+                yield job, measurement_lines, qualities
+    else:
+        for job in jobs:
+            measurement_lines, qualities, error = measure_job(job)
+            if error is not None:
+                sys.exit(error)
+            yield job, measurement_lines, qualities
+
+# The next count intervals after interval interval_no of sound sound_no, as
+# (sound number, interval number) pairs, running on into the following sound
+# files.
+def upcoming_intervals(sounds, sound_no, interval_no, count):
+    upcoming = []
+    interval_no += 1
+    while sound_no < len(sounds) and len(upcoming) < count:
+        if interval_no < len(sounds[sound_no]['interval_positions']):
+            upcoming.append((sound_no, interval_no))
+            interval_no += 1
+        else:
+            sound_no += 1
+            interval_no = 0
+    return upcoming
+
+# Part of a sound file to load for an interval: window_margin seconds either
+# side of it, or None (the whole file) if window_margin is None.
+def analysis_window(start_time, end_time, window_margin):
+    if window_margin is None:
+        return None
+    return (max(start_time - window_margin, 0), end_time + window_margin)
+
+# Key for background work on an interval, which includes the measuring
+# settings so that work done with other settings isn't used.
+def prefetch_key(sound_path, interval_position, measuring_params):
+    return (sound_path, interval_position,
+        tuple(sorted(measuring_params.items())))
+
+# Start of the names of the pictures of a sound file's intervals saved by the
+# precompute phase. Sound files in subdirectories of the data directory have
+# the directories in their names, so that all the pictures can be kept in one
+# directory, with each / written as %2F (and % itself as %25, so that no two
+# sound files can end up with the same name).
+def image_file_stem(sound_name):
+    return sound_name.replace('%', '%25').replace('/', '%2F')
+
+# Name of the picture of an interval saved by the precompute phase.
+def image_file_name(sound_name, interval_position):
+    return '{0}_{1}.png'.format(image_file_stem(sound_name), interval_position)
+
+# Make an empty review directory for a new precompute phase, removing the
+# lines, decisions and pictures left by an earlier one.
+def clear_review_directory(review_directory):
+    if not os.path.isdir(review_directory):
+        try:
+            os.makedirs(review_directory)
+        except EnvironmentError:
+            sys.exit('Error: could not make review directory {0}.'.
+                format(review_directory))
+    for file_name in os.listdir(review_directory):
+        if file_name in (review_file_name, decisions_file_name) or \
+            file_name.endswith('.png'):
+            os.remove(os.path.join(review_directory, file_name))
+
+# Show a picture saved by the precompute phase in Praat's picture window,
+# through sendpraat.
+def show_image_in_praat(image_path, sendpraat_path):
+    try:
+        subprocess_return = subprocess.call([
+            sendpraat_path,
+            'praat',
+            'Erase all',
+            'Insert picture from file... {0} 0 7 0 8'.format(
+                praat_argument(os.path.abspath(image_path)))
+            ])
+    except EnvironmentError:
+        sys.exit("Error: could not run sendpraat at {0}.".
+            format(sendpraat_path))
+    if subprocess_return != 0:
+        sys.exit('Error: could not show picture {0} in Praat.'.
+            format(image_path))
+
+# A line of measurements from Praat, with the sound file named as it is in the
+# manifest. (Praat names the sound file without its directory.)
+def with_sound_name(measurement_line, sound_name):
+    return '\t'.join([sound_name] + measurement_line.split('\t')[1:])
+
+# Find where the intervals to measure are in each sound file's textgrid (from
+# the manifest, if the textgrid hasn't changed), and store their positions and
+# times in its entry in sounds. Only the given tier is searched. Interval
+# positions count from 1, as in Praat. If skip_logged_intervals is True,
+# intervals already in the result store are left out.
+def find_intervals(sounds, manifest, data_directory, textgrid_extension,
+    textgrid_tier, interval_label, store, skip_logged_intervals, timer):
+
+    for sound in sounds:
+        timer.set_interval(sound['name'])
+        with timer.stage('read_textgrid'):
+            intervals = manifest.intervals(data_directory,
+                sound['name'] + textgrid_extension, textgrid_tier,
+                interval_label)
+        logged_positions = store.logged_positions(sound['name'], textgrid_tier)
+        sound['interval_positions'] = []
+        sound['interval_times'] = []
+        for interval_position, start_time, end_time in intervals:
+            if skip_logged_intervals and interval_position in logged_positions:
+                continue
+            sound['interval_positions'].append(interval_position)
+            # Start and end times are needed by the numpy engine.
+            sound['interval_times'].append((start_time, end_time))
+    timer.set_interval()
+
+# Wait until sound files and their textgrids are added to the data directory
+# (or changed), checking every watch_interval seconds, and return entries for
+# them for the sounds list. Files are only returned once they have been left
+# alone for watch_interval seconds, so that ones still being copied in aren't
+# measured.
+def wait_for_new_sounds(manifest, data_directory, sound_extension,
+    textgrid_extension, watch_interval, timer):
+
+    pending = set()
+    while True:
+        time.sleep(watch_interval)
+        with timer.stage('scan_directory'):
+            changed = manifest.scan(data_directory,
+                (sound_extension, textgrid_extension))
+        for path in changed:
+            for extension in (sound_extension, textgrid_extension):
+                if path.endswith(extension):
+                    pending.add(path[:-len(extension)])
+
+        settled_time = time.time() - watch_interval
+        ready = []
+        for name in sorted(pending):
+            sound_info = manifest.file_info(name + sound_extension)
+            textgrid_info = manifest.file_info(name + textgrid_extension)
+            if sound_info is not None and textgrid_info is not None and \
+                max(sound_info[1], textgrid_info[1]) < settled_time:
+                ready.append(name)
+        if len(ready) > 0:
+            pending.difference_update(ready)
+            return [{'name': name} for name in ready]
+
+# Header line for the output file.
+def log_header():
+    header_line = ['Sound file', 'Interval position']
+    # Make formant tenth headers in format f1_10%, f2_10%, f3_10% etc.
+    for percentage in range (0, 11):
+        for formant_no in range(1, 4):
+            header_line.append(
+                'f{0}_{1}%'.format(formant_no, percentage * 10)
+                )
+    header_line += [
+        'interval_label', 'spectrogram_window_length', 'textgrid_tier',
+        'f1_reference', 'f2_reference', 'f3_reference', 'f4_reference',
+        'f5_reference', 'frequency_cost', 'bandwidth_cost',
+        'transition_cost', 'time_stamp'
+        ]
+    return '\t'.join(header_line) + '\n'
+
+# Line for the output file: a line of measurements followed by the settings
+# used to make them and a time stamp.
+def log_line(measurement_line, interval_label, spectrogram_window_length,
+    textgrid_tier, measuring_params):
+
+    write_line = (
+        measurement_line,
+        interval_label,
+        spectrogram_window_length,
+        textgrid_tier,
+        measuring_params['f1_reference'],
+        measuring_params['f2_reference'],
+        measuring_params['f3_reference'],
+        measuring_params['f4_reference'],
+        measuring_params['f5_reference'],
+        measuring_params['frequency_cost'],
+        measuring_params['bandwidth_cost'],
+        measuring_params['transition_cost'],
+        time.strftime('%Y/%m/%d %H:%M:%S')
+        )
+    return '\t'.join(write_line) + '\n'
+
+# The tracking settings a line of the output file (split into fields) was
+# measured with.
+def log_line_params(fields):
+    header = log_header().rstrip('\n').split('\t')
+    return dict(
+        (key, fields[header.index(key)])
+        for key in trajectorylog.tracking_columns
+        )
+
+# Read the command line arguments, checking that they can be used together.
+def parse_arguments():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--settings_file', action='store',
+        default=False, help='path to settings file')
+    parser.add_argument('-i', '--ignore_settings_file', action='store_true',
+        default=False, help='ignore settings file; use hard-coded settings')
+    parser.add_argument('-b', '--batch', action='store_true',
+        default=False, help='measure all intervals without prompting, ' +
+        'drawing or playing sound, and log them all')
+    parser.add_argument('--precompute', action='store_true',
+        default=False, help='measure all intervals without prompting, ' +
+        'saving them (and, with the praat engine, pictures of them) for ' +
+        '--review rather than logging them')
+    parser.add_argument('--review', action='store_true', default=False,
+        help='step through the intervals saved by --precompute, logging, ' +
+        'skipping or measuring again with changed settings each one')
+    parser.add_argument('--optimise', action='store_true', default=False,
+        help='find the best reference frequencies for each speaker and ' +
+        'save them as speaker profiles, then exit')
+    parser.add_argument('--sex', action='store', choices=['m', 'f'],
+        default='m', help='speaker sex for batch mode, --precompute, ' +
+        '--review and --optimise (default m)')
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=1,
+        help='number of worker processes for batch mode, --precompute and ' +
+        '--optimise (0 for one per CPU; default 1)')
+    parser.add_argument('--export_log', action='store', default=False,
+        metavar='PATH', help='write all logged measurements from the ' +
+        'result store to a new output file at PATH, then exit')
+    parser.add_argument('--export_columnar', action='store', default=False,
+        metavar='DIRECTORY', help='write all logged measurements from the ' +
+        'result store as columnar .npz shards in DIRECTORY, then exit')
+    parser.add_argument('--sweep', action='store', default=False,
+        metavar='FILE', help='also measure each interval with every set of ' +
+        'tracking settings given in sweep file FILE')
+    parser.add_argument('--watch', action='store_true', default=False,
+        help='with --batch or --precompute, keep watching the data ' +
+        'directory afterwards and measure new files as they arrive')
+    parser.add_argument('--shard', action='store', type=parse_shard,
+        default=None, metavar='I/N', help='measure only shard I of N of the ' +
+        'sound files, with its own output file, e.g. to share a corpus ' +
+        'between machines')
+    parser.add_argument('--merge_shards', action='store_true',
+        default=False, help='combine the output files of all shards into ' +
+        'the output file, then exit')
+    parser.add_argument('--summarise', action='store_true', default=False,
+        help='update the per-speaker and per-vowel summaries of the ' +
+        'output file and write them, with a normalised copy of it, then exit')
+    parser.add_argument('--profile', action='store_true', default=False,
+        help='time each stage of the work, write the timings to the ' +
+        'metrics file and summarise them at the end')
+    parser.add_argument('-v', '--version', action='version',
+        version='logformantsbylabel.py 1.1')
+    results = parser.parse_args()
+    if results.jobs < 0:
+        parser.error('--jobs must be 0 or more')
+    if results.jobs == 0:
+        results.jobs = multiprocessing.cpu_count()
+    if results.batch + results.precompute + results.review + \
+        results.optimise > 1:
+        parser.error('only one of --batch, --precompute, --review and ' +
+            '--optimise can be used')
+    # Batch mode, the precompute phase and optimising all measure everything
+    # without asking anything.
+    unattended = results.batch or results.precompute or results.optimise
+    if results.jobs > 1 and not unattended:
+        parser.error('--jobs can only be used with --batch, --precompute ' +
+            'or --optimise')
+    if results.watch and not (results.batch or results.precompute):
+        parser.error('--watch can only be used with --batch or --precompute')
+    if results.shard and results.merge_shards:
+        parser.error('--merge_shards can\'t be used with --shard')
+    if results.sweep and (results.precompute or results.review or
+        results.optimise):
+        parser.error('--sweep can\'t be used with --precompute, --review ' +
+            'or --optimise')
+    results.unattended = unattended
+    return results
+
+# Read the settings for a run from the settings file (or the defaults above),
+# as a dictionary shared by the modes. The files a run opens are added to it
+# by open_run.
+def read_settings(results):
+
+    global settings_file
+
+    use_settings_file = not results.ignore_settings_file
+    # If user has specified a different settings file, use that.
+    if results.settings_file:
+        settings_file = results.settings_file
+
+    print('logformantsbylabel.py\n(Chris Norton, 2014)\n')
+
+    # Grab parameters either from settings file, or from defaults set above.
+    if use_settings_file:
+        print('Using settings from {0}\n'.format(settings_file))
+        try:
+            lines = [line.strip() for line in open(settings_file)]
+        except EnvironmentError:
+            sys.exit('Error: Settings file {0} not found.'.format(settings_file))
+        params = {}
+        for line in lines:
+            if len(line) == 0 or line[0] == '#':
+                continue
+            parts = line.split(':', 1)
+            key = parts[0].strip()
+            value = parts[1].strip()
+            params[key] = value
+    else:
+        print('Using default settings from python script.\n')
+        params = default_params
+
+    # Set variables which user can't change during script.
+    data_directory = params['data_directory']
+    interval_label = params['interval_label']
+    output_file_name = params['output_file_name']
+    praat_script_path = params['praat_script_path']
+    sendpraat_path = params['sendpraat_path']
+    sound_extension = params['sound_extension']
+    spectrogram_window_length = params['spectrogram_window_length']
+    # Each run has its own temporary file, named after the machine and
+    # process, so that runs in the same directory (even on different machines
+    # sharing it) don't pick up each other's results.
+    temporary_stem, temporary_extension = os.path.splitext(
+        params['temporary_file_name'])
+    temporary_file_name = '{0}_{1}_{2}{3}'.format(temporary_stem,
+        socket.gethostname(), os.getpid(), temporary_extension)
+    textgrid_extension = params['textgrid_extension']
+    textgrid_tier = params['textgrid_tier']
+    result_store_name = params.get('result_store_name',
+        default_params['result_store_name'])
+    manifest_name = params.get('manifest_name',
+        default_params['manifest_name'])
+    metrics_file_name = params.get('metrics_file_name',
+        default_params['metrics_file_name'])
+    # Speaker profiles, and how to tell which speaker a sound file is from.
+    profiles_file_name = params.get('profiles_file_name',
+        default_params['profiles_file_name'])
+    speaker_pattern = params.get('speaker_pattern',
+        default_params['speaker_pattern'])
+    try:
+        re.compile(speaker_pattern)
+    except re.error:
+        sys.exit('Error: speaker_pattern {0} is not a regular expression.'.
+            format(speaker_pattern))
+    # A shard keeps its own output file, result store (so it resumes from its
+    # own work), manifest and metrics file, so shards running at the same time
+    # never write to the same file. The columnar copy and review directory are
+    # named after the output file, so are kept apart too.
+    if results.shard:
+        output_file_name = shard_file_name(output_file_name, results.shard)
+        result_store_name = shard_file_name(result_store_name, results.shard)
+        manifest_name = shard_file_name(manifest_name, results.shard)
+        metrics_file_name = shard_file_name(metrics_file_name, results.shard)
+    # Only needed for batch mode and sweeps, which run Praat directly rather
+    # than through sendpraat.
+    praat_path = params.get('praat_path', default_params['praat_path'])
+    praat_batch_script_path = params.get('praat_batch_script_path',
+        default_params['praat_batch_script_path'])
+    # Either 'praat' (measure through sendpraat and logformantsbylabel.praat)
+    # or 'numpy' (measure in this process with formanttracker.py).
+    measuring_engine = params.get('measuring_engine',
+        default_params['measuring_engine']).lower()
+    if measuring_engine not in ('praat', 'numpy'):
+        sys.exit("Error: measuring_engine must be 'praat' or 'numpy'.")
+    if measuring_engine == 'numpy':
+        formanttracker.check_numpy()
+    # Whether to write a columnar (.npz) copy of logged lines as well.
+    columnar_output = params.get('columnar_output',
+        default_params['columnar_output']).lower() == 'true'
+    columnar_directory = os.path.join(data_directory,
+        os.path.splitext(output_file_name)[0] + '_columns')
+    # Whether to save full formant trajectories in batch mode, and where.
+    trajectory_output = params.get('trajectory_output',
+        default_params['trajectory_output']).lower() == 'true'
+    trajectory_directory = os.path.join(data_directory,
+        os.path.splitext(output_file_name)[0] + '_trajectories')
+    # Where --precompute leaves its measurements and pictures for --review.
+    review_directory = os.path.join(data_directory,
+        os.path.splitext(output_file_name)[0] + '_review')
+    # With windowed loading, only each interval and window_margin seconds
+    # either side of it are loaded and analysed, rather than the whole file.
+    if params.get('windowed_loading',
+        default_params['windowed_loading']).lower() == 'true':
+        try:
+            window_margin = float(params.get('window_margin',
+                default_params['window_margin']))
+        except ValueError:
+            sys.exit('Error: window_margin must be a number of seconds.')
+        if window_margin < 0:
+            sys.exit('Error: window_margin must be a number of seconds.')
+    else:
+        window_margin = None
+    # How many intervals ahead to measure in the background while the user
+    # looks at the current one (0 for none).
+    try:
+        prefetch_intervals = int(params.get('prefetch_intervals',
+            default_params['prefetch_intervals']))
+    except ValueError:
+        sys.exit('Error: prefetch_intervals must be a whole number.')
+    # Where the numpy engine keeps its analyses of sound files between runs,
+    # and how big the cache can grow, in MB (0 for no cache).
+    analysis_cache_name = params.get('analysis_cache_name',
+        default_params['analysis_cache_name'])
+    try:
+        analysis_cache_size = float(params.get('analysis_cache_size',
+            default_params['analysis_cache_size']))
+    except ValueError:
+        sys.exit('Error: analysis_cache_size must be a number of MB.')
+    # With --precompute, intervals whose quality score (see trackquality.py)
+    # is below this are logged without review (0 to review everything).
+    try:
+        quality_threshold = float(params.get('quality_threshold',
+            default_params['quality_threshold']))
+    except ValueError:
+        sys.exit('Error: quality_threshold must be a number.')
+    # How often to look for new files with --watch, in seconds.
+    try:
+        watch_interval = float(params.get('watch_interval',
+            default_params['watch_interval']))
+    except ValueError:
+        sys.exit('Error: watch_interval must be a number of seconds.')
+    # Praat uses 1 or 0 for True/False
+    if params['play_sound'].lower() == 'true':
+        play_sound = '1'
+    else:
+        play_sound = '0'
+
+    if not os.path.isdir(data_directory):
+        sys.exit("Error: directory {0} not found.".format(data_directory))
+
+    # The batch Praat script is also used for sweeps in interactive mode.
+    path_parts = os.path.abspath(__file__).split(os.sep)
+    script_path = os.sep.join(path_parts[:-1])
+    praat_batch_script_path = os.path.join(script_path,
+        praat_batch_script_path)
+
+    return {
+        'use_settings_file': use_settings_file,
+        'params': params,
+        'data_directory': data_directory,
+        'interval_label': interval_label,
+        'output_file_name': output_file_name,
+        'output_path': os.path.join(data_directory, output_file_name),
+        'praat_script_path': praat_script_path,
+        'sendpraat_path': sendpraat_path,
+        'sound_extension': sound_extension,
+        'spectrogram_window_length': spectrogram_window_length,
+        'temporary_file_name': temporary_file_name,
+        'textgrid_extension': textgrid_extension,
+        'textgrid_tier': textgrid_tier,
+        'result_store_name': result_store_name,
+        'manifest_name': manifest_name,
+        'metrics_file_name': metrics_file_name,
+        'profiles_path': os.path.join(data_directory, profiles_file_name),
+        'speaker_pattern': speaker_pattern,
+        'praat_path': praat_path,
+        'praat_batch_script_path': praat_batch_script_path,
+        'measuring_engine': measuring_engine,
+        'columnar_output': columnar_output,
+        'columnar_directory': columnar_directory,
+        'trajectory_output': trajectory_output,
+        'trajectory_directory': trajectory_directory,
+        'review_directory': review_directory,
+        'window_margin': window_margin,
+        'prefetch_intervals': prefetch_intervals,
+        'analysis_cache_name': analysis_cache_name,
+        'analysis_cache_size': analysis_cache_size,
+        'quality_threshold': quality_threshold,
+        'watch_interval': watch_interval,
+        'play_sound': play_sound,
+        'timer': None,
+        'manifest': None,
+        'analysis_cache': None,
+        'store': None,
+        'columnar_writer': None,
+        'prefetch': None
+        }
+
+# Open the files every mode works with: the timer's metrics file, the
+# manifest (brought up to date with the data directory), the analysis cache
+# and the result store. Returns the sound files found.
+def open_run(run, results):
+    data_directory = run['data_directory']
+    sound_extension = run['sound_extension']
+
+    # Each stage of the work is timed. With --profile, the timings are written
+    # to the metrics file as they're made, and summarised at the end.
+    if results.profile:
+        run['timer'] = stagetimer.StageTimer(os.path.join(data_directory,
+            run['metrics_file_name']))
+    else:
+        run['timer'] = stagetimer.StageTimer()
+
+    # Get sound and textgrid files, searching the data directory and the
+    # directories in it. What was found last time is kept in a manifest, so
+    # only new and changed files need to be looked at. A shard only looks at
+    # the files in it.
+    if results.shard:
+        shard_index, shard_count = results.shard
+        include = lambda path: \
+            sound_shard(os.path.splitext(path)[0], shard_count) == shard_index
+    else:
+        include = None
+    # The directories the script writes to aren't searched.
+    manifest = corpusmanifest.CorpusManifest(os.path.join(data_directory,
+        run['manifest_name']), include, [
+            run['columnar_directory'], run['trajectory_directory'],
+            run['review_directory'],
+            os.path.join(data_directory, run['analysis_cache_name'])
+            ])
+    run['manifest'] = manifest
+    with run['timer'].stage('scan_directory'):
+        manifest.scan(data_directory,
+            (sound_extension, run['textgrid_extension']))
+    sounds = [{'name': name} for name in manifest.names(sound_extension)]
+
+    # The numpy engine's analyses are cached by the contents of the sound
+    # files, whose hashes are kept in the manifest once they've been worked
+    # out. The cache is shared by every mode (and shard).
+    if run['measuring_engine'] == 'numpy' and run['analysis_cache_size'] > 0:
+        analysis_cache = formanttracker.use_analysis_cache(
+            os.path.join(data_directory, run['analysis_cache_name']),
+            int(run['analysis_cache_size'] * 1024 * 1024)
+            )
+        for sound in sounds:
+            sound_info = manifest.file_info(sound['name'] + sound_extension)
+            if sound_info[2] is not None:
+                analysis_cache.remember_hash(os.path.join(data_directory,
+                    sound['name'] + sound_extension), *sound_info)
+        run['analysis_cache'] = analysis_cache
+
+    # Logged lines are kept in a result store beside the output file, which
+    # records which intervals have been logged.
+    run['store'] = resultstore.ResultStore(
+        os.path.join(data_directory, run['result_store_name'])
+        )
+    return sounds
+
+# Close whatever the run has opened, however it ends, and remove its
+# temporary file. Hashes of sound files worked out for the analysis cache are
+# kept in the manifest for next time.
+def close_run(run):
+    if run['analysis_cache'] is not None and run['manifest'] is not None:
+        run['manifest'].remember_hashes(run['data_directory'],
+            run['analysis_cache'].hashes)
+    for name in ('prefetch', 'timer', 'columnar_writer', 'store', 'manifest'):
+        if run[name] is not None:
+            run[name].close()
+    if os.path.isfile(run['temporary_file_name']):
+        os.remove(run['temporary_file_name'])
+
+# Just write the output file out again from the store, as text or as
+# columnar shards.
+def export_results(run, results):
+    store = run['store']
+    if results.export_log:
+        store.export_log(results.export_log, log_header())
+        sys.exit('{0} logged lines written to {1}.'.format(
+            len(store), results.export_log))
+    if results.export_columnar:
+        export_writer = columnarlog.ColumnarWriter(results.export_columnar,
+            os.path.splitext(run['output_file_name'])[0])
+        for line in store.lines():
+            export_writer.add_lines([line])
+        export_writer.close()
+        sys.exit('{0} logged lines written to {1}.'.format(
+            len(store), results.export_columnar))
+
+# Add the lines logged since the last summary to the summary statistics (see
+# logsummary.py), write out the tables of speakers and vowels, and a
+# normalised copy of the output file.
+def summarise(run, results):
+    output_path = run['output_path']
+    timer = run['timer']
+    logsummary.check_numpy()
+    if not os.path.isfile(output_path):
+        sys.exit('Error: output file {0} not found.'.format(output_path))
+    summary_stem = os.path.splitext(output_path)[0]
+    summary = logsummary.read_summary(summary_stem + '_summary.npz',
+        run['speaker_pattern'])
+    with timer.stage('summarise'):
+        new_line_count = summary.update(output_path)
+    summary.save(summary_stem + '_summary.npz')
+    logsummary.write_table(summary_stem + '_speakers.txt',
+        summary.speaker_table())
+    logsummary.write_table(summary_stem + '_vowels.txt',
+        summary.vowel_table())
+    with timer.stage('normalise'):
+        line_count = summary.write_normalised(output_path,
+            summary_stem + '_normalised.txt')
+    if results.profile:
+        print(timer.summary())
+    sys.exit(
+        '{0} new lines summarised; {1} lines by {2} speakers written '.
+        format(new_line_count, line_count, len(summary.speakers)) +
+        'to {0}_normalised.txt.'.format(summary_stem)
+        )
+
+# Combine the output files of all shards (and this output file, if there is
+# one) into this output file, in a fixed order, with each interval and
+# parameter set only once, and add them to the result store.
+def merge_shards(run):
+    data_directory = run['data_directory']
+    output_file_name = run['output_file_name']
+    output_path = run['output_path']
+    stem, extension = os.path.splitext(output_file_name)
+    # Only the output files themselves, not the other files named after
+    # them (e.g. the tables written by --summarise).
+    shard_name_pattern = re.compile(re.escape(stem) +
+        r'\.shard-\d+-of-\d+' + re.escape(extension) + '$')
+    shard_paths = sorted(
+        shard_path for shard_path in glob.glob(os.path.join(
+            glob.escape(data_directory),
+            glob.escape(stem) + '.shard-*-of-*' + glob.escape(extension)
+            ))
+        if shard_name_pattern.match(os.path.basename(shard_path))
+        )
+    if len(shard_paths) == 0:
+        sys.exit('Error: no shard output files found in {0}.'.
+            format(data_directory))
+    log_paths = shard_paths
+    if os.path.isfile(output_path):
+        log_paths = [output_path] + shard_paths
+    for log_path in log_paths:
+        resultstore.repair_log(log_path)
+    merged_lines = resultstore.merge_logs(log_paths)
+    try:
+        with open(output_path, 'w') as fout:
+            fout.write(log_header())
+            fout.writelines(merged_lines)
+    except EnvironmentError:
+        sys.exit('Error: Could not write to output file {0}.'.
+            format(output_path))
+    run['store'].add_lines(merged_lines, os.path.getsize(output_path))
+    sys.exit('{0} shard output files merged into {1}: {2} lines.'.format(
+        len(shard_paths), output_path, len(merged_lines)))
+
+# Create the output file if there isn't one, or read any lines in it the
+# store hasn't got, and start the columnar copy.
+def open_output_file(run):
+    output_file_name = run['output_file_name']
+    output_path = run['output_path']
+
+    # Lines are collected and written to the columnar copy in bulk.
+    if run['columnar_output']:
+        run['columnar_writer'] = columnarlog.ColumnarWriter(
+            run['columnar_directory'], os.path.splitext(output_file_name)[0])
+
+    # No output file (or an empty one), create one.
+    if not os.path.isfile(output_path) or os.path.getsize(output_path) == 0:
+        with open(output_path, 'a') as fout:
+            fout.write(log_header())
+
+    # Output file exists; check which intervals have already been logged. Any
+    # lines in it the store hasn't got (e.g. from a log made before there was
+    # a store, or a run stopped after writing them) are read into it first.
+    else:
+        print(
+            'Existing log file {0} found in {1}\n'.format(output_file_name,
+            run['data_directory'])
+            )
+        resultstore.repair_log(output_path)
+        run['store'].import_log(output_path)
+
+# Review phase: step through the lines measured by --precompute, showing the
+# picture of each interval (if there is one) in Praat, and log each one, skip
+# it or measure it again with changed settings. Decisions are saved as
+# they're made, so a review can be left and carried on later.
+def review(run, results):
+    data_directory = run['data_directory']
+    review_directory = run['review_directory']
+    sound_extension = run['sound_extension']
+    textgrid_extension = run['textgrid_extension']
+    textgrid_tier = run['textgrid_tier']
+    interval_label = run['interval_label']
+    spectrogram_window_length = run['spectrogram_window_length']
+    play_sound = run['play_sound']
+    measuring_engine = run['measuring_engine']
+    sendpraat_path = run['sendpraat_path']
+    praat_script_path = run['praat_script_path']
+    temporary_file_name = run['temporary_file_name']
+    window_margin = run['window_margin']
+    use_settings_file = run['use_settings_file']
+    manifest = run['manifest']
+    output_path = run['output_path']
+    timer = run['timer']
+    store = run['store']
+    columnar_writer = run['columnar_writer']
+
+    review_path = os.path.join(review_directory, review_file_name)
+    decisions_path = os.path.join(review_directory, decisions_file_name)
+    try:
+        review_lines = [
+            line for line in open(review_path) if len(line.strip()) > 0
+            ]
+    except EnvironmentError:
+        sys.exit('Error: nothing to review; run with --precompute ' +
+            'first.')
+    decided = set()
+    if os.path.isfile(decisions_path):
+        for line in open(decisions_path):
+            decided.add(tuple(line.rstrip('\r\n').split('\t')[:2]))
+    # Quality measures of the intervals, if they were scored, to show why
+    # each one was left for review.
+    qualities = {}
+    quality_path = os.path.join(review_directory, quality_file_name)
+    if os.path.isfile(quality_path):
+        quality_lines = [
+            line.rstrip('\r\n').split('\t') for line in open(quality_path)
+            ]
+        for fields in quality_lines[1:]:
+            qualities[tuple(fields[:2])] = dict(
+                zip(quality_lines[0][2:], fields[2:]))
+
+    # The speakers' sex, for reloading the default settings.
+    sex = results.sex
+    intervals_logged_count = 0
+    intervals_skipped_count = 0
+    files_logged = set()
+    files_skipped = set()
+    for review_no, review_line in enumerate(review_lines):
+        fields = review_line.rstrip('\r\n').split('\t')
+        sound_name, interval_position = fields[0], fields[1]
+        if (sound_name, interval_position) in decided:
+            continue
+        sound_file_name = sound_name + sound_extension
+        sound_path = os.path.join(data_directory, sound_file_name)
+        timer.set_interval(sound_name, interval_position)
+
+        print('\nFilename:     ' + sound_file_name)
+        print('Interval:     {0}'.format(interval_position))
+        print('Review no.:   {0}/{1}'.format(review_no + 1,
+            len(review_lines)))
+        print(format_measurement_table(review_line))
+        quality = qualities.get((sound_name, interval_position))
+        if quality is not None:
+            print('Quality score: {0} (over limit: {1})'.format(
+                quality['score'], ', '.join(
+                measure for measure in trackquality.measures
+                if float(quality[measure]) >= trackquality.limits[measure]
+                or quality[measure] == 'nan'
+                ) or 'none'))
+        image_path = os.path.join(review_directory,
+            image_file_name(sound_name, interval_position))
+        if os.path.isfile(image_path):
+            with timer.stage('show_image'):
+                show_image_in_praat(image_path, sendpraat_path)
+        user_input = get_user_input(
+            'Log formants (enter), skip interval (s), change settings (c) ' +
+            'or quit (q): ', '^[cqs]$|^$'
+            )
+
+        # Measure the interval again with changed settings, as in
+        # interactive mode, until the user logs it, skips it or quits. The
+        # settings start from those it was measured with. With the numpy
+        # engine, the analysis of the sound made by --precompute is taken
+        # from the analysis cache, if there is one, so only the tracking is
+        # done again.
+        measuring_params = log_line_params(fields)
+        while user_input == 'c':
+            measuring_params, sex, _ = change_settings(measuring_params,
+                sex, use_settings_file, run['params'])
+            interval_times = dict(
+                (str(position), (start_time, end_time))
+                for position, start_time, end_time in manifest.intervals(
+                    data_directory, sound_name + textgrid_extension,
+                    textgrid_tier, interval_label)
+                )
+            if interval_position not in interval_times:
+                sys.exit('Error: interval {0} is no longer in {1}.'.format(
+                    interval_position, sound_name + textgrid_extension))
+            start_time, end_time = interval_times[interval_position]
+            if measuring_engine == 'numpy':
+                with timer.stage('measure_numpy'):
+                    values = formanttracker.measure_interval(sound_path,
+                        start_time, end_time, measuring_params,
+                        window_margin)
+                measurement_line = formanttracker.format_measurements(
+                    sound_name, interval_position, values)
+            else:
+                measurement_line = with_sound_name(measure_with_praat(
+                    sound_path,
+                    os.path.join(data_directory,
+                        sound_name + textgrid_extension),
+                    interval_position, textgrid_tier,
+                    spectrogram_window_length, play_sound, measuring_params,
+                    sendpraat_path, praat_script_path, temporary_file_name,
+                    window=analysis_window(start_time, end_time,
+                        window_margin), timer=timer
+                    ), sound_name)
+            review_line = log_line(measurement_line, interval_label,
+                spectrogram_window_length, textgrid_tier, measuring_params)
+            fields = review_line.rstrip('\r\n').split('\t')
+            print(format_measurement_table(review_line))
+            user_input = get_user_input(
+                'Log formants (enter), skip interval (s), change settings ' +
+                '(c) or quit (q): ', '^[cqs]$|^$'
+                )
+
+        if user_input == 'q':
+            print(final_report(intervals_logged_count, len(files_logged),
+                intervals_skipped_count, len(files_skipped)))
+            if results.profile:
+                print('\n' + timer.summary())
+            sys.exit('Script terminated by user.')
+        elif user_input == 's':
+            decision = 'skipped'
+            intervals_skipped_count += 1
+            files_skipped.update([sound_file_name])
+        else:
+            # Logged with the time it was accepted.
+            write_lines = ['\t'.join(
+                fields[:-1] + [time.strftime('%Y/%m/%d %H:%M:%S')]
+                ) + '\n']
+            try:
+                with timer.stage('append_log'):
+                    log_size = resultstore.append_to_log(output_path,
+                        write_lines)
+            except EnvironmentError:
+                sys.exit('Error: Could not write to output file {0}.'.
+                    format(output_path))
+            with timer.stage('result_store'):
+                store.add_lines(write_lines, log_size)
+            if columnar_writer is not None:
+                with timer.stage('columnar_output'):
+                    columnar_writer.add_lines(write_lines)
+            decision = 'logged'
+            intervals_logged_count += 1
+            files_logged.update([sound_file_name])
+            print('Formants logged.')
+        resultstore.append_to_log(decisions_path, ['{0}\t{1}\t{2}\n'.
+            format(sound_name, interval_position, decision)])
+
+    print('\n' + final_report(intervals_logged_count, len(files_logged),
+        intervals_skipped_count, len(files_skipped)))
+    if results.profile:
+        print('\n' + timer.summary())
+
+# List the sound files found, and leave out intervals already logged if the
+# user wants (or, in batch mode, by default). Returns the sound files with
+# the intervals to measure in each, or None for a shard with no sound files.
+def sounds_to_measure(run, results, sounds):
+    data_directory = run['data_directory']
+    sound_extension = run['sound_extension']
+    textgrid_extension = run['textgrid_extension']
+    manifest = run['manifest']
+    store = run['store']
+
+    files_previously_logged = store.logged_sound_files()
+    sounds_set = set([sound['name'] for sound in sounds])
+    files_in_list_logged = files_previously_logged.intersection(sounds_set)
+    skip_logged_intervals = False
+
+    # List sound files found
+    if len(sounds) > 0:
+        print("{0} sound files found in {1}:".format(
+            len(sounds), data_directory
+            ))
+        for no, sound in enumerate(sounds):
+            log_text = ''
+            if sound['name'] in files_previously_logged:
+                log_text = ' (previously logged)'
+            print("{0}. {1}{2}\t{3}".format(no + 1, sound['name'],
+                sound_extension, log_text))
+        print()
+
+        # Ask user if they want to reprocess the logged files. Optimising
+        # always uses every interval.
+        if files_in_list_logged and not results.optimise:
+            print('Some of the sound files found have been logged previously.')
+            # Batch mode can't ask, so takes the default.
+            if results.unattended:
+                user_input = ''
+            else:
+                user_input = get_user_input(
+                    'Process previously logged files again (y) or ignore ' +
+                    'them (enter): ', '^[yn]$|^$'
+                    )
+            if user_input == 'y':
+                print(
+                    'Including previously logged files. New measurements' +
+                    ' will be appended to the output file.\n'
+                    )
+            # Previously logged intervals will be removed from the list once
+            # the textgrids have been read, so partly logged files carry on
+            # where they left off.
+            else:
+                print('Ignoring previously logged intervals.\n')
+                skip_logged_intervals = True
+
+    # A shard can have no sound files in it (e.g. when there are more shards
+    # than files), which leaves it nothing to do.
+    elif results.shard and not results.watch:
+        print('No sound files in shard {0} of {1} in {2}; nothing to do.'.
+            format(results.shard[0], results.shard[1], data_directory))
+        return None
+
+    # With --watch, sound files may still arrive.
+    elif not results.watch:
+        sys.exit('Error: No sound files found in {0}.'.format(data_directory))
+
+    # Check that every sound file has a textgrid beside it.
+    textgrid_names = set(manifest.names(textgrid_extension))
+    without_textgrids = [
+        sound['name'] + sound_extension for sound in sounds
+        if sound['name'] not in textgrid_names
+        ]
+    if len(without_textgrids) > 0:
+        sys.exit("Error: No textgrid for file(s) {0} ".
+            format(', '.join(without_textgrids))
+            )
+
+    # Read in textgrid files and store where the intervals to measure appear in
+    # each of them.
+    find_intervals(sounds, manifest, data_directory, textgrid_extension,
+        run['textgrid_tier'], run['interval_label'], store,
+        skip_logged_intervals, run['timer'])
+
+    # Remove files with nothing left to measure.
+    if skip_logged_intervals:
+        sounds = [
+            sound for sound in sounds if len(sound['interval_positions']) > 0
+            ]
+        if len(sounds) == 0 and not results.watch:
+            sys.exit('No unlogged intervals to process.')
+    return sounds
+
+# Optimising: track every interval of each speaker with each of a range of
+# candidate settings, reusing one analysis of each sound file, score the
+# tracks (see trackquality.py), and save the candidate with the lowest mean
+# score as the speaker's profile.
+def optimise(run, results, sounds, measuring_params, sex):
+    sound_extension = run['sound_extension']
+    profiles_path = run['profiles_path']
+    timer = run['timer']
+
+    trackquality.check_numpy()
+    candidates = speakerprofiles.candidate_parameter_sets(
+        measuring_params)
+    optimiser = speakerprofiles.ProfileOptimiser(candidates)
+    jobs = make_batch_jobs(sounds, run['data_directory'], sound_extension,
+        run['textgrid_extension'], run['textgrid_tier'],
+        run['measuring_engine'], candidates, run['praat_path'],
+        run['praat_batch_script_path'], run['window_margin'],
+        score_quality=True, analysis_cache=run['analysis_cache'],
+        norm_params=measuring_params
+        )
+    started = time.perf_counter()
+    for job_no, (job, measurement_lines, qualities) in enumerate(
+        run_batch_jobs(jobs, results.jobs)):
+        timer.set_interval(job['sound_name'])
+        timer.add('measure_job', time.perf_counter() - started)
+        print('{0}/{1} {2}: {3} intervals'.format(
+            job_no + 1, len(jobs), job['sound_name'] + sound_extension,
+            len(job['interval_positions'])
+            ))
+        speaker = speakerprofiles.speaker_name(job['sound_name'],
+            run['speaker_pattern'])
+        # Lines come in order of interval, then candidate.
+        for line_no, quality in enumerate(qualities):
+            optimiser.add(speaker, line_no % len(candidates),
+                quality['score'])
+        timer.set_interval()
+        started = time.perf_counter()
+
+    found_profiles = optimiser.profiles(sex_names[sex])
+    speakerprofiles.update_profiles(profiles_path, found_profiles)
+    print('\nSpeaker\tf1_reference\tScore\tIntervals')
+    for speaker in sorted(found_profiles):
+        print('{0}\t{1}\t{2}\t{3}'.format(speaker,
+            found_profiles[speaker]['f1_reference'],
+            found_profiles[speaker]['score'],
+            found_profiles[speaker]['intervals']))
+    print('\nProfiles for {0} speakers saved to {1}.'.format(
+        len(found_profiles), profiles_path))
+    if results.profile:
+        print('\n' + timer.summary())
+
+# Batch mode: measure and log every interval with the current settings (or
+# with each set of settings in the sweep). Each sound file is measured in one
+# go (a single Praat run with the praat engine), or in a few jobs if it has
+# many intervals, and each job's lines are added to the output file together.
+# With --jobs, jobs are shared out between worker processes. The precompute
+# phase works the same way, but adds the lines to the review directory
+# instead, with a picture of each interval if measuring with Praat, for
+# --review.
+def batch(run, results, sounds, measuring_params, profiles, sweep_grids):
+    data_directory = run['data_directory']
+    sound_extension = run['sound_extension']
+    textgrid_extension = run['textgrid_extension']
+    textgrid_tier = run['textgrid_tier']
+    interval_label = run['interval_label']
+    spectrogram_window_length = run['spectrogram_window_length']
+    speaker_pattern = run['speaker_pattern']
+    measuring_engine = run['measuring_engine']
+    praat_path = run['praat_path']
+    praat_batch_script_path = run['praat_batch_script_path']
+    window_margin = run['window_margin']
+    review_directory = run['review_directory']
+    trajectory_directory = run['trajectory_directory']
+    quality_threshold = run['quality_threshold']
+    output_path = run['output_path']
+    timer = run['timer']
+    manifest = run['manifest']
+    analysis_cache = run['analysis_cache']
+    store = run['store']
+    columnar_writer = run['columnar_writer']
+
+    intervals_logged_count = 0
+    files_logged = set()
+    if sweep_grids is not None:
+        parameter_sets = sweep_parameter_sets(sweep_grids,
+            measuring_params)
+    else:
+        parameter_sets = [measuring_params]
+    image_directory = None
+    score_quality = results.precompute and quality_threshold > 0
+    intervals_accepted_count = 0
+    if results.precompute:
+        clear_review_directory(review_directory)
+        review_path = os.path.join(review_directory, review_file_name)
+        if measuring_engine == 'praat':
+            image_directory = review_directory
+    if score_quality:
+        trackquality.check_numpy()
+        quality_path = os.path.join(review_directory, quality_file_name)
+        try:
+            resultstore.append_to_log(quality_path, ['\t'.join(
+                ['Sound file', 'Interval position'] +
+                trackquality.measures + ['score', 'decision']
+                ) + '\n'])
+        except EnvironmentError:
+            sys.exit('Error: Could not write to quality file {0}.'.
+                format(quality_path))
+    # Full trajectories are only saved for lines logged straight away.
+    if run['trajectory_output'] and results.batch:
+        trajectorylog.check_numpy()
+        if not os.path.isdir(trajectory_directory):
+            try:
+                os.makedirs(trajectory_directory)
+            except EnvironmentError:
+                sys.exit('Error: could not make directory {0}.'.
+                    format(trajectory_directory))
+    else:
+        trajectory_directory = None
+
+    # With --watch, once everything has been measured, wait for new sound
+    # files and textgrids to arrive, measure them, and so on until stopped
+    # with Ctrl-C.
+    while True:
+        # Files of speakers with profiles are measured with their
+        # speaker's settings.
+        for sound in sounds:
+            sound_params = speakerprofiles.profile_params(profiles,
+                sound['name'], speaker_pattern)
+            if sound_params is None:
+                continue
+            if sweep_grids is not None:
+                sound['parameter_sets'] = sweep_parameter_sets(
+                    sweep_grids, sound_params)
+            else:
+                sound['parameter_sets'] = [sound_params]
+        jobs = make_batch_jobs(sounds, data_directory, sound_extension,
+            textgrid_extension, textgrid_tier, measuring_engine,
+            parameter_sets, praat_path, praat_batch_script_path,
+            window_margin, spectrogram_window_length, image_directory,
+            trajectory_directory, score_quality, analysis_cache,
+            measuring_params
+            )
+
+        # Lines are written by this process only, in the order of the
+        # jobs, however many worker processes are measuring. Time spent
+        # waiting for each job is timed as measure_job.
+        started = time.perf_counter()
+        for job_no, (job, measurement_lines, qualities) in enumerate(
+            run_batch_jobs(jobs, results.jobs)):
+            timer.set_interval(job['sound_name'])
+            timer.add('measure_job', time.perf_counter() - started)
+            interval_count = len(job['interval_positions'])
+            print('{0}/{1} {2}: {3} intervals'.format(
+                job_no + 1, len(jobs), job['sound_name'] + sound_extension,
+                interval_count
+                ))
+            write_lines = [
+                log_line(measurement_line, interval_label,
+                    spectrogram_window_length, textgrid_tier, set_params)
+                for set_params, measurement_line in measurement_lines
+                ]
+            log_lines = write_lines
+            if results.precompute:
+                # With quality scoring, intervals scoring below
+                # quality_threshold are logged straight away, and only the
+                # rest are left for review.
+                review_lines = write_lines
+                log_lines = []
+                if qualities is not None:
+                    accepted = [
+                        quality['score'] < quality_threshold
+                        for quality in qualities
+                        ]
+                    review_lines = [
+                        line for line, line_accepted in
+                        zip(write_lines, accepted) if not line_accepted
+                        ]
+                    log_lines = [
+                        line for line, line_accepted in
+                        zip(write_lines, accepted) if line_accepted
+                        ]
+                    intervals_accepted_count += len(log_lines)
+                    try:
+                        resultstore.append_to_log(quality_path, [
+                            '\t'.join(line.split('\t')[:2] + [
+                                '{0:.2f}'.format(quality[measure])
+                                for measure in
+                                trackquality.measures + ['score']
+                                ] + [
+                                'logged' if line_accepted else 'review'
+                                ]) + '\n'
+                            for line, quality, line_accepted in
+                            zip(write_lines, qualities, accepted)
+                            ])
+                    except EnvironmentError:
+                        sys.exit('Error: Could not write to quality ' +
+                            'file {0}.'.format(quality_path))
+                try:
+                    with timer.stage('review_file'):
+                        resultstore.append_to_log(review_path,
+                            review_lines)
+                except EnvironmentError:
+                    sys.exit('Error: Could not write to review file {0}.'.
+                        format(review_path))
+            if len(log_lines) > 0:
+                # The output file is written first; if the run is stopped
+                # before the store is written, the store catches up with
+                # the output file when the run is resumed.
+                try:
+                    with timer.stage('append_log'):
+                        log_size = resultstore.append_to_log(output_path,
+                            log_lines)
+                except EnvironmentError:
+                    sys.exit('Error: Could not write to output file {0}.'.
+                        format(output_path))
+                with timer.stage('result_store'):
+                    store.add_lines(log_lines, log_size)
+                if columnar_writer is not None:
+                    with timer.stage('columnar_output'):
+                        columnar_writer.add_lines(log_lines)
+            timer.set_interval()
+            intervals_logged_count += interval_count
+            files_logged.update([job['sound_name'] + sound_extension])
+            started = time.perf_counter()
+
+        if not results.watch:
+            break
+        print('\nWatching {0} for new files (Ctrl-C to stop).'.
+            format(data_directory))
+        try:
+            sounds = []
+            while len(sounds) == 0:
+                sounds = wait_for_new_sounds(manifest, data_directory,
+                    sound_extension, textgrid_extension,
+                    run['watch_interval'], timer)
+                find_intervals(sounds, manifest, data_directory,
+                    textgrid_extension, textgrid_tier, interval_label,
+                    store, True, timer)
+                sounds = [
+                    sound for sound in sounds
+                    if len(sound['interval_positions']) > 0
+                    ]
+        except KeyboardInterrupt:
+            print('\nStopped watching.')
+            break
+
+    if score_quality:
+        print('\n{0} intervals in {1} files measured: '.format(
+            intervals_logged_count, len(files_logged)) +
+            '{0} logged straight away, {1} left for review; '.format(
+            intervals_accepted_count,
+            intervals_logged_count - intervals_accepted_count) +
+            'run with --review to log them.')
+    elif results.precompute:
+        print('\n{0} intervals in {1} files measured for review; '.
+            format(intervals_logged_count, len(files_logged)) +
+            'run with --review to log them.')
+    else:
+        print('\n' + final_report(intervals_logged_count,
+            len(files_logged), 0, 0))
+    if results.profile:
+        print('\n' + timer.summary())
+
+# Interactive mode: measure each interval in turn, showing the measurements
+# (in Praat, or here with the numpy engine), and log it, skip it or measure it
+# again with changed settings as the user chooses.
+def interactive(run, results, sounds, measuring_params, sex, profiles,
+    sweep_grids):
+    data_directory = run['data_directory']
+    sound_extension = run['sound_extension']
+    textgrid_extension = run['textgrid_extension']
+    textgrid_tier = run['textgrid_tier']
+    interval_label = run['interval_label']
+    spectrogram_window_length = run['spectrogram_window_length']
+    speaker_pattern = run['speaker_pattern']
+    play_sound = run['play_sound']
+    measuring_engine = run['measuring_engine']
+    sendpraat_path = run['sendpraat_path']
+    praat_script_path = run['praat_script_path']
+    praat_path = run['praat_path']
+    praat_batch_script_path = run['praat_batch_script_path']
+    temporary_file_name = run['temporary_file_name']
+    window_margin = run['window_margin']
+    use_settings_file = run['use_settings_file']
+    output_path = run['output_path']
+    timer = run['timer']
+    analysis_cache = run['analysis_cache']
+    store = run['store']
+    columnar_writer = run['columnar_writer']
+
+    # The files_logged/skipped sets hold names of files which contain an
+    # interval that has been logged or skipped; the presence of a filename in
+    # either does not imply that *all* its intervals were either logged or
+    # skipped.
+    intervals_logged_count = 0
+    intervals_skipped_count = 0
+    files_logged = set()
+    files_skipped = set()
+
+    # The next intervals are measured in the background while the user looks
+    # at the current one. With the praat engine, which can only do one thing at
+    # a time, the next sound file is loaded and analysed instead.
+    prefetch_intervals = run['prefetch_intervals']
+    if prefetch_intervals > 0:
+        prefetch = prefetcher.Prefetcher()
+        run['prefetch'] = prefetch
+    else:
+        prefetch = None
+
+    # Settings for the files of speakers without profiles.
+    sex_params = measuring_params
+
+    for sound_key, sound in enumerate(sounds):
+
+        # Each file of a speaker with a profile starts with its settings.
+        if len(profiles) > 0:
+            speaker_params = speakerprofiles.profile_params(profiles,
+                sound['name'], speaker_pattern)
+            if speaker_params is not None:
+                print('\nUsing the profile of speaker {0}.'.format(
+                    speakerprofiles.speaker_name(sound['name'],
+                        speaker_pattern)))
+                measuring_params = speaker_params
+            else:
+                measuring_params = sex_params
+
+        for interval_no, interval_position in enumerate(sound['interval_positions']):
+
+            user_accepted = False
+
+            sound_file_name = sound['name'] +  sound_extension
+            textgrid_file_name = sound['name'] + textgrid_extension
+            sound_path = os.path.join(data_directory, sound_file_name)
+
+            # Intervals to be worked on in the background, and the first of
+            # them in another sound file, if any.
+            if prefetch is not None:
+                upcoming = upcoming_intervals(sounds, sound_key, interval_no,
+                    prefetch_intervals)
+            else:
+                upcoming = []
+            next_sound = None
+            next_params = None
+            for next_sound_no, next_interval_no in upcoming:
+                if next_sound_no != sound_key:
+                    next_sound = sounds[next_sound_no]
+                    next_params = speakerprofiles.profile_params(profiles,
+                        next_sound['name'], speaker_pattern) or sex_params
+                    next_position = \
+                        next_sound['interval_positions'][next_interval_no]
+                    next_start_time, next_end_time = \
+                        next_sound['interval_times'][next_interval_no]
+                    break
+            start_time, end_time = sound['interval_times'][interval_no]
+            timer.set_interval(sound['name'], interval_position)
+
+            # Keep processing this interval until the user accepts or skips it.
+            while not user_accepted:
+
+                print('\nFilename:     ' + sound_file_name)
+                print('Sound no.:    {0}/{1}'.format(sound_key + 1, len(sounds)))
+                print('Interval no.: {0}/{1}'.format(
+                    interval_no + 1,
+                    len(sound['interval_positions'])
+                    ))
+
+                # Measure in this process; there's no Praat display, so show
+                # the table of values here instead.
+                if measuring_engine == 'numpy':
+                    values = None
+                    if prefetch is not None:
+                        with timer.stage('prefetch_wait'):
+                            values = prefetch.take(prefetch_key(sound_path,
+                                interval_position, measuring_params))
+                    if values is None:
+                        with timer.stage('measure_numpy'):
+                            values = formanttracker.measure_interval(
+                                sound_path, start_time, end_time,
+                                measuring_params, window_margin)
+                    print(formanttracker.format_table(values))
+                    measurement_line = formanttracker.format_measurements(
+                        sound['name'], interval_position, values
+                        )
+
+                    # Measure the next intervals while the user decides. Work
+                    # for any other intervals is dropped.
+                    upcoming_work = []
+                    for next_sound_no, next_interval_no in upcoming:
+                        upcoming_sound = sounds[next_sound_no]
+                        upcoming_path = os.path.join(data_directory,
+                            upcoming_sound['name'] + sound_extension)
+                        upcoming_start_time, upcoming_end_time = \
+                            upcoming_sound['interval_times'][next_interval_no]
+                        if next_sound_no == sound_key:
+                            upcoming_params = measuring_params
+                        else:
+                            upcoming_params = speakerprofiles.profile_params(
+                                profiles, upcoming_sound['name'],
+                                speaker_pattern) or sex_params
+                        upcoming_work.append((
+                            prefetch_key(upcoming_path,
+                                upcoming_sound['interval_positions']
+                                [next_interval_no], upcoming_params),
+                            upcoming_path, upcoming_start_time,
+                            upcoming_end_time, dict(upcoming_params)
+                            ))
+                    if prefetch is not None:
+                        prefetch.retain(set(work[0] for work in upcoming_work))
+                    for key, upcoming_path, upcoming_start_time, \
+                        upcoming_end_time, upcoming_params in upcoming_work:
+                        prefetch.request(key,
+                            formanttracker.measure_interval, upcoming_path,
+                            upcoming_start_time, upcoming_end_time,
+                            upcoming_params, window_margin
+                            )
+                else:
+                    # Praat must have finished any background work before
+                    # it's asked to display this interval. Its objects for the
+                    # next sound file are kept.
+                    next_sound_path = None
+                    if next_sound is not None:
+                        next_sound_path = os.path.join(data_directory,
+                            next_sound['name'] + sound_extension)
+                    if prefetch is not None:
+                        with timer.stage('prefetch_wait'):
+                            prefetch.wait()
+                    measurement_line = measure_with_praat(
+                        sound_path,
+                        os.path.join(data_directory, textgrid_file_name),
+                        interval_position, textgrid_tier,
+                        spectrogram_window_length, play_sound,
+                        measuring_params, sendpraat_path, praat_script_path,
+                        temporary_file_name, keep_sound_path=next_sound_path,
+                        window=analysis_window(start_time, end_time,
+                            window_margin), timer=timer
+                        )
+                    measurement_line = with_sound_name(measurement_line,
+                        sound['name'])
+
+                    # Load and analyse the next sound file (or, with windowed
+                    # loading, the part of it for its first interval) while
+                    # the user decides, keeping this file's objects.
+                    if next_sound_path is not None:
+                        prefetch.request(
+                            prefetch_key(next_sound_path, next_position,
+                                next_params),
+                            measure_with_praat, next_sound_path,
+                            os.path.join(data_directory,
+                                next_sound['name'] + textgrid_extension),
+                            next_position, textgrid_tier,
+                            spectrogram_window_length, '0',
+                            dict(next_params), sendpraat_path,
+                            praat_script_path, temporary_file_name, True,
+                            sound_path, analysis_window(next_start_time,
+                                next_end_time, window_margin)
+                            )
+
+                # With a sweep, also measure the interval with every set of
+                # settings, reusing one analysis of the sound, and show them
+                # side by side.
+                if sweep_grids is not None:
+                    sweep_job = make_batch_jobs([{
+                        'name': sound['name'],
+                        'interval_positions': [interval_position],
+                        'interval_times': [(start_time, end_time)]
+                        }], data_directory, sound_extension,
+                        textgrid_extension, textgrid_tier, measuring_engine,
+                        sweep_parameter_sets(sweep_grids, measuring_params),
+                        praat_path, praat_batch_script_path, window_margin,
+                        analysis_cache=analysis_cache
+                        )[0]
+                    with timer.stage('sweep'):
+                        sweep_results, qualities, error = \
+                            measure_job(sweep_job)
+                    if error is not None:
+                        sys.exit(error)
+                    print('\nSweep:')
+                    print(format_sweep_table(sweep_results))
+                    user_input = get_user_input(
+                        'Log formants (enter), log all sweep settings (a), ' +
+                        'skip interval (s), change settings (c) or quit (q): ',
+                        '^[acqs]$|^$'
+                        )
+                else:
+                    user_input = get_user_input(
+                        'Log formants (enter), skip interval (s), ' +
+                        'change settings (c) or quit (q): ', '^[cqs]$|^$'
+                        )
+
+                # Don't log this interval; move onto the next.
+                if user_input == 's':
+                    intervals_skipped_count +=1
+                    files_skipped.update([sound_file_name])
+                    break
+
+                # Change a setting.
+                elif user_input == 'c':
+
+                    measuring_params, sex, reloaded = change_settings(
+                        measuring_params, sex, use_settings_file,
+                        run['params'])
+                    if reloaded:
+                        sex_params = measuring_params
+                    # Anything done in the background was done with the old
+                    # settings.
+                    if prefetch is not None:
+                        prefetch.invalidate()
+
+                # Quit
+                elif user_input =='q':
+                    print(final_report(
+                        intervals_logged_count, len(files_logged),
+                        intervals_skipped_count,
+                        len(files_skipped)
+                        ))
+                    if results.profile:
+                        print('\n' + timer.summary())
+                    sys.exit('Script terminated by user.')
+
+                # Current measurements OK; log the formants.
+                else:
+                    # Add a line with these measurements to the
+                    # output file, or with 'a' a line for each set of settings
+                    # in the sweep.
+                    if user_input == 'a':
+                        write_lines = [
+                            log_line(sweep_line, interval_label,
+                                spectrogram_window_length, textgrid_tier,
+                                set_params)
+                            for set_params, sweep_line in sweep_results
+                            ]
+                    else:
+                        write_lines = [log_line(
+                            measurement_line, interval_label,
+                            spectrogram_window_length, textgrid_tier,
+                            measuring_params
+                            )]
+                    try:
+                        with timer.stage('append_log'):
+                            log_size = resultstore.append_to_log(output_path,
+                                write_lines)
+                    except EnvironmentError:
+                        sys.exit('Error: Could not write to output file {0}.'.
+                            format(output_path))
+                    else:
+                        with timer.stage('result_store'):
+                            store.add_lines(write_lines, log_size)
+                        if columnar_writer is not None:
+                            with timer.stage('columnar_output'):
+                                columnar_writer.add_lines(write_lines)
+                        files_logged.update([sound_file_name])
+                        user_accepted = True
+                        print('Formants logged.')
+                        intervals_logged_count +=1
+
+    # Output report.
+    report_text = final_report(intervals_logged_count, len(files_logged),
+        intervals_skipped_count, len(files_skipped))
+    print('\n' + report_text)
+    if results.profile:
+        print('\n' + timer.summary())
+
+# Choose the settings to measure with, and measure the sound files in the
+# mode asked for.
+def measure(run, results, sounds):
+
+    # Make a current copy of the default parameters, selecting values
+    # according to sex.
+    if results.unattended:
+        sex = results.sex
+    else:
+        sex = get_user_input('Enter speaker sex (m/f) [default m]: ',
+            '^[mf]$|^$', 'Enter either m or f only.')
+    if sex == '':
+        sex = 'm'
+    measuring_params = set_params_by_sex(sex_names[sex],
+        run['use_settings_file'], run['params'])
+
+    # Settings found for particular speakers by --optimise are used in place
+    # of these for their files.
+    profiles = speakerprofiles.read_profiles(run['profiles_path'])
+    if len(profiles) > 0 and not results.optimise:
+        print('Using speaker profiles from {0} for {1} speakers.\n'.format(
+            run['profiles_path'], len(profiles)))
+
+    # Sets of tracking settings to try on each interval, from a sweep file.
+    # Settings not swept are taken from the current settings.
+    if results.sweep:
+        sweep_grids = read_sweep_file(results.sweep)
+    else:
+        sweep_grids = None
+
+    if results.optimise:
+        optimise(run, results, sounds, measuring_params, sex)
+    elif results.unattended:
+        batch(run, results, sounds, measuring_params, profiles, sweep_grids)
+    else:
+        interactive(run, results, sounds, measuring_params, sex, profiles,
+            sweep_grids)
+
+def main():
+    results = parse_arguments()
+    run = read_settings(results)
+
+    # Whatever the run has opened is closed however it ends, including with
+    # an error or Ctrl-C.
+    try:
+        sounds = open_run(run, results)
+        if results.export_log or results.export_columnar:
+            export_results(run, results)
+        elif results.summarise:
+            summarise(run, results)
+        elif results.merge_shards:
+            merge_shards(run)
+        else:
+            open_output_file(run)
+            if results.review:
+                review(run, results)
+            else:
+                sounds = sounds_to_measure(run, results, sounds)
+                if sounds is not None:
+                    measure(run, results, sounds)
+    finally:
+        close_run(run)
+
+if __name__ == '__main__':
+    main()
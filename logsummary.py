@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# logsummary.py
+# Summaries and normalisation of the output file for logformantsbylabel.py.
+
+# The output file is read in chunks of lines, so memory doesn't grow with its
+# length, and each chunk is added to accumulators holding the count, mean and
+# sum of squared deviations of F1-F3 (and of their logarithms) for every
+# speaker, and for every vowel (interval label) of every speaker at each
+# tenth. Accumulators for different lines are merged exactly (as by Chan et
+# al.'s parallel algorithm), so the accumulators are saved along with how far
+# through the output file they have got, and a later summary only reads the
+# lines logged since. If the output file has been rewritten (e.g. by
+# --merge_shards), it's read from the start again.
+
+# From the accumulators come a table of speakers, with the mean and standard
+# deviation of each formant over all of a speaker's measurements (the Lobanov
+# normalisation) and their mean log formant over F1-F3 (the Nearey log-mean
+# normalisation), and a table of vowels, giving each speaker's mean F1-F3 at
+# 50% of each vowel, raw and normalised both ways. A normalised copy of the
+# output file, with Lobanov (z-score) and Nearey (log minus the speaker's
+# log-mean) values after each line, can then be written, streaming through the
+# output file again.
+
+# Requires NumPy (www.numpy.org).
+
+import itertools
+import locale
+import os
+import sys
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import columnarlog
+import resultstore
+import speakerprofiles
+
+# Number of lines of the output file read at a time.
+chunk_lines = 20000
+
+# Formants and points measured in each line.
+number_of_formants = 3
+number_of_points = 11
+
+# Point of each vowel summarised in the vowel table (50%).
+summary_point = 5
+
+# Bytes from the end of the part of the output file already read that are
+# kept, to check that it hasn't been rewritten since.
+check_length = 256
+
+# The encoding the output file is read in: the locale's, which is what it's
+# written in (by open(), as everywhere else in the script).
+log_encoding = locale.getpreferredencoding(False)
+
+# Stop with a helpful message if NumPy isn't installed.
+def check_numpy():
+    if np is None:
+        sys.exit(
+            'Error: summarising requires NumPy (www.numpy.org), which ' +
+            'could not be imported.'
+            )
+
+# Sums of values over the rows of each group, for each cell of the values (an
+# array of rows x cells), found for all groups at once.
+def group_sums(codes, values, group_count):
+    cell_count = values.shape[1]
+    cells = (codes[:, None] * cell_count + np.arange(cell_count)).ravel()
+    return np.bincount(cells, weights=values.ravel(),
+        minlength=group_count * cell_count).reshape(group_count, cell_count)
+
+# Count, mean and sum of squared deviations from the mean (M2) of a set of
+# values for each of a growing number of groups, ignoring NaN.
+class GroupMoments(object):
+
+    # Each row added has cell_count values.
+    def __init__(self, cell_count):
+        self.counts = np.zeros((0, cell_count))
+        self.means = np.zeros((0, cell_count))
+        self.m2s = np.zeros((0, cell_count))
+
+    def grow(self, group_count):
+        extra = group_count - len(self.counts)
+        if extra > 0:
+            padding = np.zeros((extra, self.counts.shape[1]))
+            self.counts = np.concatenate((self.counts, padding))
+            self.means = np.concatenate((self.means, padding))
+            self.m2s = np.concatenate((self.m2s, padding))
+
+    # Add rows of values (rows x cells), each belonging to the group given by
+    # its code.
+    def add(self, codes, values):
+        self.grow(int(codes.max()) + 1 if len(codes) > 0 else 0)
+        group_count = len(self.counts)
+        defined = ~np.isnan(values)
+        counts = group_sums(codes, defined.astype(float), group_count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = group_sums(codes, np.where(defined, values, 0),
+                group_count) / counts
+        means = np.nan_to_num(means)
+        deviations = np.where(defined, values - means[codes], 0)
+        self.merge(counts, means, group_sums(codes, deviations ** 2,
+            group_count))
+
+    # Merge in the counts, means and M2s of other values for the same groups.
+    def merge(self, counts, means, m2s):
+        totals = self.counts + counts
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shares = np.where(totals > 0, counts / totals, 0)
+        deltas = means - self.means
+        self.means = self.means + deltas * shares
+        self.m2s = self.m2s + m2s + deltas ** 2 * self.counts * shares
+        self.counts = totals
+
+    # Means, NaN where there are no values.
+    def mean(self):
+        return np.where(self.counts > 0, self.means, np.nan)
+
+    # Sample standard deviations, NaN where there are fewer than two values.
+    def standard_deviation(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts > 1,
+                np.sqrt(self.m2s / (self.counts - 1)), np.nan)
+
+# Values of F1-F3 at each tenth (lines x points x formants, NaN where
+# undefined), sound file names and interval labels of logged lines (split
+# into fields).
+def parse_rows(rows):
+    column_count = len(columnarlog.formant_columns)
+    # Lines logged before measuring started at 0% have 30 values rather than
+    # 33; their 0% columns are left undefined.
+    texts = []
+    for row in rows:
+        row_values = row[2:-resultstore.settings_field_count]
+        texts += ['nan'] * (column_count - len(row_values)) + row_values
+    texts = ' '.join(texts).replace('--undefined--', 'nan').split()
+    values = np.array(texts, dtype=float).reshape(len(rows), column_count)
+    return (
+        values.reshape(len(rows), number_of_points, number_of_formants),
+        [row[0] for row in rows],
+        [row[-resultstore.settings_field_count] for row in rows]
+        )
+
+# Chunks of logged lines (split into fields) from an output file opened in
+# binary mode, each with the position in the file after its last line, up to
+# position end if given. A last line not yet finished (with no newline) isn't
+# read.
+def read_chunks(fin, end=None):
+    position = fin.tell()
+    while True:
+        lines = list(itertools.islice(fin, chunk_lines))
+        rows = []
+        for line in lines:
+            if not line.endswith(b'\n') or \
+                (end is not None and position + len(line) > end):
+                lines = []
+                break
+            position += len(line)
+            fields = line.decode(log_encoding).rstrip('\r\n').split('\t')
+            if resultstore.is_logged_line(fields):
+                rows.append(fields)
+        if len(rows) > 0 or len(lines) > 0:
+            yield rows, position
+        if len(lines) < chunk_lines:
+            return
+
+class LogSummary(object):
+
+    def __init__(self, speaker_pattern=''):
+        self.speaker_pattern = speaker_pattern
+        self.clear()
+
+    # Empty the accumulators, to read an output file from the start.
+    def clear(self):
+        # How far through the output file has been read, and the bytes just
+        # before that point.
+        self.position = 0
+        self.tail = b''
+        # Speakers, and (speaker code, interval label) pairs for vowels, with
+        # the number of lines of each.
+        self.speakers = {}
+        self.vowels = {}
+        self.speaker_lines = np.zeros(0)
+        self.vowel_lines = np.zeros(0)
+        # Formants of each speaker pooled over all points, and formants at
+        # each point of each vowel, and their logarithms.
+        self.speaker_moments = GroupMoments(number_of_formants)
+        self.speaker_log_moments = GroupMoments(number_of_formants)
+        cell_count = number_of_points * number_of_formants
+        self.vowel_moments = GroupMoments(cell_count)
+        self.vowel_log_moments = GroupMoments(cell_count)
+        # Speakers of sound files seen, so each is only worked out once.
+        self.sound_speakers = {}
+
+    # Codes of the speakers of sound files, adding any that are new. Each
+    # distinct sound file's speaker is only worked out once.
+    def speaker_codes(self, sound_names):
+        names, name_codes = np.unique(sound_names, return_inverse=True)
+        codes = []
+        for name in names:
+            if name not in self.sound_speakers:
+                self.sound_speakers[name] = speakerprofiles.speaker_name(
+                    str(name), self.speaker_pattern)
+            codes.append(self.speakers.setdefault(self.sound_speakers[name],
+                len(self.speakers)))
+        return np.array(codes, dtype=np.int64)[name_codes.ravel()]
+
+    # Codes of speakers' vowels, adding any that are new.
+    def vowel_codes(self, speaker_codes, labels):
+        pairs, pair_codes = np.unique(
+            np.array([speaker_codes.astype(str), labels]).T, axis=0,
+            return_inverse=True)
+        codes = [
+            self.vowels.setdefault((int(speaker_code), str(label)),
+                len(self.vowels))
+            for speaker_code, label in pairs
+            ]
+        return np.array(codes, dtype=np.int64)[pair_codes.ravel()]
+
+    # Add logged lines (split into fields) to the accumulators.
+    def add_rows(self, rows):
+        if len(rows) == 0:
+            return
+        values, sound_names, labels = parse_rows(rows)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            log_values = np.log(values)
+
+        speaker_codes = self.speaker_codes(sound_names)
+        vowel_codes = self.vowel_codes(speaker_codes, labels)
+
+        self.speaker_lines = np.concatenate((self.speaker_lines,
+            np.zeros(len(self.speakers) - len(self.speaker_lines))))
+        self.speaker_lines += np.bincount(speaker_codes,
+            minlength=len(self.speakers))
+        self.vowel_lines = np.concatenate((self.vowel_lines,
+            np.zeros(len(self.vowels) - len(self.vowel_lines))))
+        self.vowel_lines += np.bincount(vowel_codes,
+            minlength=len(self.vowels))
+
+        point_codes = np.repeat(speaker_codes, number_of_points)
+        self.speaker_moments.add(point_codes,
+            values.reshape(-1, number_of_formants))
+        self.speaker_log_moments.add(point_codes,
+            log_values.reshape(-1, number_of_formants))
+        self.vowel_moments.add(vowel_codes, values.reshape(len(rows), -1))
+        self.vowel_log_moments.add(vowel_codes,
+            log_values.reshape(len(rows), -1))
+
+    # Add the lines logged to an output file since it was last read. If it
+    # has been rewritten since, start again from the beginning. Returns the
+    # number of lines added.
+    def update(self, log_path):
+        line_count = 0
+        try:
+            with open(log_path, 'rb') as fin:
+                fin.seek(0, os.SEEK_END)
+                size = fin.tell()
+                fin.seek(self.position - len(self.tail))
+                if size < self.position or fin.read(len(self.tail)) != \
+                    self.tail:
+                    self.clear()
+                fin.seek(self.position)
+                for rows, position in read_chunks(fin):
+                    self.add_rows(rows)
+                    line_count += len(rows)
+                    self.position = position
+                start = max(self.position - check_length, 0)
+                fin.seek(start)
+                self.tail = fin.read(self.position - start)
+        except EnvironmentError:
+            sys.exit('Error: could not read output file {0}.'.
+                format(log_path))
+        return line_count
+
+    # Mean and standard deviation of each formant of each speaker, and each
+    # speaker's mean log formant over F1-F3 (weighted by the number of values
+    # of each formant).
+    def speaker_norms(self):
+        counts = self.speaker_log_moments.counts
+        with np.errstate(invalid='ignore', divide='ignore'):
+            log_means = (self.speaker_log_moments.means * counts).sum(
+                axis=1) / counts.sum(axis=1)
+        return (self.speaker_moments.mean(),
+            self.speaker_moments.standard_deviation(), log_means)
+
+    # Lines of the table of speakers.
+    def speaker_table(self):
+        means, deviations, log_means = self.speaker_norms()
+        header = ['speaker', 'lines']
+        for formant in range(1, number_of_formants + 1):
+            header += ['f{0}_mean'.format(formant), 'f{0}_sd'.format(formant)]
+        header.append('log_mean')
+        lines = ['\t'.join(header) + '\n']
+        for speaker in sorted(self.speakers):
+            code = self.speakers[speaker]
+            fields = [speaker, '{0:.0f}'.format(self.speaker_lines[code])]
+            for formant in range(number_of_formants):
+                fields += [format_value(means[code, formant]),
+                    format_value(deviations[code, formant])]
+            fields.append(format_value(log_means[code], 4))
+            lines.append('\t'.join(fields) + '\n')
+        return lines
+
+    # Lines of the table of vowels: each speaker's mean F1-F3 at
+    # summary_point of each vowel, raw and normalised.
+    def vowel_table(self):
+        means, deviations, log_means = self.speaker_norms()
+        cells = np.arange(number_of_formants) + \
+            summary_point * number_of_formants
+        point = '{0}%'.format(summary_point * 10)
+        header = ['speaker', 'interval_label', 'lines']
+        for formant in range(1, number_of_formants + 1):
+            header += [
+                'f{0}_{1}_{2}'.format(formant, point, statistic)
+                for statistic in ['mean', 'sd', 'lobanov', 'nearey']
+                ]
+        speaker_names = dict(
+            (code, speaker) for speaker, code in self.speakers.items()
+            )
+        vowel_means = self.vowel_moments.mean()[:, cells]
+        vowel_deviations = self.vowel_moments.standard_deviation()[:, cells]
+        vowel_log_means = self.vowel_log_moments.mean()[:, cells]
+        lines = ['\t'.join(header) + '\n']
+        for (speaker_code, label), code in sorted(self.vowels.items(),
+            key=lambda vowel: (speaker_names[vowel[0][0]], vowel[0][1])):
+            fields = [speaker_names[speaker_code], label,
+                '{0:.0f}'.format(self.vowel_lines[code])]
+            for formant in range(number_of_formants):
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    lobanov = (vowel_means[code, formant] -
+                        means[speaker_code, formant]) / \
+                        deviations[speaker_code, formant]
+                nearey = vowel_log_means[code, formant] - \
+                    log_means[speaker_code]
+                fields += [
+                    format_value(vowel_means[code, formant]),
+                    format_value(vowel_deviations[code, formant]),
+                    format_value(lobanov, 4), format_value(nearey, 4)
+                    ]
+            lines.append('\t'.join(fields) + '\n')
+        return lines
+
+    # Write a copy of an output file with the Lobanov and Nearey normalised
+    # values of every formant at every point added to each line, reading and
+    # writing a chunk at a time. Only the lines read by update() are copied.
+    def write_normalised(self, log_path, normalised_path):
+        means, deviations, log_means = self.speaker_norms()
+        line_count = 0
+        try:
+            with open(log_path, 'rb') as fin, \
+                open(normalised_path, 'w') as fout:
+                header = [
+                    '{0}_{1}'.format(column, method)
+                    for method in ['lobanov', 'nearey']
+                    for column in columnarlog.formant_columns
+                    ]
+                fout.write('\t'.join(log_header_fields(fin) + header) + '\n')
+                for rows, position in read_chunks(fin, self.position):
+                    if len(rows) == 0:
+                        continue
+                    values, sound_names, labels = parse_rows(rows)
+                    codes = self.speaker_codes(sound_names)
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        lobanov = (values - means[codes][:, None, :]) / \
+                            deviations[codes][:, None, :]
+                        nearey = np.log(values) - log_means[codes][:, None,
+                            None]
+                    normalised = np.concatenate((
+                        lobanov.reshape(len(rows), -1),
+                        nearey.reshape(len(rows), -1)), axis=1)
+                    row_format = '\t'.join(['%.4f'] * normalised.shape[1])
+                    fout.write(''.join(
+                        '\t'.join(row) + '\t' +
+                        (row_format % tuple(row_values)).replace(
+                            'nan', '--undefined--') + '\n'
+                        for row, row_values in zip(rows, normalised.tolist())
+                        ))
+                    line_count += len(rows)
+        except EnvironmentError:
+            sys.exit('Error: could not write normalised output file {0}.'.
+                format(normalised_path))
+        return line_count
+
+    # Save the accumulators, to carry on from later.
+    def save(self, file_path):
+        vowel_keys = sorted(self.vowels.items(), key=lambda vowel: vowel[1])
+        arrays = {
+            'speaker_pattern': np.array(self.speaker_pattern),
+            'position': np.array(self.position, dtype=np.int64),
+            'tail': np.frombuffer(self.tail, dtype=np.uint8),
+            'speakers': np.array(
+                sorted(self.speakers, key=self.speakers.get), dtype=str),
+            'vowel_speaker_codes': np.array(
+                [key[0] for key, code in vowel_keys], dtype=np.int64),
+            'vowel_labels': np.array(
+                [key[1] for key, code in vowel_keys], dtype=str),
+            'speaker_lines': self.speaker_lines,
+            'vowel_lines': self.vowel_lines
+            }
+        for name in moment_names:
+            moments = getattr(self, name)
+            arrays[name + '_counts'] = moments.counts
+            arrays[name + '_means'] = moments.means
+            arrays[name + '_m2s'] = moments.m2s
+        # Written under another name first, so that a summary file is never
+        # left half-written.
+        try:
+            handle, temporary_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(file_path)),
+                suffix='.tmp')
+            with os.fdopen(handle, 'wb') as fout:
+                np.savez(fout, **arrays)
+            os.replace(temporary_path, file_path)
+        except EnvironmentError:
+            sys.exit('Error: could not write summary file {0}.'.
+                format(file_path))
+
+# Names of the accumulators of a LogSummary.
+moment_names = [
+    'speaker_moments', 'speaker_log_moments', 'vowel_moments',
+    'vowel_log_moments'
+    ]
+
+# The accumulators saved in a summary file, or empty ones if there's no file
+# or it was made with another speaker_pattern.
+def read_summary(file_path, speaker_pattern=''):
+    check_numpy()
+    summary = LogSummary(speaker_pattern)
+    if not os.path.isfile(file_path):
+        return summary
+    try:
+        with np.load(file_path) as stored:
+            if str(stored['speaker_pattern']) != speaker_pattern:
+                return summary
+            summary.position = int(stored['position'])
+            summary.tail = stored['tail'].tobytes()
+            summary.speakers = dict(
+                (str(speaker), code)
+                for code, speaker in enumerate(stored['speakers'])
+                )
+            summary.vowels = dict(
+                ((int(speaker_code), str(label)), code)
+                for code, (speaker_code, label) in enumerate(zip(
+                    stored['vowel_speaker_codes'], stored['vowel_labels']))
+                )
+            summary.speaker_lines = stored['speaker_lines']
+            summary.vowel_lines = stored['vowel_lines']
+            for name in moment_names:
+                moments = getattr(summary, name)
+                moments.counts = stored[name + '_counts']
+                moments.means = stored[name + '_means']
+                moments.m2s = stored[name + '_m2s']
+    except (EnvironmentError, KeyError, ValueError):
+        sys.exit('Error: could not read summary file {0}.'.format(file_path))
+    return summary
+
+# Fields of the header line of an output file opened in binary mode, leaving
+# it at the start of the first logged line. Files without a header get the
+# usual one.
+def log_header_fields(fin):
+    start = fin.tell()
+    fields = fin.readline().decode(log_encoding).rstrip('\r\n').split(
+        '\t')
+    if resultstore.is_logged_line(fields):
+        fin.seek(start)
+        return ['Sound file', 'Interval position'] + \
+            columnarlog.formant_columns + ['interval_label'] + \
+            columnarlog.parameter_columns + ['time_stamp']
+    return fields
+
+# A value for a table, or --undefined-- for NaN.
+def format_value(value, decimals=1):
+    if np.isnan(value):
+        return '--undefined--'
+    return '{0:.{1}f}'.format(value, decimals)
+
+# Write lines of a table to file_path.
+def write_table(file_path, lines):
+    try:
+        with open(file_path, 'w') as fout:
+            fout.write(''.join(lines))
+    except EnvironmentError:
+        sys.exit('Error: could not write {0}.'.format(file_path))
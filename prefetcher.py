@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# prefetcher.py
+# Background measuring of upcoming intervals for logformantsbylabel.py.
+
+# While the user is looking at one interval, the next ones can be measured (or,
+# with Praat, their sound files loaded and analysed) on a background thread, so
+# that they are ready as soon as the user moves on. Work is kept under a key
+# that includes the measuring settings, so results for old settings are never
+# used. Work is dropped once it has been taken or waited for, and errors in it
+# are raised then, as if it had been done in the foreground.
+
+import concurrent.futures
+
+class Prefetcher(object):
+
+    def __init__(self):
+        # A single worker thread, so background work is done in the order it
+        # was asked for, and never overlaps.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.futures = {}
+
+    # Start function(*args) in the background, unless there's already work
+    # under this key.
+    def request(self, key, function, *args):
+        if key not in self.futures:
+            self.futures[key] = self.executor.submit(function, *args)
+
+    # Result of the work under key, waiting for it to finish if need be, or
+    # None if there isn't any. Errors in the work are raised here.
+    def take(self, key):
+        future = self.futures.pop(key, None)
+        if future is None:
+            return None
+        return future.result()
+
+    # Drop work under any key not in keys (e.g. intervals that are no longer
+    # coming up, or were measured with settings since changed), so that work
+    # that will never be taken isn't kept. Work that hasn't started yet is
+    # cancelled.
+    def retain(self, keys):
+        for key in list(self.futures):
+            if key not in keys:
+                self.futures.pop(key).cancel()
+
+    # Wait until all background work has finished, and drop it. Errors in the
+    # work are raised here.
+    def wait(self):
+        futures = list(self.futures.values())
+        self.futures = {}
+        for future in futures:
+            future.result()
+
+    # Drop all work, e.g. because the measuring settings have changed. Work
+    # that hasn't started yet is cancelled; work already started is waited for,
+    # so nothing is left running in the background.
+    def invalidate(self):
+        for future in self.futures.values():
+            future.cancel()
+        concurrent.futures.wait(list(self.futures.values()))
+        self.futures = {}
+
+    def close(self):
+        self.invalidate()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# resultstore.py
+# Indexed store of logged measurements for logformantsbylabel.py.
+
+# Every line logged to the output file is also kept in an SQLite database,
+# indexed by sound file, textgrid tier, interval position and parameter set
+# (the interval label, spectrogram window length, tier and measuring settings
+# logged with it). Lines are added in transactions, so a run that is killed
+# part way through leaves whole lines behind, and the store can say which
+# intervals have already been logged without reading the whole output file. The
+# output file can be written out again from the store at any time.
+
+import os
+import sqlite3
+import sys
+
+# Number of tab-separated fields at the end of a logged line that aren't
+# measurements: interval_label, spectrogram_window_length, textgrid_tier, five
+# formant references, three costs and the time stamp.
+settings_field_count = 12
+
+# Number of fields in a logged line: the sound file and interval position, F1,
+# F2 and F3 at each tenth (or, in lines logged before measuring started at 0%,
+# from 10% on), and the settings fields.
+logged_field_counts = (2 + 33 + settings_field_count,
+    2 + 30 + settings_field_count)
+
+# Index of a logged line (split into fields): sound file, textgrid tier,
+# interval position and parameter set.
+def line_key(fields):
+    return (fields[0], fields[-10], int(fields[1]),
+        '\t'.join(fields[-settings_field_count:-1]))
+
+# Whether a line read from an output file is a whole logged line (not the
+# header, or a line cut short).
+def is_logged_line(fields):
+    return len(fields) > settings_field_count + 2 and fields[1].isdigit()
+
+class ResultStore(object):
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        try:
+            self.connection = sqlite3.connect(file_path)
+            # Write-ahead logging keeps committed lines safe if the run is
+            # killed, without syncing the whole database on every commit.
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS measurements (' +
+                'sound_file TEXT NOT NULL, ' +
+                'textgrid_tier TEXT NOT NULL, ' +
+                'interval_position INTEGER NOT NULL, ' +
+                'parameter_set TEXT NOT NULL, ' +
+                'line TEXT NOT NULL, ' +
+                'PRIMARY KEY (sound_file, textgrid_tier, interval_position, ' +
+                'parameter_set))'
+                )
+            # The size of the output file when lines were last added, so
+            # that lines written to it but not to the store can be found.
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS log_state (' +
+                'name TEXT PRIMARY KEY, ' +
+                'value INTEGER NOT NULL)'
+                )
+            self.connection.commit()
+        except sqlite3.Error:
+            sys.exit('Error: could not open result store {0}.'.
+                format(file_path))
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM measurements'
+            ).fetchone()[0]
+
+    # Add logged lines (as written to the output file) in a single
+    # transaction. A line for an interval already measured with the same
+    # parameter set replaces the earlier one. log_size is the size of the
+    # output file once the lines have been written to it.
+    def add_lines(self, lines, log_size=None):
+        rows = []
+        for line in lines:
+            fields = line.rstrip('\r\n').split('\t')
+            rows.append(line_key(fields) + ('\t'.join(fields),))
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?)',
+                    rows
+                    )
+                if log_size is not None:
+                    self.connection.execute(
+                        'INSERT OR REPLACE INTO log_state VALUES (?, ?)',
+                        ('log_size', log_size)
+                        )
+        except sqlite3.Error:
+            sys.exit('Error: could not write to result store {0}.'.
+                format(self.file_path))
+
+    # Names of sound files with at least one logged interval.
+    def logged_sound_files(self):
+        return set(row[0] for row in self.connection.execute(
+            'SELECT DISTINCT sound_file FROM measurements'
+            ))
+
+    # Positions of intervals logged for a sound file on a given tier, with any
+    # parameter set.
+    def logged_positions(self, sound_file, textgrid_tier):
+        return set(row[0] for row in self.connection.execute(
+            'SELECT interval_position FROM measurements ' +
+            'WHERE sound_file = ? AND textgrid_tier = ?',
+            (sound_file, str(textgrid_tier))
+            ))
+
+    # Size of the output file when lines were last added, or None if the
+    # store has no record of it.
+    def log_size(self):
+        row = self.connection.execute(
+            'SELECT value FROM log_state WHERE name = ?', ('log_size',)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    # Bring the store up to date with an existing output file. Lines are
+    # written to the output file before the store, so a run stopped between
+    # the two leaves lines past the size the store knows of; only those are
+    # read. An output file the store has no record of (e.g. a log made before
+    # there was a store) or one that has since shrunk is read in full.
+    def import_log(self, log_path):
+        log_size = os.path.getsize(log_path)
+        known_size = self.log_size()
+        if known_size == log_size:
+            return
+        if known_size is None or known_size > log_size:
+            known_size = 0
+        lines = []
+        with open(log_path) as fin:
+            fin.seek(known_size)
+            for line in fin:
+                fields = line.rstrip('\r\n').split('\t')
+                # Header lines aren't logged lines, so are passed over.
+                if is_logged_line(fields):
+                    lines.append(line)
+        self.add_lines(lines, log_size)
+
+    # Every stored line, in the order they were added.
+    def lines(self):
+        for row in self.connection.execute(
+            'SELECT line FROM measurements ORDER BY rowid'):
+            yield row[0] + '\n'
+
+    # Write every stored line out to an output file, with a header line.
+    def export_log(self, log_path, header_line):
+        try:
+            with open(log_path, 'w') as fout:
+                fout.write(header_line)
+                for line in self.lines():
+                    fout.write(line)
+        except EnvironmentError:
+            sys.exit('Error: Could not write to output file {0}.'.
+                format(log_path))
+
+# If a run was killed while writing to the output file, its last line may be
+# incomplete; cut it off. (Lines reach the store after the output file, so its
+# interval isn't marked as logged, and is measured again.)
+def repair_log(log_path):
+    with open(log_path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        # Find the end of the last complete line.
+        position = size
+        while position > 0:
+            step = min(4096, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                f.truncate(position + newline + 1)
+                return
+        f.truncate(0)
+
+# Lines of several output files (e.g. from shards of a run) combined: where
+# the same interval was logged with the same parameter set more than once,
+# only the line with the latest time stamp is kept. Lines are put in order of
+# sound file, textgrid tier, interval position and parameter set, so the same
+# logs always give the same result, whichever order they're read in.
+def merge_logs(log_paths):
+    latest = {}
+    for log_path in log_paths:
+        try:
+            with open(log_path) as fin:
+                for line in fin:
+                    fields = line.rstrip('\r\n').split('\t')
+                    if not is_logged_line(fields):
+                        continue
+                    if len(fields) not in logged_field_counts:
+                        sys.exit('Error: {0} has a line with {1} fields, '.
+                            format(log_path, len(fields)) +
+                            'which is not a line of measurements.')
+                    key = line_key(fields)
+                    # Time stamps (YYYY/MM/DD HH:MM:SS) sort as strings; on
+                    # a tie the whole line decides, so the choice is the
+                    # same every time.
+                    if key not in latest or \
+                        (fields[-1], fields) > (latest[key][-1], latest[key]):
+                        latest[key] = fields
+        except EnvironmentError:
+            sys.exit('Error: could not read output file {0}.'.
+                format(log_path))
+    return ['\t'.join(latest[key]) + '\n' for key in sorted(latest)]
+
+# Add lines to the output file and make sure they reach the disk. Returns the
+# size of the file afterwards.
+def append_to_log(log_path, lines):
+    with open(log_path, 'a') as fout:
+        fout.write(''.join(lines))
+        fout.flush()
+        os.fsync(fout.fileno())
+        return os.fstat(fout.fileno()).st_size
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# speakerprofiles.py
+# Tracking settings for each speaker, for logformantsbylabel.py.
+
+# Sound files are grouped by speaker. By default, the directory a sound file is
+# in (below the data directory) names its speaker, or, for a file at the top of
+# the data directory, the file itself does. A speaker_pattern (a regular
+# expression) can pick the speaker out of the file's name (its path below the
+# data directory) instead: the first group if it has one, otherwise the whole
+# match, e.g. "^[^_]+" for the part before the first underscore.
+
+# --optimise tracks every interval of each speaker with a range of candidate
+# settings, the reference frequencies for the speaker's sex scaled up and down
+# together (as for a longer or shorter vocal tract), and keeps the candidate
+# whose intervals have the lowest mean quality score (see trackquality.py) as
+# the speaker's profile. Profiles are kept in a tab-separated file, and are
+# used in place of the settings for the speaker's sex whenever the speaker's
+# files are measured.
+
+import os
+import re
+import sys
+
+import trackquality
+import trajectorylog
+
+# A profile keeps the measuring settings used by formant tracking.
+profile_columns = ['speaker', 'sex'] + trajectorylog.tracking_columns + \
+    ['score', 'intervals']
+
+# Factors the reference frequencies are scaled by for the candidate settings,
+# in the order they're preferred when candidates score the same.
+reference_factors = [1, 0.95, 1.05, 0.9, 1.1, 0.85, 1.15, 0.8, 1.2]
+
+# Scores above this (including those of intervals that can't be scored) count
+# as this, so a few bad intervals can't outweigh all the others.
+score_cap = 10
+
+# The speaker of a sound file, named by its path below the data directory
+# without the extension.
+def speaker_name(sound_name, speaker_pattern=''):
+    if speaker_pattern:
+        match = re.search(speaker_pattern, sound_name)
+        if match is None:
+            return sound_name
+        if match.groups():
+            return match.group(1)
+        return match.group(0)
+    if '/' in sound_name:
+        return sound_name.rsplit('/', 1)[0]
+    return sound_name
+
+# Candidate settings for optimising: measuring_params with the reference
+# frequencies scaled by each of reference_factors.
+def candidate_parameter_sets(measuring_params):
+    return trackquality.scaled_parameter_sets(measuring_params,
+        reference_factors)
+
+class ProfileOptimiser(object):
+
+    def __init__(self, candidates):
+        self.candidates = candidates
+        # Total score and number of intervals for each candidate, by speaker.
+        self.totals = {}
+        self.counts = {}
+
+    # Add the quality score of one of a speaker's intervals tracked with
+    # candidate number candidate_no.
+    def add(self, speaker, candidate_no, score):
+        if speaker not in self.totals:
+            self.totals[speaker] = [0.0] * len(self.candidates)
+            self.counts[speaker] = [0] * len(self.candidates)
+        self.totals[speaker][candidate_no] += min(score, score_cap)
+        self.counts[speaker][candidate_no] += 1
+
+    # The best candidate for each speaker, as a profile: a dictionary of
+    # profile_columns, with the candidate's mean score.
+    def profiles(self, sex):
+        profiles = {}
+        for speaker in self.totals:
+            means = [
+                total / count if count > 0 else float('inf')
+                for total, count in zip(self.totals[speaker],
+                    self.counts[speaker])
+                ]
+            best = means.index(min(means))
+            profile = dict(
+                (key, self.candidates[best][key])
+                for key in trajectorylog.tracking_columns
+                )
+            profile['speaker'] = speaker
+            profile['sex'] = sex
+            profile['score'] = '{0:.3f}'.format(means[best])
+            profile['intervals'] = str(self.counts[speaker][best])
+            profiles[speaker] = profile
+        return profiles
+
+# Profiles from a profiles file, by speaker, or none if there's no file.
+def read_profiles(file_path):
+    profiles = {}
+    if not os.path.isfile(file_path):
+        return profiles
+    try:
+        lines = [
+            line.rstrip('\r\n').split('\t') for line in open(file_path)
+            if len(line.strip()) > 0
+            ]
+    except EnvironmentError:
+        sys.exit('Error: could not read speaker profiles {0}.'.
+            format(file_path))
+    if len(lines) == 0 or lines[0] != profile_columns:
+        sys.exit('Error: {0} is not a speaker profiles file.'.
+            format(file_path))
+    for fields in lines[1:]:
+        profiles[fields[0]] = dict(zip(profile_columns, fields))
+    return profiles
+
+# Write profiles to a profiles file, keeping the profiles already there of
+# other speakers.
+def update_profiles(file_path, profiles):
+    all_profiles = read_profiles(file_path)
+    all_profiles.update(profiles)
+    try:
+        with open(file_path, 'w') as fout:
+            fout.write('\t'.join(profile_columns) + '\n')
+            for speaker in sorted(all_profiles):
+                fout.write('\t'.join(
+                    all_profiles[speaker][column] for column in profile_columns
+                    ) + '\n')
+    except EnvironmentError:
+        sys.exit('Error: could not write speaker profiles {0}.'.
+            format(file_path))
+
+# The measuring settings in the profile of a sound file's speaker, or None if
+# the speaker has no profile.
+def profile_params(profiles, sound_name, speaker_pattern=''):
+    profile = profiles.get(speaker_name(sound_name, speaker_pattern))
+    if profile is None:
+        return None
+    return dict(
+        (key, profile[key]) for key in trajectorylog.tracking_columns
+        )
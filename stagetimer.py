@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# stagetimer.py
+# Timing of the stages of measuring and logging for logformantsbylabel.py.
+
+# Each stage of the work (scanning the data directory, reading textgrids,
+# running Praat, the stages timed inside the Praat script, logging and so on)
+# is timed as it happens. Totals are kept for every stage, for a summary at the
+# end of the run, and each timing can also be written to a metrics file as it
+# is made: a tab-separated line giving the sound file and interval position
+# being worked on (blank for stages not tied to one interval), the stage and
+# the time taken in seconds.
+
+import contextlib
+import sys
+import time
+
+class StageTimer(object):
+
+    def __init__(self, metrics_path=None):
+        self.metrics_path = metrics_path
+        # Count and total seconds for each stage, in the order first timed.
+        self.totals = {}
+        self.stages = []
+        self.sound_file = ''
+        self.interval_position = ''
+        self.metrics_file = None
+        if metrics_path is not None:
+            try:
+                self.metrics_file = open(metrics_path, 'w')
+                self.metrics_file.write(
+                    'sound_file\tinterval_position\tstage\tseconds\n'
+                    )
+            except EnvironmentError:
+                sys.exit('Error: could not write to metrics file {0}.'.
+                    format(metrics_path))
+
+    # Tie the stages timed from now on to an interval (or, with no arguments,
+    # to none).
+    def set_interval(self, sound_file='', interval_position=''):
+        self.sound_file = sound_file
+        self.interval_position = str(interval_position)
+
+    # Add a stage that took the given number of seconds.
+    def add(self, stage, seconds):
+        if stage not in self.totals:
+            self.totals[stage] = [0, 0.0]
+            self.stages.append(stage)
+        self.totals[stage][0] += 1
+        self.totals[stage][1] += seconds
+        if self.metrics_file is not None:
+            self.metrics_file.write('{0}\t{1}\t{2}\t{3:.6f}\n'.format(
+                self.sound_file, self.interval_position, stage, seconds
+                ))
+
+    # Time the code run inside a with block as a stage.
+    @contextlib.contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    # Table of the number of times each stage was timed, its total time and
+    # its mean time.
+    def summary(self):
+        if len(self.stages) == 0:
+            return 'No stages timed.'
+        width = max(len('Stage'), max(len(stage) for stage in self.stages))
+        lines = ['{0:<{1}}  {2:>6}  {3:>10}  {4:>10}'.format(
+            'Stage', width, 'Count', 'Total (s)', 'Mean (ms)'
+            )]
+        for stage in self.stages:
+            count, seconds = self.totals[stage]
+            lines.append('{0:<{1}}  {2:>6}  {3:>10.3f}  {4:>10.1f}'.format(
+                stage, width, count, seconds, seconds / count * 1000
+                ))
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.metrics_file is not None:
+            self.metrics_file.close()
+            self.metrics_file = None
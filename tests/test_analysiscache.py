@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# test_analysiscache.py
+# Tests for analysiscache.py: results are found by the contents of the sound
+# file, and the least recently used are removed once the cache is over its
+# size limit.
+
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+import analysiscache
+import benchmark
+import corpusmanifest
+import formanttracker
+
+settings = (16000, 0.01)
+
+def write_sound(file_path, contents=b'RIFF sound'):
+    with open(str(file_path), 'wb') as fout:
+        fout.write(contents)
+    return str(file_path)
+
+# An array of about size bytes once stored.
+def array_of_size(size, value=1.0):
+    return np.full(size // 8, value)
+
+@pytest.fixture
+def cache(tmp_path):
+    return analysiscache.AnalysisCache(str(tmp_path / 'cache'), 10 ** 6)
+
+def test_put_and_get(cache, tmp_path):
+    sound_path = write_sound(tmp_path / 'a.wav')
+    assert cache.get('formants', sound_path, settings) is None
+    array = np.arange(12.0).reshape(4, 3)
+    cache.put('formants', sound_path, settings, array)
+    assert np.array_equal(cache.get('formants', sound_path, settings), array)
+    # Other kinds of result, and other settings, are kept apart.
+    assert cache.get('resampled', sound_path, settings) is None
+    assert cache.get('formants', sound_path, (16000, 0.005)) is None
+
+# A copy of a sound file finds the same results; a file whose contents have
+# changed doesn't.
+def test_keyed_by_contents(cache, tmp_path):
+    sound_path = write_sound(tmp_path / 'a.wav')
+    cache.put('formants', sound_path, settings, np.ones(3))
+    copy_path = write_sound(tmp_path / 'copy.wav')
+    assert np.array_equal(cache.get('formants', copy_path, settings),
+        np.ones(3))
+    write_sound(sound_path, b'RIFF other sound')
+    os.utime(sound_path, (1000000000, 1000000000))
+    assert cache.get('formants', sound_path, settings) is None
+
+# A hash given by remember_hash is used while the file's size and
+# modification time are unchanged, without reading the file.
+def test_remember_hash(cache, tmp_path, monkeypatch):
+    sound_path = write_sound(tmp_path / 'a.wav')
+    stat = os.stat(sound_path)
+    contents_hash = corpusmanifest.file_hash(sound_path)
+    cache.remember_hash(sound_path, stat.st_size, stat.st_mtime,
+        contents_hash)
+    def no_hashing(file_path):
+        raise AssertionError('file hashed again')
+    monkeypatch.setattr(corpusmanifest, 'file_hash', no_hashing)
+    assert cache.contents_hash(sound_path) == contents_hash
+    cache.put('formants', sound_path, settings, np.ones(3))
+    assert cache.get('formants', sound_path, settings) is not None
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = analysiscache.AnalysisCache(str(tmp_path / 'cache'), 25000)
+    sound_paths = [write_sound(tmp_path / '{0}.wav'.format(name),
+        name.encode('ascii')) for name in 'abcd']
+    for number, sound_path in enumerate(sound_paths[:3]):
+        cache.put('formants', sound_path, settings, array_of_size(8000))
+        entry_path = cache.entry_path('formants', sound_path, settings)
+        os.utime(entry_path, (1000000000 + number, 1000000000 + number))
+    # Using the oldest makes it the most recently used.
+    assert cache.get('formants', sound_paths[0], settings) is not None
+    cache.put('formants', sound_paths[3], settings, array_of_size(8000))
+
+    kept = [cache.get('formants', sound_path, settings) is not None
+        for sound_path in sound_paths]
+    assert kept == [True, False, True, True]
+    assert cache.size <= cache.size_limit
+    assert cache.size == sum(size for path, size, used in cache.entries())
+
+# Entries another process has put in the cache count towards its size.
+def test_size_shared_between_caches(tmp_path):
+    directory = str(tmp_path / 'cache')
+    first = analysiscache.AnalysisCache(directory, 25000)
+    second = analysiscache.AnalysisCache(directory, 25000)
+    sound_paths = [write_sound(tmp_path / '{0}.wav'.format(name),
+        name.encode('ascii')) for name in 'abcd']
+    for sound_path in sound_paths[:2]:
+        first.put('formants', sound_path, settings, array_of_size(8000))
+    for sound_path in sound_paths[2:]:
+        second.put('formants', sound_path, settings, array_of_size(8000))
+    assert sum(size for path, size, used in first.entries()) <= 25000
+
+# No temporary files are left behind.
+def test_no_temporary_files(cache, tmp_path):
+    sound_path = write_sound(tmp_path / 'a.wav')
+    cache.put('formants', sound_path, settings, np.ones(3))
+    assert [name for name in os.listdir(cache.directory)
+        if not name.endswith(analysiscache.cache_extension)] == []
+
+# The numpy engine gives the same analysis with and without the cache, and
+# from the cache once it's there.
+def test_formanttracker_analyses(tmp_path):
+    benchmark.make_corpus(str(tmp_path), 1, 1.0, 2, 16000, 4)
+    sound_path = str(tmp_path / 'synthetic0001.wav')
+    try:
+        formanttracker.use_analysis_cache(None, 0)
+        uncached = formanttracker.analyse_with_cache(sound_path, (0.2, 0.6))
+        formanttracker.use_analysis_cache(str(tmp_path / 'cache'), 10 ** 8)
+        stored = formanttracker.analyse_with_cache(sound_path, (0.2, 0.6))
+        assert len(os.listdir(str(tmp_path / 'cache'))) == 2
+        cached = formanttracker.analyse_with_cache(sound_path, (0.2, 0.6))
+    finally:
+        formanttracker.use_analysis_cache(None, 0)
+    for result in (stored, cached):
+        for array, expected in zip(result, uncached):
+            assert np.array_equal(array, expected, equal_nan=True)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# test_columnarlog.py
+# Tests for columnarlog.py: logged lines written as shards read back the same,
+# and time stamps, which are logged in local time, are stored as the right
+# seconds since 1970 either side of a change to daylight saving time.
+
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+import columnarlog
+
+def log_line(sound_file, position, time_stamp):
+    values = ['500', '1500', '2500'] * 10 + ['--undefined--'] * 3
+    return '\t'.join([sound_file, str(position)] + values + ['V', '0.005',
+        '1', '500', '1485', '2475', '3465', '4455', '1', '1', '1',
+        time_stamp]) + '\n'
+
+@pytest.fixture
+def london_time(monkeypatch):
+    if not hasattr(time, 'tzset'):
+        pytest.skip('time zone can only be set on Unix')
+    monkeypatch.setenv('TZ', 'Europe/London')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_write_and_read(tmp_path, london_time):
+    writer = columnarlog.ColumnarWriter(str(tmp_path), 'formant-tenths')
+    writer.add_lines([
+        log_line('a', 2, '2024/01/01 12:00:00'),
+        log_line('b', 4, '2024/07/01 12:00:00'),
+        log_line('a', 6, 'not a time')
+        ])
+    writer.close()
+    columns = columnarlog.read_columns(str(tmp_path))
+    assert [columns['sound_files'][code] for code in
+        columns['sound_file_codes']] == ['a', 'b', 'a']
+    assert list(columns['interval_position']) == [2, 4, 6]
+    assert list(columns['f2_50%']) == [1500] * 3
+    assert np.all(np.isnan(columns['f1_100%']))
+    # 12:00 in London is 12:00 UTC in winter, 11:00 UTC in summer.
+    assert list(columns['time_stamp']) == [1704110400, 1719831600, -1]
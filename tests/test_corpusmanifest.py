@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# test_corpusmanifest.py
+# Tests for corpusmanifest.py: scanning finds files without hashing them,
+# hashes worked out elsewhere are kept, a file only counts as unchanged after
+# its time changes if its contents are known to be the same, and scanning
+# doesn't loop through links or search the directories it's told to skip.
+
+import os
+
+import pytest
+
+import corpusmanifest
+
+extensions = ('.wav', '.TextGrid')
+
+def write_file(file_path, contents=b'RIFF sound'):
+    with open(str(file_path), 'wb') as fout:
+        fout.write(contents)
+    return str(file_path)
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = corpusmanifest.CorpusManifest(str(tmp_path / 'manifest.db'))
+    yield manifest
+    manifest.close()
+
+def test_scan_without_hashing(manifest, tmp_path, monkeypatch):
+    directory = tmp_path / 'data'
+    (directory / 'speaker1').mkdir(parents=True)
+    write_file(directory / 'a.wav')
+    write_file(directory / 'speaker1' / 'b.wav')
+    write_file(directory / 'speaker1' / 'b.txt')
+    def no_hashing(file_path):
+        raise AssertionError('file hashed')
+    monkeypatch.setattr(corpusmanifest, 'file_hash', no_hashing)
+    assert manifest.scan(str(directory), extensions) == \
+        set(['a.wav', 'speaker1/b.wav'])
+    assert manifest.names('.wav') == ['a', 'speaker1/b']
+    assert manifest.file_info('a.wav')[2] is None
+    # Nothing has changed since.
+    assert manifest.scan(str(directory), extensions) == set()
+
+def test_remember_hashes(manifest, tmp_path):
+    directory = tmp_path / 'data'
+    (directory / 'speaker1').mkdir(parents=True)
+    sound_path = write_file(directory / 'speaker1' / 'b.wav')
+    manifest.scan(str(directory), extensions)
+    stat = os.stat(sound_path)
+    manifest.remember_hashes(str(directory), {sound_path: (stat.st_size,
+        stat.st_mtime, corpusmanifest.file_hash(sound_path))})
+    assert manifest.file_info('speaker1/b.wav')[2] == \
+        corpusmanifest.file_hash(sound_path)
+    # A hash for a file that has changed since the scan isn't kept.
+    other_path = write_file(directory / 'c.wav')
+    manifest.scan(str(directory), extensions)
+    manifest.remember_hashes(str(directory), {other_path: (stat.st_size + 1,
+        stat.st_mtime, 'stale')})
+    assert manifest.file_info('c.wav')[2] is None
+
+# A file touched but not changed is only unchanged if it was hashed.
+def test_touched_files(manifest, tmp_path):
+    directory = tmp_path / 'data'
+    directory.mkdir()
+    hashed_path = write_file(directory / 'a.wav')
+    unhashed_path = write_file(directory / 'b.wav')
+    manifest.scan(str(directory), extensions)
+    stat = os.stat(hashed_path)
+    manifest.remember_hashes(str(directory), {hashed_path: (stat.st_size,
+        stat.st_mtime, corpusmanifest.file_hash(hashed_path))})
+    for file_path in (hashed_path, unhashed_path):
+        os.utime(file_path, (1000000000, 1000000000))
+    assert manifest.scan(str(directory), extensions) == set(['b.wav'])
+    write_file(hashed_path, b'RIFF other sound')
+    assert manifest.scan(str(directory), extensions) == set(['a.wav'])
+    assert manifest.file_info('a.wav')[2] == \
+        corpusmanifest.file_hash(hashed_path)
+
+# A link back up the tree is followed once, not round and round, and
+# directories to be skipped aren't searched.
+def test_links_and_skipped_directories(tmp_path):
+    directory = tmp_path / 'data'
+    (directory / 'speaker1').mkdir(parents=True)
+    (directory / 'output').mkdir()
+    write_file(directory / 'speaker1' / 'b.wav')
+    write_file(directory / 'output' / 'c.wav')
+    try:
+        os.symlink(str(directory), str(directory / 'speaker1' / 'loop'))
+        os.symlink(str(directory / 'speaker1'), str(directory / 'linked'))
+    except (OSError, NotImplementedError):
+        pytest.skip('symbolic links not supported')
+    manifest = corpusmanifest.CorpusManifest(str(tmp_path / 'manifest.db'),
+        skip_directories=[str(directory / 'output')])
+    try:
+        assert manifest.scan(str(directory), extensions) == \
+            set(['speaker1/b.wav'])
+    finally:
+        manifest.close()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# test_formanttracker.py
+# Tests for formanttracker.py: F1-F3 measured at tenths of synthetic vowels
+# (made as benchmark.py makes them) are close to the formants they were made
+# with, values are read off the tracks as Praat's "Get value at time..."
+# reads them, and parts of a sound file read near its start are the same as
+# the start of the file.
+
+import pytest
+
+np = pytest.importorskip('numpy')
+import benchmark
+import formanttracker
+
+measuring_params = {'f1_reference': '500', 'f2_reference': '1485',
+    'f3_reference': '2475', 'f4_reference': '3465', 'f5_reference': '4455',
+    'frequency_cost': '1', 'bandwidth_cost': '1', 'transition_cost': '1'}
+
+# Start and end F1-F3 of the vowels measured: one steady, two moving.
+vowels = [
+    ([500, 1500, 2500], [500, 1500, 2500]),
+    ([700, 1100, 2500], [300, 2200, 2900]),
+    ([750, 1300, 2700], [650, 1700, 2800])
+    ]
+
+# A sound file half a second long with a vowel from start_time to
+# start_time + 0.2 s, in low noise.
+def write_vowel(file_path, trajectory, start_time=0.1):
+    samples = np.random.RandomState(0).normal(0, benchmark.noise_level, 8000)
+    vowel = benchmark.synthesise_vowel(trajectory, 0.2, 16000)
+    first = int(round(start_time * 16000))
+    samples[first:first + len(vowel)] += vowel
+    benchmark.write_wav(file_path, samples * 0.5 / np.max(np.abs(samples)),
+        16000)
+    formanttracker._analyse_sound_file.cache_clear()
+    formanttracker._analyse_sound_window.cache_clear()
+    return file_path
+
+# Whether the tenths inside a vowel are within 10% (or, for low formants,
+# 50 Hz) of the formants it was made with.
+def close_to_trajectory(measured, trajectory):
+    expected = benchmark.trajectory_at(trajectory, np.arange(11) / 10.0)
+    return np.all(np.abs(measured[1:10] - expected[1:10]) <
+        np.maximum(0.1 * expected[1:10], 50))
+
+@pytest.mark.parametrize('trajectory', vowels)
+def test_measure_synthetic_vowels(tmp_path, trajectory):
+    sound_path = write_vowel(str(tmp_path / 'vowel.wav'), trajectory)
+    for window_margin in (None, 0.05):
+        measured = formanttracker.measure_interval(sound_path, 0.1, 0.3,
+            measuring_params, window_margin)
+        assert measured.shape == (11, 3)
+        assert close_to_trajectory(measured, trajectory)
+
+# One track of four frames, with the third undefined, and another with the
+# first and last undefined.
+track_times = np.array([0.1, 0.11, 0.12, 0.13])
+tracks = np.array([
+    [100, np.nan],
+    [200, 200],
+    [np.nan, 300],
+    [400, np.nan]
+    ])
+
+def test_values_at_times():
+    times = [0.1, 0.1025, 0.1075, 0.1125, 0.1225, 0.1275]
+    expected = np.array([
+        # On a frame, and a quarter of the way to the next one, either side
+        # of the midpoint.
+        [100, np.nan],
+        [125, np.nan],
+        [175, 200],
+        # Next to an undefined frame, the nearer frame alone.
+        [200, 225],
+        [np.nan, 300],
+        [400, np.nan]
+        ])
+    found = formanttracker.values_at_times(track_times, tracks, times)
+    assert np.array_equal(np.isnan(found), np.isnan(expected))
+    assert np.allclose(found[~np.isnan(found)],
+        expected[~np.isnan(expected)])
+
+# Within half a frame of the first or last frame, its value; further out,
+# undefined.
+def test_values_at_times_edges():
+    times = [0.094, 0.097, 0.134, 0.136]
+    found = formanttracker.values_at_times(track_times, tracks[:, :1], times)
+    assert np.isnan(found[0, 0])
+    assert found[1, 0] == 100
+    assert found[2, 0] == 400
+    assert np.isnan(found[3, 0])
+    assert np.all(np.isnan(formanttracker.values_at_times(np.array([]),
+        np.zeros((0, 3)), times)))
+
+# A part of the file starting before the file does is read from its start.
+def test_window_before_start(tmp_path):
+    sound_path = write_vowel(str(tmp_path / 'vowel.wav'), vowels[0], 0.02)
+    samples, sampling_frequency = formanttracker.read_wav(sound_path)
+    window_samples, _, start_time = formanttracker.read_wav_window(
+        sound_path, -0.05, 0.3)
+    assert start_time == 0
+    assert np.array_equal(window_samples, samples[:int(0.3 * 16000)])
+
+    before = formanttracker.track_sound_sweep(sound_path,
+        [measuring_params], -0.05, 0.3)
+    from_start = formanttracker.track_sound_sweep(sound_path,
+        [measuring_params], 0, 0.3)
+    assert np.array_equal(before[0], from_start[0])
+    assert np.allclose(before[1], from_start[1], equal_nan=True)
+    assert np.allclose(before[3][0][0], from_start[3][0][0], equal_nan=True)
+
+    measured = formanttracker.measure_interval(sound_path, 0.02, 0.22,
+        measuring_params, 0.05)
+    assert close_to_trajectory(measured, vowels[0])
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# test_logsummary.py
+# Tests for logsummary.py: statistics accumulated a chunk at a time, merged,
+# or carried on from a saved summary are those of all the values at once, and
+# the output file is read in the encoding it's written in.
+
+import pytest
+
+np = pytest.importorskip('numpy')
+import logsummary
+
+speakers = ['spk1', 'spk2', 'spk3']
+labels = ['a', 'i', 'u']
+
+# Random logged lines, with some values undefined, for sound files of each
+# speaker (in subdirectories named after them) and each label.
+def log_lines(generator, line_count):
+    lines = []
+    for number in range(line_count):
+        speaker = speakers[generator.randint(len(speakers))]
+        values = generator.normal([500, 1500, 2500], [80, 200, 150],
+            (11, 3)).ravel()
+        fields = ['{0}/file{1}'.format(speaker, generator.randint(4)),
+            str(2 * number + 2)]
+        fields += ['--undefined--' if generator.uniform() < 0.05 else
+            str(int(round(value))) for value in values]
+        fields += [labels[generator.randint(len(labels))], '0.005', '1',
+            '500', '1485', '2475', '3465', '4455', '1', '1', '1',
+            '2024/01/01 12:00:00']
+        lines.append('\t'.join(fields) + '\n')
+    return lines
+
+header = 'Sound file\tInterval position\tf1_0%\n'
+
+def write_log(file_path, lines):
+    with open(str(file_path), 'w') as fout:
+        fout.write(header)
+        fout.writelines(lines)
+    return str(file_path)
+
+def assert_close(actual, expected):
+    assert np.array_equal(np.isnan(actual), np.isnan(expected))
+    assert np.allclose(actual[~np.isnan(actual)],
+        expected[~np.isnan(expected)], rtol=1e-9, atol=1e-9)
+
+# Random values in groups, some undefined.
+def grouped_values(generator, row_count, group_count, cell_count):
+    codes = generator.randint(group_count, size=row_count)
+    values = generator.normal(1000, 300, (row_count, cell_count))
+    values[generator.uniform(size=values.shape) < 0.1] = np.nan
+    return codes, values
+
+def brute_force(codes, values, group_count):
+    means = np.full((group_count, values.shape[1]), np.nan)
+    deviations = np.full((group_count, values.shape[1]), np.nan)
+    for group in range(group_count):
+        for cell in range(values.shape[1]):
+            found = values[codes == group, cell]
+            found = found[~np.isnan(found)]
+            if len(found) > 0:
+                means[group, cell] = found.mean()
+            if len(found) > 1:
+                deviations[group, cell] = found.std(ddof=1)
+    return means, deviations
+
+def test_group_moments_one_pass():
+    generator = np.random.RandomState(0)
+    codes, values = grouped_values(generator, 500, 7, 4)
+    moments = logsummary.GroupMoments(4)
+    moments.add(codes, values)
+    means, deviations = brute_force(codes, values, 7)
+    assert_close(moments.mean(), means)
+    assert_close(moments.standard_deviation(), deviations)
+
+# Added in chunks (with groups first seen in later chunks), or accumulated
+# separately and merged, the moments are those of one pass.
+def test_group_moments_chunks_and_merge():
+    generator = np.random.RandomState(1)
+    codes, values = grouped_values(generator, 600, 9, 3)
+    order = np.argsort(codes, kind='stable')
+    codes, values = codes[order], values[order]
+    one_pass = logsummary.GroupMoments(3)
+    one_pass.add(codes, values)
+
+    chunked = logsummary.GroupMoments(3)
+    for first in range(0, 600, 70):
+        chunked.add(codes[first:first + 70], values[first:first + 70])
+    for name in ['counts', 'means', 'm2s']:
+        assert np.allclose(getattr(chunked, name), getattr(one_pass, name))
+
+    merged = logsummary.GroupMoments(3)
+    merged.grow(9)
+    for part in np.array_split(np.arange(600), 4):
+        separate = logsummary.GroupMoments(3)
+        separate.grow(9)
+        separate.add(codes[part], values[part])
+        merged.merge(separate.counts, separate.means, separate.m2s)
+    for name in ['counts', 'means', 'm2s']:
+        assert np.allclose(getattr(merged, name), getattr(one_pass, name))
+
+def test_group_moments_few_values():
+    moments = logsummary.GroupMoments(2)
+    moments.add(np.array([0, 2]), np.array([[1.0, np.nan], [3.0, 4.0]]))
+    assert_close(moments.mean(), np.array([[1.0, np.nan],
+        [np.nan, np.nan], [3.0, 4.0]]))
+    assert np.isnan(moments.standard_deviation()).all()
+
+def test_speaker_norms():
+    generator = np.random.RandomState(2)
+    lines = log_lines(generator, 300)
+    summary = logsummary.LogSummary()
+    summary.add_rows([line.rstrip('\n').split('\t') for line in lines])
+    means, deviations, log_means = summary.speaker_norms()
+    for speaker in speakers:
+        found = np.array([
+            [np.nan if value == '--undefined--' else float(value)
+                for value in line.split('\t')[2:35]]
+            for line in lines if line.startswith(speaker + '/')
+            ]).reshape(-1, 3)
+        code = summary.speakers[speaker]
+        assert np.allclose(means[code], np.nanmean(found, axis=0))
+        assert np.allclose(deviations[code],
+            np.nanstd(found, axis=0, ddof=1))
+        assert np.isclose(log_means[code], np.nanmean(np.log(found)))
+
+# Reading a growing log (saving the summary between reads, and with a last
+# line not yet finished) gives the same tables as reading it all at once.
+def test_update_carries_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(logsummary, 'chunk_lines', 37)
+    generator = np.random.RandomState(3)
+    lines = log_lines(generator, 400)
+    log_path = str(tmp_path / 'log.txt')
+    summary_path = str(tmp_path / 'summary.npz')
+    added = 0
+    for cut in [0, 1, 150, 151, 400]:
+        write_log(log_path, lines[:cut])
+        if cut < 400:
+            with open(log_path, 'a') as fout:
+                fout.write(lines[cut][:25])
+        summary = logsummary.read_summary(summary_path)
+        added += summary.update(log_path)
+        summary.save(summary_path)
+    assert added == 400
+
+    whole = logsummary.LogSummary()
+    assert whole.update(log_path) == 400
+    assert summary.speaker_table() == whole.speaker_table()
+    assert summary.vowel_table() == whole.vowel_table()
+
+# A log rewritten since it was last read is read from the start again.
+def test_update_rewritten(tmp_path):
+    generator = np.random.RandomState(4)
+    log_path = write_log(tmp_path / 'log.txt', log_lines(generator, 100))
+    summary = logsummary.LogSummary()
+    summary.update(log_path)
+    lines = log_lines(generator, 120)
+    write_log(log_path, lines)
+    summary.update(log_path)
+    whole = logsummary.LogSummary()
+    whole.update(log_path)
+    assert summary.speaker_table() == whole.speaker_table()
+    assert summary.speaker_lines.sum() == 120
+
+# A summary made with another speaker_pattern isn't carried on from.
+def test_read_summary_other_pattern(tmp_path):
+    generator = np.random.RandomState(5)
+    log_path = write_log(tmp_path / 'log.txt', log_lines(generator, 50))
+    summary_path = str(tmp_path / 'summary.npz')
+    summary = logsummary.LogSummary()
+    summary.update(log_path)
+    summary.save(summary_path)
+    assert logsummary.read_summary(summary_path).position == summary.position
+    assert logsummary.read_summary(summary_path, '^spk').position == 0
+
+# Sound names outside ASCII are read in the encoding the log is written in,
+# e.g. a Windows code page.
+def test_update_log_encoding(tmp_path, monkeypatch):
+    monkeypatch.setattr(logsummary, 'log_encoding', 'cp1252')
+    generator = np.random.RandomState(7)
+    lines = [line.replace('spk1/', 'S\u00f8ren/')
+        for line in log_lines(generator, 30)]
+    log_path = str(tmp_path / 'log.txt')
+    with open(log_path, 'w', encoding='cp1252') as fout:
+        fout.write(header)
+        fout.writelines(lines)
+    summary = logsummary.LogSummary()
+    assert summary.update(log_path) == 30
+    assert 'S\u00f8ren' in summary.speakers
+
+def test_write_normalised(tmp_path):
+    generator = np.random.RandomState(6)
+    lines = log_lines(generator, 200)
+    log_path = write_log(tmp_path / 'log.txt', lines)
+    normalised_path = str(tmp_path / 'normalised.txt')
+    summary = logsummary.LogSummary()
+    summary.update(log_path)
+    assert summary.write_normalised(log_path, normalised_path) == 200
+    means, deviations, log_means = summary.speaker_norms()
+
+    with open(normalised_path) as fin:
+        header_fields = fin.readline().rstrip('\n').split('\t')
+        normalised_lines = fin.readlines()
+    assert header_fields[:3] == header.rstrip('\n').split('\t')
+    assert len(normalised_lines) == 200
+    for line, normalised_line in zip(lines, normalised_lines):
+        fields = line.rstrip('\n').split('\t')
+        normalised_fields = normalised_line.rstrip('\n').split('\t')
+        assert normalised_fields[:len(fields)] == fields
+        code = summary.speakers[fields[0].split('/')[0]]
+        added = normalised_fields[len(fields):]
+        assert len(added) == 66
+        for cell, value in enumerate(fields[2:35]):
+            lobanov, nearey = added[cell], added[33 + cell]
+            if value == '--undefined--':
+                assert lobanov == nearey == '--undefined--'
+                continue
+            formant = cell % 3
+            assert abs(float(lobanov) - (float(value) - means[code, formant])
+                / deviations[code, formant]) < 1e-4
+            assert abs(float(nearey) - (np.log(float(value)) -
+                log_means[code])) < 1e-4
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# test_resultstore.py
+# Tests for resultstore.py: the result store, and repairing and merging
+# output files.
+
+import pytest
+
+import resultstore
+
+header_line = 'Sound file\tInterval position\t...\n'
+
+# A logged line, as logformantsbylabel.py writes it.
+def log_line(sound_file, position, time_stamp='2024/01/01 12:00:00',
+    f1_reference='500', value_count=33):
+    values = [str(500 + position + value) for value in range(value_count)]
+    settings = ['V', '0.005', '1', f1_reference, '1485', '2475', '3465',
+        '4455', '1', '1', '1', time_stamp]
+    return '\t'.join([sound_file, str(position)] + values + settings) + '\n'
+
+def write_log(file_path, lines, header=True):
+    with open(str(file_path), 'w') as fout:
+        if header:
+            fout.write(header_line)
+        fout.writelines(lines)
+    return str(file_path)
+
+@pytest.fixture
+def store(tmp_path):
+    store = resultstore.ResultStore(str(tmp_path / 'store.db'))
+    yield store
+    store.close()
+
+def test_add_lines(store):
+    store.add_lines([log_line('a', 2), log_line('a', 4), log_line('b', 2)])
+    assert len(store) == 3
+    assert store.logged_sound_files() == set(['a', 'b'])
+    assert store.logged_positions('a', 1) == set([2, 4])
+    assert store.logged_positions('a', 2) == set()
+
+# The same interval with the same settings replaces the earlier line; with
+# other settings, it's kept beside it.
+def test_add_lines_replaces(store):
+    store.add_lines([log_line('a', 2)])
+    store.add_lines([log_line('a', 2, '2024/01/02 12:00:00')])
+    assert list(store.lines()) == [log_line('a', 2, '2024/01/02 12:00:00')]
+    store.add_lines([log_line('a', 2, f1_reference='550')])
+    assert len(store) == 2
+
+def test_export_log(store, tmp_path):
+    lines = [log_line('a', 2), log_line('b', 4)]
+    store.add_lines(lines)
+    export_path = str(tmp_path / 'export.txt')
+    store.export_log(export_path, header_line)
+    with open(export_path) as fin:
+        assert fin.read() == header_line + ''.join(lines)
+
+def test_import_log_from_before_the_store(store, tmp_path):
+    lines = [log_line('a', 2), log_line('a', 4)]
+    log_path = write_log(tmp_path / 'log.txt', lines)
+    store.import_log(log_path)
+    assert list(store.lines()) == lines
+
+# Lines written to the output file by a run stopped before it added them to
+# the store are read in; the lines before them aren't read again.
+def test_import_log_catches_up(store, tmp_path):
+    log_path = write_log(tmp_path / 'log.txt', [])
+    first = [log_line('a', 2)]
+    store.add_lines(first, resultstore.append_to_log(log_path, first))
+    missed = [log_line('a', 4), log_line('b', 2)]
+    resultstore.append_to_log(log_path, missed)
+    with open(log_path, 'a') as fout:
+        fout.write(log_line('b', 4)[:30])
+    resultstore.repair_log(log_path)
+
+    store.connection.execute('DELETE FROM measurements')
+    store.connection.commit()
+    store.import_log(log_path)
+    assert list(store.lines()) == missed
+    store.import_log(log_path)
+    assert len(store) == 2
+
+# An output file shorter than when the store last saw it has been written
+# out again, so is read in full.
+def test_import_log_shrunk(store, tmp_path):
+    log_path = write_log(tmp_path / 'log.txt', [])
+    lines = [log_line('a', 2), log_line('a', 4)]
+    store.add_lines(lines, resultstore.append_to_log(log_path, lines))
+    write_log(log_path, [log_line('c', 2)])
+    store.import_log(log_path)
+    assert len(store) == 3
+
+def test_repair_log(tmp_path):
+    lines = [log_line('a', 2), log_line('a', 4)]
+    log_path = write_log(tmp_path / 'log.txt', lines)
+    resultstore.repair_log(log_path)
+    with open(log_path) as fin:
+        assert fin.read() == header_line + ''.join(lines)
+
+    with open(log_path, 'a') as fout:
+        fout.write(log_line('a', 6)[:-20])
+    resultstore.repair_log(log_path)
+    with open(log_path) as fin:
+        assert fin.read() == header_line + ''.join(lines)
+
+def test_repair_log_single_partial_line(tmp_path):
+    log_path = write_log(tmp_path / 'log.txt', ['Sound file\tInterv'],
+        header=False)
+    resultstore.repair_log(log_path)
+    with open(log_path) as fin:
+        assert fin.read() == ''
+
+def test_merge_logs(tmp_path):
+    first = write_log(tmp_path / 'first.txt', [
+        log_line('b', 2, '2024/01/01 12:00:00'),
+        log_line('a', 4, '2024/01/03 12:00:00')])
+    second = write_log(tmp_path / 'second.txt', [
+        log_line('b', 2, '2024/01/02 12:00:00'),
+        log_line('a', 4, '2024/01/01 12:00:00'),
+        log_line('a', 2, f1_reference='550')])
+    merged = resultstore.merge_logs([first, second])
+    assert merged == [
+        log_line('a', 2, f1_reference='550'),
+        log_line('a', 4, '2024/01/03 12:00:00'),
+        log_line('b', 2, '2024/01/02 12:00:00')]
+    assert resultstore.merge_logs([second, first]) == merged
+
+# Lines logged before measuring started at 0% have 30 values, not 33.
+def test_merge_logs_old_lines(tmp_path):
+    log_path = write_log(tmp_path / 'log.txt',
+        [log_line('a', 2, value_count=30)])
+    assert resultstore.merge_logs([log_path]) == \
+        [log_line('a', 2, value_count=30)]
+
+# Files that aren't logs of measurements, such as the normalised log written
+# by --summarise, are refused.
+def test_merge_logs_wrong_field_count(tmp_path):
+    log_path = write_log(tmp_path / 'log.txt', [log_line('a', 2)[:-1] +
+        '\textra\n'])
+    with pytest.raises(SystemExit):
+        resultstore.merge_logs([log_path])
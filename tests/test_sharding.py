@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# test_sharding.py
+# Tests for --shard and --merge_shards: measuring a corpus in shards and
+# merging them gives the same measurements as measuring it in one go.
+
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+import logformantsbylabel
+
+np = pytest.importorskip('numpy')
+import benchmark
+
+package_directory = os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__)))
+script_path = os.path.join(package_directory, 'logformantsbylabel.py')
+shard_count = 3
+
+# settings.cfg, measuring the synthetic corpus in data_directory with the
+# numpy engine.
+def write_settings(file_path, data_directory):
+    changes = {'data_directory': data_directory, 'interval_label': 'V',
+        'measuring_engine': 'numpy'}
+    lines = []
+    with open(os.path.join(package_directory, 'settings.cfg')) as fin:
+        for line in fin:
+            key = line.split(':', 1)[0].strip()
+            if key in changes:
+                line = '{0}: {1}\n'.format(key, changes[key])
+            lines.append(line)
+    with open(file_path, 'w') as fout:
+        fout.writelines(lines)
+
+# Run logformantsbylabel.py with the settings in directory.
+def run(directory, *arguments):
+    return subprocess.run([sys.executable, script_path, '-s', 'test.cfg'] +
+        list(arguments), cwd=directory, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, universal_newlines=True)
+
+# Lines of an output file without their time stamps, which differ from run
+# to run.
+def measurements(log_path):
+    with open(log_path) as fin:
+        return [line.rsplit('\t', 1)[0] for line in fin]
+
+# A directory with a settings file and a data directory holding a synthetic
+# corpus (the same each time) of six sound files.
+def make_directory(tmp_path, name):
+    directory = str(tmp_path / name)
+    data_directory = os.path.join(directory, 'Data')
+    os.makedirs(data_directory)
+    benchmark.make_corpus(data_directory, 6, 2.0, 3, 16000, 1)
+    write_settings(os.path.join(directory, 'test.cfg'), 'Data')
+    return directory, data_directory
+
+def test_sound_shard():
+    names = ['speaker{0}/file{1}'.format(speaker, number)
+        for speaker in range(5) for number in range(40)]
+    shards = [logformantsbylabel.sound_shard(name, 4) for name in names]
+    assert set(shards) == set([1, 2, 3, 4])
+    assert shards == [logformantsbylabel.sound_shard(name, 4)
+        for name in names]
+
+def test_shard_file_name():
+    assert logformantsbylabel.shard_file_name('formant-tenths.txt', (2, 4)) \
+        == 'formant-tenths.shard-2-of-4.txt'
+
+def test_parse_shard():
+    assert logformantsbylabel.parse_shard('2/4') == (2, 4)
+    for text in ('0/4', '5/4', '2', 'a/b'):
+        with pytest.raises(Exception):
+            logformantsbylabel.parse_shard(text)
+
+def test_shard_and_merge(tmp_path):
+    whole_directory, whole_data = make_directory(tmp_path, 'whole')
+    result = run(whole_directory, '--batch')
+    assert result.returncode == 0, result.stdout
+    expected = measurements(os.path.join(whole_data, 'formant-tenths.txt'))
+    assert len(expected) == 1 + 6 * 3
+
+    sharded_directory, sharded_data = make_directory(tmp_path, 'sharded')
+    for shard_index in range(1, shard_count + 1):
+        result = run(sharded_directory, '--batch', '--shard',
+            '{0}/{1}'.format(shard_index, shard_count))
+        assert result.returncode == 0, result.stdout
+    # Other files named after a shard's output file aren't merged.
+    with open(os.path.join(sharded_data,
+        'formant-tenths.shard-1-of-{0}_speakers.txt'.format(shard_count)),
+        'w') as fout:
+        fout.write('speaker\tvowel\tcount\nsynthetic0001\tV\t3\n')
+    result = run(sharded_directory, '--merge_shards')
+    assert re.search(r'^{0} shard output files merged'.format(shard_count),
+        result.stdout, re.MULTILINE), result.stdout
+
+    merged = measurements(os.path.join(sharded_data, 'formant-tenths.txt'))
+    assert merged[0] == expected[0]
+    assert merged[1:] == sorted(expected[1:],
+        key=lambda line: (line.split('\t')[0], int(line.split('\t')[1])))
+
+    # Merging again gives the same file.
+    result = run(sharded_directory, '--merge_shards')
+    assert measurements(os.path.join(sharded_data, 'formant-tenths.txt')) \
+        == merged
+
+# A shard with no sound files in it has nothing to do, which isn't an error.
+def test_empty_shard(tmp_path):
+    directory, data_directory = make_directory(tmp_path, 'empty')
+    for name in os.listdir(data_directory):
+        if not name.startswith('synthetic0001.'):
+            os.remove(os.path.join(data_directory, name))
+    shard = logformantsbylabel.sound_shard('synthetic0001', shard_count)
+    empty_shard = shard % shard_count + 1
+    result = run(directory, '--batch', '--shard',
+        '{0}/{1}'.format(empty_shard, shard_count))
+    assert result.returncode == 0, result.stdout
+    assert 'No sound files in shard {0} of {1}'.format(empty_shard,
+        shard_count) in result.stdout
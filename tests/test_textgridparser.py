@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# test_textgridparser.py
+# Tests for textgridparser.py: the same TextGrid written in each of Praat's
+# formats should read the same.
+
+import codecs
+import struct
+
+import pytest
+
+import textgridparser
+
+# (class, name, items) for each tier; an interval tier's items are (start,
+# end, label), a point tier's (time, label).
+tiers = [
+    ('IntervalTier', 'vowels', [
+        (0.0, 0.2, ''),
+        (0.2, 0.8, 'V'),
+        (0.8, 1.1, 'say "hi"\nthere'),
+        (1.1, 1.5, 'V'),
+        (1.5, 2.0, 'ɛ')
+        ]),
+    ('TextTier', 'points', [
+        (0.5, 'V'),
+        (1.25, 'p')
+        ])
+    ]
+xmax = 2.0
+
+def quoted(text):
+    return '"' + text.replace('"', '""') + '"'
+
+# The TextGrid in Praat's long text format.
+def long_text():
+    lines = ['File type = "ooTextFile"', 'Object class = "TextGrid"', '',
+        'xmin = 0 ', 'xmax = {0} '.format(xmax), 'tiers? <exists> ',
+        'size = {0} '.format(len(tiers)), 'item []: ']
+    for tier_number, (tier_class, name, items) in enumerate(tiers):
+        lines += ['    item [{0}]:'.format(tier_number + 1),
+            '        class = {0} '.format(quoted(tier_class)),
+            '        name = {0} '.format(quoted(name)),
+            '        xmin = 0 ', '        xmax = {0} '.format(xmax)]
+        if tier_class == 'IntervalTier':
+            lines.append('        intervals: size = {0} '.format(len(items)))
+            for number, (start, end, label) in enumerate(items):
+                lines += ['        intervals [{0}]:'.format(number + 1),
+                    '            xmin = {0} '.format(start),
+                    '            xmax = {0} '.format(end),
+                    '            text = {0} '.format(quoted(label))]
+        else:
+            lines.append('        points: size = {0} '.format(len(items)))
+            for number, (time, label) in enumerate(items):
+                lines += ['        points [{0}]:'.format(number + 1),
+                    '            number = {0} '.format(time),
+                    '            mark = {0} '.format(quoted(label))]
+    return '\n'.join(lines) + '\n'
+
+# The TextGrid in Praat's short text format.
+def short_text():
+    lines = ['File type = "ooTextFile"', 'Object class = "TextGrid"', '',
+        '0', str(xmax), '<exists>', str(len(tiers))]
+    for tier_class, name, items in tiers:
+        lines += [quoted(tier_class), quoted(name), '0', str(xmax),
+            str(len(items))]
+        for item in items:
+            lines += [str(value) for value in item[:-1]] + [quoted(item[-1])]
+    return '\n'.join(lines) + '\n'
+
+def binary_string(text, length_format):
+    try:
+        encoded = text.encode('ascii')
+    except UnicodeEncodeError:
+        # Marked by the largest length, then given as UTF-16 code units.
+        encoded = text.encode('utf-16-be')
+        marker = 2 ** (8 * struct.calcsize(length_format)) - 1
+        return struct.pack(length_format, marker) + \
+            struct.pack(length_format, len(encoded) // 2) + encoded
+    return struct.pack(length_format, len(encoded)) + encoded
+
+# The TextGrid in Praat's binary format.
+def binary():
+    data = [b'ooBinaryFile', binary_string('TextGrid', '>B'),
+        struct.pack('>dd', 0, xmax), b'\x01', struct.pack('>i', len(tiers))]
+    for tier_class, name, items in tiers:
+        data += [binary_string(tier_class, '>B'), binary_string(name, '>H'),
+            struct.pack('>dd', 0, xmax), struct.pack('>i', len(items))]
+        for item in items:
+            data += [struct.pack('>d', value) for value in item[:-1]]
+            data.append(binary_string(item[-1], '>H'))
+    return b''.join(data)
+
+def write(tmp_path, data):
+    file_path = tmp_path / 'test.TextGrid'
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    file_path.write_bytes(data)
+    return str(file_path)
+
+formats = {
+    'long': lambda: long_text().encode('utf-8'),
+    'short': lambda: short_text().encode('utf-8'),
+    'long_utf8_bom': lambda: codecs.BOM_UTF8 + long_text().encode('utf-8'),
+    'long_utf16': lambda: long_text().encode('utf-16'),
+    'short_utf16': lambda: short_text().encode('utf-16'),
+    'binary': binary,
+    }
+
+@pytest.mark.parametrize('format_name', sorted(formats))
+def test_formats_read_the_same(tmp_path, format_name):
+    textgrid = textgridparser.read_textgrid(write(tmp_path,
+        formats[format_name]()))
+    assert textgrid.xmin == 0
+    assert textgrid.xmax == xmax
+    assert len(textgrid.tiers) == len(tiers)
+    for tier, (tier_class, name, items) in zip(textgrid.tiers, tiers):
+        assert tier.tier_class == tier_class
+        assert tier.name == name
+        if tier_class == 'IntervalTier':
+            expected = [(number + 1,) + item
+                for number, item in enumerate(items)]
+        else:
+            expected = [(number + 1, time, time, label)
+                for number, (time, label) in enumerate(items)]
+        assert list(tier.intervals()) == expected
+
+# Strings and lines split across the chunks the file is read in.
+@pytest.mark.parametrize('format_name', ['long', 'short', 'long_utf16'])
+def test_small_chunks(tmp_path, monkeypatch, format_name):
+    file_path = write(tmp_path, formats[format_name]())
+    expected = [list(tier.intervals())
+        for tier in textgridparser.read_textgrid(file_path).tiers]
+    for chunk_size in (1, 2, 3, 7, 64):
+        monkeypatch.setattr(textgridparser, 'chunk_size', chunk_size)
+        textgrid = textgridparser.read_textgrid(file_path)
+        assert [list(tier.intervals()) for tier in textgrid.tiers] == \
+            expected
+
+def test_find(tmp_path):
+    textgrid = textgridparser.read_textgrid(write(tmp_path, long_text()))
+    assert list(textgrid.find(label='V', tier=1)) == [
+        (1, 2, 0.2, 0.8, 'V'), (1, 4, 1.1, 1.5, 'V')]
+    assert list(textgrid.find(label='V', tier='points')) == [
+        (2, 1, 0.5, 0.5, 'V')]
+    assert [found[:2] for found in textgrid.find(label='V')] == [
+        (1, 2), (1, 4), (2, 1)]
+    assert [found[:2] for found in textgrid.find(pattern='^say', tier='1')] \
+        == [(1, 3)]
+    assert list(textgrid.find(label='missing')) == []
+
+# Labels are stored once each, however often they appear.
+def test_labels_shared(tmp_path):
+    textgrid = textgridparser.read_textgrid(write(tmp_path, long_text()))
+    labels = textgrid.label_table.labels
+    assert len(labels) == len(set(labels))
+    assert labels.count('V') == 1
+
+def test_missing_tier(tmp_path):
+    textgrid = textgridparser.read_textgrid(write(tmp_path, long_text()))
+    with pytest.raises(SystemExit):
+        textgrid.tier(3)
+    with pytest.raises(SystemExit):
+        textgrid.tier('words')
+
+@pytest.mark.parametrize('data', [
+    'not a textgrid\n',
+    short_text()[:-40],
+    binary()[:-5],
+    ])
+def test_unreadable(tmp_path, data):
+    with pytest.raises(SystemExit):
+        textgridparser.read_textgrid(write(tmp_path, data))
+
+def test_no_file(tmp_path):
+    with pytest.raises(SystemExit):
+        textgridparser.read_textgrid(str(tmp_path / 'missing.TextGrid'))
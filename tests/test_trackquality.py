@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# test_trackquality.py
+# Tests for trackquality.py: norm_distance is measured from fixed norms, not
+# from the settings each interval was tracked with, and scaled settings scale
+# every reference frequency.
+
+import pytest
+
+np = pytest.importorskip('numpy')
+import trackquality
+import trajectorylog
+
+# An interval whose tracks are steady at 500, 1500 and 2500 Hz, tracked with
+# settings.
+def steady_interval(position, settings):
+    times = 0.1 + trajectorylog.time_step * np.arange(10)
+    frequencies = np.tile([500.0, 1500.0, 2500.0, 3500.0, 4500.0], (10, 1))
+    bandwidths = np.full((10, 5), 100.0)
+    return {
+        'sound_name': 'a',
+        'tracking_settings': list(settings),
+        'interval_position': position,
+        'start_time': times[0],
+        'end_time': times[-1],
+        'time': times,
+        'frequencies': frequencies,
+        'bandwidths': bandwidths,
+        'tracked_frequencies': frequencies[:, :3],
+        'tracked_bandwidths': bandwidths[:, :3]
+        }
+
+def scores(norms):
+    trajectories = trajectorylog.join_trajectories([
+        steady_interval(2, (500, 1485, 2475, 3465, 4455, 1, 1, 1)),
+        steady_interval(4, (600, 1782, 2970, 4158, 5346, 1, 1, 1))
+        ])
+    values = trajectorylog.resample_trajectories(trajectories, 11)
+    return trackquality.score_intervals(trajectories, values,
+        [values, values], norms)
+
+# The same tracks are as far from the norms whatever settings found them.
+def test_norm_distance_from_norms():
+    found = scores([500, 1500, 2500])
+    assert np.allclose(found['norm_distance'], [0, 0])
+    found = scores([1000, 1500, 2500])
+    assert np.allclose(found['norm_distance'], [12, 12])
+    assert np.allclose(found['score'], [1, 1])
+
+def test_scaled_parameter_sets():
+    measuring_params = {'f1_reference': '500', 'f2_reference': '1485',
+        'f3_reference': '2475', 'f4_reference': '3465',
+        'f5_reference': '4455', 'frequency_cost': '1',
+        'bandwidth_cost': '1', 'transition_cost': '1'}
+    low, high = trackquality.scaled_parameter_sets(measuring_params,
+        [0.9, 1.1])
+    assert low['f1_reference'] == '450'
+    assert high['f5_reference'] == '4900.5'
+    assert low['frequency_cost'] == high['frequency_cost'] == '1'
+    assert measuring_params['f1_reference'] == '500'
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# test_trajectorylog.py
+# Tests for trajectorylog.py: values at tenths worked out from stored
+# trajectories match those Praat (and formanttracker.py) read off the tracks,
+# reading several trajectory files keeps only the latest copy of each
+# interval, and batch runs with other settings don't overwrite each other's
+# trajectory files.
+
+import math
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+import benchmark
+import formanttracker
+import logformantsbylabel
+import trajectorylog
+
+time_step = trajectorylog.time_step
+
+# Praat's "Get value at time... Hertz Linear" on one track, as Praat's
+# Sampled_getValueAtX does it: interpolate between the nearest frame and the
+# next nearest, using the nearest alone where the other is undefined or
+# missing, and give undefined where the nearest is.
+def praat_value_at_time(first_time, track, time):
+    index = (time - first_time) / time_step
+    left = math.floor(index)
+    phase = index - left
+    if phase < 0.5:
+        near, far = left, left + 1
+    else:
+        near, far = left + 1, left
+        phase = 1 - phase
+    if near < 0 or near >= len(track) or math.isnan(track[near]):
+        return float('nan')
+    if far < 0 or far >= len(track) or math.isnan(track[far]):
+        return track[near]
+    return track[near] + phase * (track[far] - track[near])
+
+# Tracks of random frequencies, with some frames undefined, and frame times
+# starting part way through a time step.
+def random_tracks(generator, frame_count):
+    times = 0.0123 + time_step * np.arange(frame_count)
+    frequencies = generator.uniform(200, 3000, (frame_count, 5))
+    frequencies[generator.uniform(size=frequencies.shape) < 0.1] = np.nan
+    bandwidths = generator.uniform(50, 300, (frame_count, 5))
+    return times, frequencies, bandwidths
+
+def interval(sound_name, position, start_time, end_time, times, frequencies,
+    bandwidths, settings=(500, 1485, 2475, 3465, 4455, 1, 1, 1)):
+    frames = trajectorylog.interval_frames(times, start_time, end_time)
+    return {
+        'sound_name': sound_name,
+        'tracking_settings': list(settings),
+        'interval_position': position,
+        'start_time': start_time,
+        'end_time': end_time,
+        'time': times[frames],
+        'frequencies': frequencies[frames],
+        'bandwidths': bandwidths[frames],
+        'tracked_frequencies': frequencies[frames, :3],
+        'tracked_bandwidths': bandwidths[frames, :3]
+        }
+
+def assert_same(actual, expected):
+    assert actual.shape == expected.shape
+    assert np.array_equal(np.isnan(actual), np.isnan(expected))
+    assert np.allclose(actual[~np.isnan(actual)],
+        expected[~np.isnan(expected)], atol=1e-3)
+
+def test_resample_matches_praat_tenths():
+    generator = np.random.RandomState(0)
+    times, frequencies, bandwidths = random_tracks(generator, 200)
+    interval_times = [(0.0, 0.2), (0.3311, 0.4102), (0.9, 1.37),
+        (1.95, 2.05), (1.0, 1.003)]
+    intervals = [
+        interval('a', number + 2, start_time, end_time, times, frequencies,
+            bandwidths)
+        for number, (start_time, end_time) in enumerate(interval_times)
+        ]
+    values = trajectorylog.resample_trajectories(
+        trajectorylog.join_trajectories(intervals), 11)
+    # The tracked values are stored as 32-bit floats.
+    tracks = frequencies[:, :3].astype(np.float32).astype(float)
+    for number, (start_time, end_time) in enumerate(interval_times):
+        expected = np.array([
+            [praat_value_at_time(times[0], tracks[:, formant], time)
+                for formant in range(3)]
+            for time in formanttracker.tenth_points(start_time, end_time)
+            ])
+        assert_same(values[number], expected)
+        assert_same(values[number], formanttracker.values_at_times(times,
+            tracks, formanttracker.tenth_points(start_time, end_time)))
+
+# Other numbers of points, and other columns.
+def test_resample_points_and_columns():
+    generator = np.random.RandomState(1)
+    times, frequencies, bandwidths = random_tracks(generator, 100)
+    trajectories = trajectorylog.join_trajectories([
+        interval('a', 2, 0.25, 0.61, times, frequencies, bandwidths)])
+    points = 0.25 + 0.36 * np.arange(5) / 4
+    values = trajectorylog.resample_trajectories(trajectories, 5,
+        'bandwidths')
+    assert_same(values[0], formanttracker.values_at_times(times,
+        bandwidths.astype(np.float32).astype(float), points))
+
+# Formants measured at tenths by the numpy engine are the values at tenths
+# of its stored trajectories.
+def test_resample_matches_measured_tenths(tmp_path):
+    benchmark.make_corpus(str(tmp_path), 1, 2.0, 3, 16000, 2)
+    sound_path = str(tmp_path / 'synthetic0001.wav')
+    measuring_params = {'f1_reference': '500', 'f2_reference': '1485',
+        'f3_reference': '2475', 'f4_reference': '3465',
+        'f5_reference': '4455', 'frequency_cost': '1',
+        'bandwidth_cost': '1', 'transition_cost': '1'}
+    interval_times = [(0.2, 0.4), (0.9, 1.1), (1.5, 1.72)]
+    measured = formanttracker.measure_intervals_sweep(sound_path,
+        interval_times, [measuring_params])
+    times, frequencies, bandwidths, tracks = \
+        formanttracker.track_sound_sweep(sound_path, [measuring_params])
+    tracked_frequencies, tracked_bandwidths = tracks[0]
+    intervals = []
+    for number, (start_time, end_time) in enumerate(interval_times):
+        frames = trajectorylog.interval_frames(times, start_time, end_time)
+        intervals.append({
+            'sound_name': 'synthetic0001',
+            'tracking_settings': [measuring_params[key] for key in
+                trajectorylog.tracking_columns],
+            'interval_position': number + 2,
+            'start_time': start_time,
+            'end_time': end_time,
+            'time': times[frames],
+            'frequencies': frequencies[frames],
+            'bandwidths': bandwidths[frames],
+            'tracked_frequencies': tracked_frequencies[frames],
+            'tracked_bandwidths': tracked_bandwidths[frames]
+            })
+    values = trajectorylog.resample_trajectories(
+        trajectorylog.join_trajectories(intervals), 11)
+    for number in range(len(interval_times)):
+        assert_same(np.round(values[number]), np.round(measured[number][0]))
+
+def test_read_praat_formant_table(tmp_path):
+    table_path = str(tmp_path / 'table.txt')
+    with open(table_path, 'w') as fout:
+        fout.write('time(s)\tnformants\tF1(Hz)\tB1(Hz)\tF2(Hz)\tB2(Hz)\n')
+        fout.write('0.025\t2\t500.5\t80\t1500\t120\n')
+        fout.write('0.035\t1\t510\t85\t--undefined--\t--undefined--\n')
+    times, frequencies, bandwidths = \
+        trajectorylog.read_praat_formant_table(table_path, 3)
+    assert list(times) == [0.025, 0.035]
+    assert_same(frequencies, np.array([[500.5, 1500, np.nan],
+        [510, np.nan, np.nan]]))
+    assert_same(bandwidths, np.array([[80, 120, np.nan],
+        [85, np.nan, np.nan]]))
+
+def write_file(directory, name, intervals, modified_time):
+    file_path = os.path.join(directory, name)
+    trajectorylog.write_trajectories(file_path,
+        trajectorylog.join_trajectories(intervals))
+    os.utime(file_path, (modified_time, modified_time))
+
+# An interval measured again (with the same settings) in a later file is
+# only kept from that file; intervals of other sounds, or measured with other
+# settings, are all kept.
+def test_read_trajectories_keeps_latest(tmp_path):
+    generator = np.random.RandomState(3)
+    old_tracks = random_tracks(generator, 100)
+    new_tracks = random_tracks(generator, 100)
+    other_settings = (550, 1650, 2750, 3850, 4950, 1, 1, 1)
+    old = [
+        interval('a', 2, 0.1, 0.3, *old_tracks),
+        interval('a', 4, 0.5, 0.62, *old_tracks),
+        interval('b', 2, 0.1, 0.3, *old_tracks),
+        interval('a', 2, 0.1, 0.3, *old_tracks, settings=other_settings)
+        ]
+    # Written in a different order, so codes differ from file to file.
+    new = [
+        interval('c', 2, 0.2, 0.5, *new_tracks),
+        interval('a', 4, 0.5, 0.71, *new_tracks)
+        ]
+    write_file(str(tmp_path), 'old.npz', old, 1000000000)
+    write_file(str(tmp_path), 'new.npz', new, 1000000100)
+
+    trajectories = trajectorylog.read_trajectories(str(tmp_path))
+    found = {}
+    for number in range(len(trajectories['interval_position'])):
+        sound_name = trajectories['sound_files'][
+            trajectories['sound_file_codes'][number]]
+        settings = tuple(trajectories['tracking_settings'][
+            trajectories['tracking_setting_codes'][number]])
+        frames = slice(trajectories['frame_offsets'][number],
+            trajectories['frame_offsets'][number + 1])
+        key = (sound_name, int(trajectories['interval_position'][number]),
+            settings)
+        assert key not in found
+        found[key] = (trajectories['end_time'][number],
+            trajectories['time'][frames],
+            trajectories['tracked_frequencies'][frames])
+
+    expected = old[:1] + old[2:] + new
+    assert len(found) == len(expected)
+    for each in expected:
+        key = (each['sound_name'], each['interval_position'],
+            tuple(float(value) for value in each['tracking_settings']))
+        end_time, frame_times, tracked_frequencies = found[key]
+        assert end_time == each['end_time']
+        assert np.array_equal(frame_times, each['time'])
+        assert_same(tracked_frequencies,
+            each['tracked_frequencies'].astype(np.float32))
+
+# Batch runs over the same intervals with different settings each keep their
+# trajectories.
+def test_runs_with_other_settings_kept(tmp_path):
+    data_directory = str(tmp_path / 'data')
+    trajectory_directory = str(tmp_path / 'trajectories')
+    os.makedirs(data_directory)
+    os.makedirs(trajectory_directory)
+    benchmark.make_corpus(data_directory, 1, 2.0, 3, 16000, 4)
+    sounds = benchmark.find_intervals(data_directory)
+    measuring_params = {'f1_reference': '500', 'f2_reference': '1485',
+        'f3_reference': '2475', 'f4_reference': '3465',
+        'f5_reference': '4455', 'frequency_cost': '1',
+        'bandwidth_cost': '1', 'transition_cost': '1'}
+    other_params = dict(measuring_params, f1_reference='550')
+    for parameter_sets in ([measuring_params], [other_params]):
+        jobs = logformantsbylabel.make_batch_jobs(sounds, data_directory,
+            '.wav', '.TextGrid', '1', 'numpy', parameter_sets, None, None,
+            None, trajectory_directory=trajectory_directory)
+        for job in jobs:
+            assert logformantsbylabel.measure_job(job)[2] is None
+
+    trajectories = trajectorylog.read_trajectories(trajectory_directory)
+    assert len(trajectories['interval_position']) == 6
+    assert sorted(float(row[0]) for row in
+        trajectories['tracking_settings']) == [500, 550]
+
+def test_read_trajectories_empty(tmp_path):
+    trajectories = trajectorylog.read_trajectories(str(tmp_path))
+    assert len(trajectories['interval_position']) == 0
+    assert trajectories['sound_files'] == []
+    assert trajectorylog.resample_trajectories(trajectories, 11).shape[0] == 0
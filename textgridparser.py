@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# textgridparser.py
+# TextGrid reading for logformantsbylabel.py.
+
+# Reads Praat TextGrid files in long text, short text and binary formats, in
+# UTF-8 or UTF-16, a chunk (or a record) at a time, without loading the whole
+# file. Each tier's intervals (or points) are stored in arrays of start times,
+# end times and label numbers, with each distinct label stored only once, and
+# can be looked up by label or regular expression on one tier or across all of
+# them. As in Praat, tiers and intervals are numbered from 1.
+
+import array
+import codecs
+import itertools
+import re
+import struct
+import sys
+
+# In text TextGrids the only things that matter are the values: quoted strings,
+# numbers and <exists> flags, one per line. Anything before a value on its line
+# (a field name like 'xmin =' or 'tiers?') is skipped, as are lines without a
+# value (numbered headings like 'intervals [3]:'), so the same reader works for
+# both the long and short formats. A lone quote is the start of a string that
+# continues beyond the text read so far. (The lookahead and backreference
+# stop the field name being backtracked over, which is slow.)
+token_pattern = re.compile(
+    r'^(?=([^"\n=?\[\d<-]*))\1[=?]?[ \t]*' +
+    r'(?:"([^"]*(?:""[^"]*)*)"(?!")|(")|' +
+    r'<(exists|absent)>|(-?\d[\d.eE+-]*))',
+    re.MULTILINE
+    )
+
+# How much of a text file to read at a time.
+chunk_size = 1 << 20
+
+# Praat marks the start of binary files like this.
+binary_header = b'ooBinaryFile'
+
+# Intervals (or points) of one tier, stored in arrays.
+class Tier(object):
+
+    def __init__(self, name, tier_class, labels):
+        self.name = name
+        self.tier_class = tier_class
+        self.xmins = array.array('d')
+        self.xmaxs = array.array('d')
+        self.label_ids = array.array('l')
+        self._labels = labels
+
+    def __len__(self):
+        return len(self.xmins)
+
+    def append(self, xmin, xmax, label):
+        self.xmins.append(xmin)
+        self.xmaxs.append(xmax)
+        self.label_ids.append(self._labels.label_id(label))
+
+    # Interval number (from 1), start, end and label for each interval.
+    def intervals(self):
+        labels = self._labels.labels
+        for index, label_id in enumerate(self.label_ids):
+            yield (index + 1, self.xmins[index], self.xmaxs[index],
+                labels[label_id])
+
+# Table of distinct labels, shared by all tiers of a TextGrid.
+class LabelTable(object):
+
+    def __init__(self):
+        self.labels = []
+        self._ids = {}
+
+    def label_id(self, label):
+        try:
+            return self._ids[label]
+        except KeyError:
+            self._ids[label] = len(self.labels)
+            self.labels.append(label)
+            return self._ids[label]
+
+class TextGrid(object):
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.xmin = 0.0
+        self.xmax = 0.0
+        self.tiers = []
+        self.label_table = LabelTable()
+
+    # Find a tier by number (counting from 1, as an int or a string of digits)
+    # or by name.
+    def tier(self, tier):
+        if isinstance(tier, int) or str(tier).isdigit():
+            tier_number = int(tier)
+            if 1 <= tier_number <= len(self.tiers):
+                return self.tiers[tier_number - 1]
+        else:
+            for each_tier in self.tiers:
+                if each_tier.name == tier:
+                    return each_tier
+        sys.exit('Error: no tier {0} in textgrid {1}.'.format(
+            tier, self.file_path))
+
+    # Yield (tier number, interval number, start, end, label) for intervals
+    # whose label is label, or matches the regular expression pattern, on one
+    # tier (by number or name) or, if tier is None, on all tiers. Labels are
+    # only checked once each, however many times they appear.
+    def find(self, label=None, pattern=None, tier=None):
+        labels = self.label_table.labels
+        if label is not None:
+            wanted = set(
+                label_id for label_id, each_label in enumerate(labels)
+                if each_label == label
+                )
+        elif pattern is not None:
+            if not hasattr(pattern, 'search'):
+                pattern = re.compile(pattern)
+            wanted = set(
+                label_id for label_id, each_label in enumerate(labels)
+                if pattern.search(each_label)
+                )
+        else:
+            wanted = set(range(len(labels)))
+
+        if tier is None:
+            tiers = self.tiers
+        else:
+            tiers = [self.tier(tier)]
+
+        for each_tier in tiers:
+            tier_number = self.tiers.index(each_tier) + 1
+            for index, label_id in enumerate(each_tier.label_ids):
+                if label_id in wanted:
+                    yield (tier_number, index + 1, each_tier.xmins[index],
+                        each_tier.xmaxs[index], labels[label_id])
+
+# Open a text TextGrid with the right encoding, going by its byte order mark
+# (Praat writes UTF-16 with a mark; otherwise it's UTF-8 or plain ASCII).
+def open_text(file_path, start_bytes):
+    if start_bytes.startswith((codecs.BOM_UTF16_BE, codecs.BOM_UTF16_LE)):
+        encoding = 'utf-16'
+    elif start_bytes.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
+        encoding = 'utf-8'
+    return open(file_path, encoding=encoding, errors='replace', newline='')
+
+# Yield lists of the strings, numbers and flags of a text TextGrid, reading it
+# in chunks. Only complete lines are looked at, and a string running beyond
+# them is left to be finished with the next chunk.
+def text_tokens(fin):
+    buffer = ''
+    at_end = False
+    while not at_end:
+        chunk = fin.read(chunk_size)
+        at_end = len(chunk) == 0
+        buffer += chunk
+        if at_end:
+            end = len(buffer)
+        else:
+            end = buffer.rfind('\n') + 1
+            if end == 0:
+                continue
+
+        position = end
+        tokens = []
+        for match in token_pattern.finditer(buffer, 0, end):
+            field_name, string, lone_quote, flag, number = match.groups()
+            if number is not None:
+                tokens.append(float(number))
+            elif string is not None:
+                tokens.append(string.replace('""', '"'))
+            elif lone_quote is not None:
+                if at_end:
+                    raise ValueError('unterminated string')
+                position = match.start(3)
+                break
+            else:
+                tokens.append(flag == 'exists')
+        buffer = buffer[position:]
+        yield tokens
+
+# Read a text TextGrid (long or short format) from lists of its tokens.
+def read_text_textgrid(textgrid, token_lists):
+    next_token = itertools.chain.from_iterable(token_lists).__next__
+
+    if next_token() != 'ooTextFile' or next_token() != 'TextGrid':
+        raise ValueError('not a TextGrid')
+    textgrid.xmin = next_token()
+    textgrid.xmax = next_token()
+    if next_token() is not True:
+        return
+    tier_count = int(next_token())
+
+    for tier_number in range(tier_count):
+        tier_class = next_token()
+        tier = Tier(next_token(), tier_class, textgrid.label_table)
+        next_token()
+        next_token()
+        item_count = int(next_token())
+        append_xmin = tier.xmins.append
+        append_xmax = tier.xmaxs.append
+        append_label_id = tier.label_ids.append
+        label_id = textgrid.label_table.label_id
+        if tier_class == 'IntervalTier':
+            for item in range(item_count):
+                append_xmin(next_token())
+                append_xmax(next_token())
+                append_label_id(label_id(next_token()))
+        else:
+            for item in range(item_count):
+                time = next_token()
+                append_xmin(time)
+                append_xmax(time)
+                append_label_id(label_id(next_token()))
+        textgrid.tiers.append(tier)
+
+# Read a binary TextGrid, a field at a time. Numbers are big-endian; strings
+# have a length prefix, and are stored as UTF-16 when they aren't plain ASCII.
+def read_binary_textgrid(textgrid, fin):
+
+    def read(size):
+        data = fin.read(size)
+        if len(data) < size:
+            raise ValueError('unexpected end of file')
+        return data
+
+    def read_double():
+        return struct.unpack('>d', read(8))[0]
+
+    def read_integer():
+        return struct.unpack('>i', read(4))[0]
+
+    def read_string(length_format):
+        length_size = struct.calcsize(length_format)
+        length = struct.unpack(length_format, read(length_size))[0]
+        if length == 2 ** (8 * length_size) - 1:
+            length = struct.unpack(length_format, read(length_size))[0]
+            return read(2 * length).decode('utf-16-be', errors='replace')
+        return read(length).decode('latin-1')
+
+    if read(len(binary_header)) != binary_header or \
+        read_string('>B') != 'TextGrid':
+        raise ValueError('not a TextGrid')
+    textgrid.xmin = read_double()
+    textgrid.xmax = read_double()
+    if read(1) == b'\x00':
+        return
+    tier_count = read_integer()
+
+    for tier_number in range(tier_count):
+        tier_class = read_string('>B')
+        tier = Tier(read_string('>H'), tier_class, textgrid.label_table)
+        read_double()
+        read_double()
+        item_count = read_integer()
+        if tier_class == 'IntervalTier':
+            for item in range(item_count):
+                xmin = read_double()
+                xmax = read_double()
+                tier.append(xmin, xmax, read_string('>H'))
+        else:
+            for item in range(item_count):
+                time = read_double()
+                tier.append(time, time, read_string('>H'))
+        textgrid.tiers.append(tier)
+
+# Read a TextGrid file in any of Praat's formats.
+def read_textgrid(file_path):
+    textgrid = TextGrid(file_path)
+    try:
+        with open(file_path, 'rb') as fin:
+            start_bytes = fin.read(len(binary_header))
+            if start_bytes == binary_header:
+                fin.seek(0)
+                read_binary_textgrid(textgrid, fin)
+                return textgrid
+
+        with open_text(file_path, start_bytes) as fin:
+            read_text_textgrid(textgrid, text_tokens(fin))
+    except EnvironmentError:
+        sys.exit('Error: textgrid file {0} not found.'.format(file_path))
+    except (ValueError, TypeError, StopIteration, struct.error):
+        sys.exit('Error: could not read textgrid file {0}.'.format(file_path))
+    return textgrid
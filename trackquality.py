@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# trackquality.py
+# Automatic checking of formant tracks for logformantsbylabel.py.
+
+# Each interval measured by --precompute can be given a score saying how
+# doubtful its formant tracks look, so that only the doubtful ones need
+# reviewing by hand. The score is made from several measures of the interval's
+# full trajectory (see trajectorylog.py), taken over the frames inside it:
+#     bandwidth      mean bandwidth of the tracked formants, in Hz
+#     jump           largest change in a tracked formant from one frame to the
+#                    next, in semitones
+#     crossing       proportion of frames where F2 comes within crossing_gap
+#                    Hz of F1 (or drops below it)
+#     undefined      proportion of tracked values left undefined
+#     norm_distance  largest distance of F1-F3 at the middle of the interval
+#                    from fixed norms (the reference frequencies for the
+#                    speaker's sex, whatever settings the interval was
+#                    tracked with), in semitones
+#     sensitivity    largest change, in semitones, in the values at tenths
+#                    when the reference frequencies are moved up or down by
+#                    perturbation and the formants tracked again
+# Each measure is divided by its limit, and the score is the largest of these,
+# so a score below 1 means every measure is within its limit. Where a measure
+# can't be taken at all (e.g. no frames, or nothing defined at the middle of
+# the interval), the score is infinite.
+
+# Requires NumPy (www.numpy.org).
+
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+measures = [
+    'bandwidth', 'jump', 'crossing', 'undefined', 'norm_distance',
+    'sensitivity'
+    ]
+limits = {
+    'bandwidth': 400,
+    'jump': 4,
+    'crossing': 0.1,
+    'undefined': 0.1,
+    'norm_distance': 12,
+    'sensitivity': 1
+    }
+
+# Gap in Hz between F1 and F2 below which a frame counts as a crossing.
+crossing_gap = 200
+
+# Factors the reference frequencies are multiplied by to test sensitivity.
+perturbation = 0.05
+perturbation_factors = [1 - perturbation, 1 + perturbation]
+
+# Stop with a helpful message if NumPy isn't installed.
+def check_numpy():
+    if np is None:
+        sys.exit(
+            'Error: quality scoring requires NumPy (www.numpy.org), which ' +
+            'could not be imported.'
+            )
+
+# Copies of measuring_params with the reference frequencies multiplied by each
+# of factors (e.g. for a longer or shorter vocal tract).
+def scaled_parameter_sets(measuring_params, factors):
+    parameter_sets = []
+    for factor in factors:
+        scaled_params = dict(measuring_params)
+        for formant in range(1, 6):
+            key = 'f{0}_reference'.format(formant)
+            scaled_params[key] = '{0:g}'.format(
+                float(measuring_params[key]) * factor
+                )
+        parameter_sets.append(scaled_params)
+    return parameter_sets
+
+# Copies of measuring_params with the reference frequencies multiplied by each
+# of perturbation_factors, for testing sensitivity.
+def perturbed_parameter_sets(measuring_params):
+    return scaled_parameter_sets(measuring_params, perturbation_factors)
+
+# Distance between frequencies in semitones (NaN if either is undefined).
+def semitones(frequencies, other_frequencies):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.abs(12 * np.log2(frequencies / other_frequencies))
+
+# Measures and scores for every interval in trajectories (as given by
+# trajectorylog.join_trajectories). values are the values at tenths worked out
+# from them, and perturbed_values the values at tenths when tracked with each
+# of perturbation_factors (each an array of intervals x 11 x formants). norms
+# are the frequencies of F1, F2 and F3 that norm_distance is measured from.
+# They're fixed rather than taken from each interval's own tracking settings,
+# so that settings tried by --optimise aren't scored against themselves.
+# Returns a dictionary of arrays with a value per interval, one for each of
+# measures and one for the score.
+def score_intervals(trajectories, values, perturbed_values, norms):
+    check_numpy()
+    offsets = trajectories['frame_offsets']
+    interval_count = len(offsets) - 1
+    owners = np.repeat(np.arange(interval_count), np.diff(offsets))
+    times = trajectories['time']
+    inside = (times >= trajectories['start_time'][owners]) & \
+        (times <= trajectories['end_time'][owners])
+    frequencies = trajectories['tracked_frequencies'].astype(float)
+    bandwidths = trajectories['tracked_bandwidths'].astype(float)
+
+    # Sum of a value over the frames inside each interval.
+    def interval_sums(frame_values):
+        return np.bincount(owners[inside], weights=frame_values[inside],
+            minlength=interval_count)
+
+    found = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frame_counts = interval_sums(np.ones(len(times)))
+        defined = ~np.isnan(frequencies)
+        found['undefined'] = 1 - interval_sums(defined.sum(axis=1)) / \
+            (frame_counts * frequencies.shape[1])
+        found['bandwidth'] = interval_sums(np.nansum(bandwidths, axis=1)) / \
+            interval_sums((~np.isnan(bandwidths)).sum(axis=1))
+        found['crossing'] = interval_sums(
+            frequencies[:, 1] - frequencies[:, 0] < crossing_gap
+            ) / frame_counts
+
+        # Jumps between neighbouring frames of the same interval.
+        pairs = inside[:-1] & inside[1:] & (owners[:-1] == owners[1:])
+        jumps = np.fmax.reduce(
+            semitones(frequencies[1:], frequencies[:-1]), axis=1
+            )
+        found['jump'] = np.zeros(interval_count)
+        np.maximum.at(found['jump'], owners[:-1][pairs],
+            np.nan_to_num(jumps[pairs]))
+
+        found['norm_distance'] = np.fmax.reduce(semitones(
+            values[:, values.shape[1] // 2],
+            np.array(norms, dtype=float)[:values.shape[2]]
+            ), axis=1)
+        found['sensitivity'] = np.zeros(interval_count)
+        for set_values in perturbed_values:
+            found['sensitivity'] = np.fmax(found['sensitivity'],
+                np.fmax.reduce(semitones(set_values, values).reshape(
+                    interval_count, values.shape[1] * values.shape[2]),
+                    axis=1))
+
+        ratios = np.array([
+            found[measure] / limits[measure] for measure in measures
+            ])
+    found['score'] = np.where(np.isnan(ratios), np.inf, ratios).max(axis=0)
+    return found
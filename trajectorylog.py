@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# trajectorylog.py
+# Full formant trajectories of measured intervals for logformantsbylabel.py.
+
+# Rather than just the values at tenths of each interval, every analysis frame
+# in and around the interval is kept: the F1-F5 and B1-B5 candidates found by
+# the Burg analysis (as held in Praat's untracked Formant object) and the
+# tracked F1-F3 and B1-B3 that the logged values are read from. The frames of
+# many intervals are stored end to end in NumPy .npz files, with an offset per
+# interval saying where its frames start: times as float64, frequencies and
+# bandwidths as float32 (NaN where undefined). Sound file names and sets of
+# tracking settings are stored once per file in a table, with an int32 code per
+# interval pointing into it. Values at any number of evenly spaced points
+# through each interval are worked out by resample_trajectories(), for all
+# intervals at once; the tenths logged are its 11-point values.
+
+# Requires NumPy (www.numpy.org).
+
+import glob
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The measuring settings used by formant tracking, in the order Praat's
+# "Track..." takes them. These are stored for each set of tracking settings,
+# and are also the settings a sweep can vary and a speaker profile keeps.
+tracking_columns = [
+    'f1_reference', 'f2_reference', 'f3_reference', 'f4_reference',
+    'f5_reference', 'frequency_cost', 'bandwidth_cost', 'transition_cost'
+    ]
+
+# Arrays with a value per interval, and with a row per frame.
+interval_columns = ['interval_position', 'start_time', 'end_time']
+frame_columns = [
+    'time', 'frequencies', 'bandwidths', 'tracked_frequencies',
+    'tracked_bandwidths'
+    ]
+
+# Number of formant candidates and of tracks kept for each frame.
+number_of_formants = 5
+number_of_tracks = 3
+
+# Time between analysis frames, as used by both Praat and formanttracker.py.
+time_step = 0.01
+
+# Stop with a helpful message if NumPy isn't installed.
+def check_numpy():
+    if np is None:
+        sys.exit(
+            'Error: trajectory output requires NumPy (www.numpy.org), which ' +
+            'could not be imported.'
+            )
+
+# Frame times, frequencies and bandwidths (frames x formants, NaN where
+# undefined) from a table saved by Praat's "Down to Table..." on a Formant.
+def read_praat_formant_table(file_path, formant_count):
+    try:
+        with open(file_path) as fin:
+            header = fin.readline().rstrip('\r\n').split('\t')
+            rows = [
+                line.rstrip('\r\n').split('\t') for line in fin
+                if len(line.strip()) > 0
+                ]
+    except EnvironmentError:
+        sys.exit('Error: Praat formant table {0} not found.'.
+            format(file_path))
+    values = np.array([
+        [float(value) if value != '--undefined--' else np.nan
+            for value in row]
+        for row in rows
+        ], dtype=float).reshape(len(rows), len(header))
+
+    times = values[:, header.index('time(s)')]
+    frequencies = np.full((len(rows), formant_count), np.nan)
+    bandwidths = np.full((len(rows), formant_count), np.nan)
+    for formant in range(formant_count):
+        if 'F{0}(Hz)'.format(formant + 1) in header:
+            frequencies[:, formant] = values[:,
+                header.index('F{0}(Hz)'.format(formant + 1))]
+            bandwidths[:, formant] = values[:,
+                header.index('B{0}(Hz)'.format(formant + 1))]
+    return times, frequencies, bandwidths
+
+# The frames needed for an interval: those inside it, and the frame either
+# side, which values near its ends are interpolated from.
+def interval_frames(times, start_time, end_time):
+    first = np.searchsorted(times, start_time - time_step, side='left')
+    last = np.searchsorted(times, end_time + time_step, side='right')
+    return slice(first, last)
+
+# Put together the trajectories of several intervals, in the layout stored in
+# .npz files. Each interval is given as a dictionary of sound_name,
+# tracking_settings (a value for each of tracking_columns), the
+# interval_columns and the frame_columns.
+def join_trajectories(intervals):
+    check_numpy()
+    trajectories = {}
+    sound_files = {}
+    trajectories['sound_file_codes'] = np.array([
+        sound_files.setdefault(interval['sound_name'], len(sound_files))
+        for interval in intervals
+        ], dtype=np.int32)
+    trajectories['sound_files'] = np.array(list(sound_files), dtype=str)
+    settings = {}
+    trajectories['tracking_setting_codes'] = np.array([
+        settings.setdefault(tuple(float(value) for value in
+            interval['tracking_settings']), len(settings))
+        for interval in intervals
+        ], dtype=np.int32)
+    trajectories['tracking_settings'] = np.array(list(settings),
+        dtype=float).reshape(len(settings), len(tracking_columns))
+
+    trajectories['interval_position'] = np.array(
+        [interval['interval_position'] for interval in intervals],
+        dtype=np.int32
+        )
+    for column in ['start_time', 'end_time']:
+        trajectories[column] = np.array(
+            [interval[column] for interval in intervals], dtype=float
+            )
+    trajectories['frame_offsets'] = np.cumsum(
+        [0] + [len(interval['time']) for interval in intervals]
+        ).astype(np.int64)
+    trajectories['time'] = np.concatenate(
+        [np.zeros(0)] + [interval['time'] for interval in intervals]
+        )
+    for column, width in [
+        ('frequencies', number_of_formants),
+        ('bandwidths', number_of_formants),
+        ('tracked_frequencies', number_of_tracks),
+        ('tracked_bandwidths', number_of_tracks)]:
+        trajectories[column] = np.concatenate(
+            [np.zeros((0, width))] +
+            [interval[column][:, :width] for interval in intervals]
+            ).astype(np.float32)
+    return trajectories
+
+def write_trajectories(file_path, trajectories):
+    try:
+        np.savez(file_path, tracking_columns=np.array(tracking_columns),
+            **trajectories)
+    except EnvironmentError:
+        sys.exit('Error: could not write trajectory file {0}.'.
+            format(file_path))
+
+# Load all trajectory files in a directory, returning a dictionary of arrays
+# covering every interval, laid out as join_trajectories() gives them. Codes
+# index the combined sound_files and tracking_settings tables. An interval
+# measured again with the same settings (after an interrupted run) is only
+# kept from the most recently written file.
+def read_trajectories(directory):
+    check_numpy()
+    file_paths = sorted(glob.glob(os.path.join(directory, '*.npz')),
+        key=os.path.getmtime)
+    if len(file_paths) == 0:
+        trajectories = join_trajectories([])
+        trajectories['sound_files'] = []
+        trajectories['tracking_columns'] = list(tracking_columns)
+        return trajectories
+
+    parts = dict((column, []) for column in
+        ['sound_file_codes', 'tracking_setting_codes', 'frame_counts'] +
+        interval_columns + frame_columns)
+    sound_files = {}
+    settings = {}
+    for file_path in file_paths:
+        with np.load(file_path) as stored:
+            # Map this file's codes onto the combined tables.
+            mapping = np.array([
+                sound_files.setdefault(str(name), len(sound_files))
+                for name in stored['sound_files']
+                ], dtype=np.int32)
+            parts['sound_file_codes'].append(
+                mapping[stored['sound_file_codes']])
+            mapping = np.array([
+                settings.setdefault(tuple(row), len(settings))
+                for row in stored['tracking_settings'].tolist()
+                ], dtype=np.int32)
+            parts['tracking_setting_codes'].append(
+                mapping[stored['tracking_setting_codes']])
+            parts['frame_counts'].append(np.diff(stored['frame_offsets']))
+            for column in interval_columns + frame_columns:
+                parts[column].append(stored[column])
+
+    trajectories = dict(
+        (column, np.concatenate(arrays)) for column, arrays in parts.items()
+        )
+    frame_counts = trajectories.pop('frame_counts').astype(np.int64)
+
+    # Keep the last copy of each interval, and its frames.
+    keys = np.stack([
+        trajectories['sound_file_codes'],
+        trajectories['interval_position'],
+        trajectories['tracking_setting_codes']
+        ], axis=1).astype(np.int64)
+    last_first = np.unique(keys[::-1], axis=0, return_index=True)[1]
+    keep = np.sort(len(keys) - 1 - last_first)
+    old_offsets = np.concatenate([[0], np.cumsum(frame_counts)])
+    offsets = np.concatenate([[0], np.cumsum(frame_counts[keep])])
+    frames = np.repeat(old_offsets[keep] - offsets[:-1],
+        frame_counts[keep]) + np.arange(offsets[-1])
+    for column in ['sound_file_codes', 'tracking_setting_codes'] + \
+        interval_columns:
+        trajectories[column] = trajectories[column][keep]
+    for column in frame_columns:
+        trajectories[column] = trajectories[column][frames]
+    trajectories['frame_offsets'] = offsets.astype(np.int64)
+
+    trajectories['sound_files'] = list(sound_files)
+    trajectories['tracking_settings'] = np.array(list(settings),
+        dtype=float).reshape(len(settings), len(tracking_columns))
+    trajectories['tracking_columns'] = list(tracking_columns)
+    return trajectories
+
+# Values of column (e.g. tracked_frequencies or bandwidths) at
+# number_of_points evenly spaced points from the start to the end of every
+# interval (at least 2), worked out for all intervals at once. Like Praat's
+# "Get value at time... Hertz Linear", each value is interpolated between the
+# two nearest frames, falling back on the nearer one where the further is
+# undefined, and is undefined outside the frames. Returns an array of
+# intervals x points x formants.
+def resample_trajectories(trajectories, number_of_points,
+    column='tracked_frequencies'):
+    check_numpy()
+    values = trajectories[column]
+    offsets = trajectories['frame_offsets']
+    firsts = offsets[:-1]
+    counts = np.diff(offsets)
+    start_times = trajectories['start_time']
+    end_times = trajectories['end_time']
+
+    points = start_times[:, None] + (end_times - start_times)[:, None] * \
+        np.arange(number_of_points) / (number_of_points - 1)
+    first_times = np.zeros(len(counts))
+    first_times[counts > 0] = trajectories['time'][firsts[counts > 0]]
+    position = (points - first_times[:, None]) / time_step
+    left = np.floor(position).astype(np.int64)
+    phase = position - left
+    near = np.where(phase < 0.5, left, left + 1)
+    far = np.where(phase < 0.5, left + 1, left)
+
+    # Values from frame numbers within each interval's frames.
+    def frame_values(frame_numbers):
+        inside = (frame_numbers >= 0) & (frame_numbers < counts[:, None])
+        found = np.full(frame_numbers.shape + values.shape[1:], np.nan)
+        found[inside] = values[(firsts[:, None] + frame_numbers)[inside]]
+        return found
+
+    near_values = frame_values(near)
+    far_values = frame_values(far)
+    far_values = np.where(np.isnan(far_values), near_values, far_values)
+    weight = np.abs(position - near)[:, :, None]
+    return near_values + weight * (far_values - near_values)